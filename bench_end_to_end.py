@@ -0,0 +1,226 @@
+# bench_end_to_end.py
+"""
+End-to-end latency benchmark of analyze_html -> integrate_modules_with_user_edits,
+driving main.Api headlessly against the local LLM stand-in (llm_standin):
+
+    python bench_end_to_end.py --concurrency 1 4 16 64 --latency lognormal:800:0.4 --per-token-ms 2
+    python bench_end_to_end.py --quick --output bench_end_to_end.json
+
+Scenarios cross cache state with instruction use:
+- cold: every session analyses a page not seen before.
+- warm: the same pages were analysed once beforehand, so the definition
+  cache, module library and modification memo are populated.
+- no_instruction / instruction: analyze_html without or with a
+  modification instruction.
+Each scenario runs at every concurrency level, one Api per session. The
+report gives p50/p95/p99 of analyze, integrate and total latency,
+throughput in sessions/s, and a per-stage breakdown taken from the
+tracer's spans. It is printed as a table and written as JSON.
+"""
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_standin import run_llm_standin
+from page_generator import generate_paper_page
+
+INSTRUCTION = "把动画2改成旋转立方体，并加快播放速度"
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(p / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def _summary(values):
+    return {"p50": round(percentile(values, 50), 2), "p95": round(percentile(values, 95), 2),
+            "p99": round(percentile(values, 99), 2), "mean": round(statistics.fmean(values), 2)}
+
+
+def _write_config(work_dir, overrides):
+    config = {
+        "trace_enabled": True,
+        "trace_file": os.path.join(work_dir, "traces.jsonl"),
+        "session_dir": os.path.join(work_dir, "sessions"),
+        "module_library_dir": os.path.join(work_dir, "module_library"),
+        "definition_cache_dir": os.path.join(work_dir, "definition_cache"),
+        **overrides,
+    }
+    with open(os.path.join(work_dir, "api_config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return config
+
+
+def _make_apis(count):
+    """Apis built up front (construction is not timed) sharing the process-wide tracer."""
+    import main
+    import tracing
+    apis = [main.Api() for _ in range(count)]
+    for api in apis:
+        api.tracer = tracing.get_tracer() # Each Api() reconfigures the global tracer; keep spans in one tree
+    return apis
+
+
+def _run_session(api, page, instruction):
+    start = time.perf_counter()
+    result = api.analyze_html(page, instruction)
+    analyzed = time.perf_counter()
+    modules = result.get("active_module_definitions", [])
+    edits = {modules[0]["id"]: {"html": "<p>用户编辑后的模块</p>"}} if modules else {}
+    api.integrate_modules_with_user_edits(json.dumps(edits, ensure_ascii=False))
+    done = time.perf_counter()
+    return {"status": result.get("status"), "definitions_source": result.get("definitions_source"),
+            "analyze_ms": (analyzed - start) * 1000, "integrate_ms": (done - analyzed) * 1000, "total_ms": (done - start) * 1000}
+
+
+def _wait_for_refinements(apis, timeout=60.0):
+    """Background definition refinements still write to the work dir; let them finish (untimed)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and any(api.definition_refinement.get("status") == "pending" for api in apis):
+        time.sleep(0.05)
+
+
+def _stage_breakdown(trace_file, since_ns):
+    """Per span name: duration summary over the analyze_html traces started after since_ns."""
+    spans = []
+    try:
+        with open(trace_file, "r", encoding="utf-8") as f:
+            for line in f:
+                span = json.loads(line)
+                if span["start_ns"] >= since_ns:
+                    spans.append(span)
+    except FileNotFoundError:
+        return {}
+    roots = {s["span_id"] for s in spans if s["name"] == "analyze_html" and s["parent_id"] is None}
+    root_traces = {s["trace_id"] for s in spans if s["span_id"] in roots}
+    by_name = {}
+    for span in spans:
+        top_level_stage = span["parent_id"] in roots
+        if span["trace_id"] in root_traces and (top_level_stage or span["name"] == "llm.call"):
+            by_name.setdefault(span["name"], []).append(span["duration_ms"])
+        elif span["name"] == "integrate_modules_with_user_edits":
+            by_name.setdefault(span["name"], []).append(span["duration_ms"])
+    return {name: {**_summary(values), "count": len(values)} for name, values in sorted(by_name.items())}
+
+
+def run_scenario(work_dir, cache, instruction, concurrency, sessions, page_bytes, page_modules, seed_base):
+    seeds = [seed_base + i for i in range(sessions)]
+    pages = [generate_paper_page(page_bytes, page_modules, seed=seed)[0] for seed in seeds]
+    if cache == "warm":
+        for api, page in zip(_make_apis(len(pages)), pages): # Prime caches with the same pages
+            _run_session(api, page, instruction)
+            _wait_for_refinements([api])
+    apis = _make_apis(sessions)
+    with open(os.path.join(work_dir, "api_config.json"), "r", encoding="utf-8") as f:
+        trace_file = json.load(f)["trace_file"]
+
+    since_ns = time.time_ns()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda args: _run_session(*args), [(api, page, instruction) for api, page in zip(apis, pages)]))
+    wall = time.perf_counter() - start
+    _wait_for_refinements(apis)
+
+    sources = {}
+    for result in results:
+        sources[result["definitions_source"]] = sources.get(result["definitions_source"], 0) + 1
+    return {
+        "cache": cache,
+        "instruction": bool(instruction),
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "errors": sum(1 for r in results if r["status"] != "success"),
+        "definitions_sources": sources,
+        "throughput_sessions_per_s": round(sessions / wall, 2),
+        "analyze_ms": _summary([r["analyze_ms"] for r in results]),
+        "integrate_ms": _summary([r["integrate_ms"] for r in results]),
+        "total_ms": _summary([r["total_ms"] for r in results]),
+        "stages_ms": _stage_breakdown(trace_file, since_ns),
+    }
+
+
+def print_table(rows):
+    header = f"{'cache':<5} {'instr':<5} {'conc':>4} {'sess':>4} {'p50':>9} {'p95':>9} {'p99':>9} {'sess/s':>7}  slowest stages (p50 ms)"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        stages = sorted(row["stages_ms"].items(), key=lambda item: item[1]["p50"], reverse=True)[:3]
+        print(f"{row['cache']:<5} {('yes' if row['instruction'] else 'no'):<5} {row['concurrency']:>4} {row['sessions']:>4} "
+              f"{row['total_ms']['p50']:>9.1f} {row['total_ms']['p95']:>9.1f} {row['total_ms']['p99']:>9.1f} "
+              f"{row['throughput_sessions_per_s']:>7.2f}  " + ", ".join(f"{name} {s['p50']:.1f}" for name, s in stages))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="End-to-end analyze -> integrate benchmark against the local LLM stand-in.")
+    parser.add_argument("--quick", action="store_true", help="Concurrency 1 and 4, 4 sessions each, small pages.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--min-sessions", type=int, default=16, help="Sessions per run (at least the concurrency level).")
+    parser.add_argument("--page-bytes", type=int, default=200_000)
+    parser.add_argument("--page-modules", type=int, default=30)
+    parser.add_argument("--latency", default="lognormal:300:0.4", help="Stand-in latency distribution (see llm_standin).")
+    parser.add_argument("--per-token-ms", type=float, default=1.0)
+    parser.add_argument("--error-429", type=float, default=0.0)
+    parser.add_argument("--error-5xx", type=float, default=0.0)
+    parser.add_argument("--config", nargs="*", default=[], metavar="KEY=JSON",
+                        help='api_config overrides, e.g. heuristic_segmenter_enabled=false')
+    parser.add_argument("--output", default="bench_end_to_end.json")
+    parser.add_argument("--keep-work-dir", action="store_true")
+    args = parser.parse_args()
+    if args.quick:
+        args.concurrency, args.min_sessions, args.page_bytes, args.page_modules = [1, 4], 4, 50_000, 10
+
+    overrides = {}
+    for item in args.config:
+        key, _, value = item.partition("=")
+        overrides[key] = json.loads(value)
+
+    server = run_llm_standin(port=0, latency=args.latency, per_token_ms=args.per_token_ms,
+                             error_429_rate=args.error_429, error_5xx_rate=args.error_5xx, seed=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.setdefault("OPENROUTER_API_KEY", "standin")
+    overrides.setdefault("api_url", f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions")
+
+    output_path = os.path.abspath(args.output)
+    original_cwd = os.getcwd()
+    rows = []
+    seed_base = 0
+    import main # noqa: F401  (main configures DEBUG logging on import; quieten it for the run)
+    logging.getLogger().setLevel(logging.WARNING)
+    for cache in ("cold", "warm"):
+        for instruction in ("", INSTRUCTION):
+            for concurrency in args.concurrency:
+                work_dir = tempfile.mkdtemp(prefix="bench_e2e_")
+                os.chdir(work_dir) # Api reads api_config.json from the working directory
+                _write_config(work_dir, overrides)
+                sessions = max(concurrency, args.min_sessions)
+                rows.append(run_scenario(work_dir, cache, instruction, concurrency, sessions,
+                                         args.page_bytes, args.page_modules, seed_base))
+                seed_base += 2 * sessions # Cold runs never see a page twice
+                os.chdir(original_cwd)
+                if not args.keep_work_dir:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                print(f"done: {rows[-1]['cache']} instruction={rows[-1]['instruction']} concurrency={concurrency}", file=sys.stderr, flush=True)
+
+    server.shutdown()
+    print_table(rows)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "standin": {"latency": args.latency, "per_token_ms": args.per_token_ms,
+                        "error_429": args.error_429, "error_5xx": args.error_5xx, "requests": server.stats.snapshot()},
+            "page": {"bytes": args.page_bytes, "modules": args.page_modules},
+            "config_overrides": {k: v for k, v in overrides.items() if k != "api_url"},
+            "results": rows,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {output_path}")
@@ -0,0 +1,163 @@
+# bench_html_utils.py
+"""
+Timing suite for the html_utils pipeline functions over synthetic pages
+(page_generator) from 10 KB to 50 MB and 1 to 5000 modules:
+
+    python bench_html_utils.py --quick --output bench_html_utils.json
+    python bench_html_utils.py --baseline bench_html_utils.json --max-slowdown 1.25
+
+Each case times add_markers_to_html, extract_module_content_by_markers (once
+per module, as Api does), generate_skeleton_with_placeholders and
+integrate_final_code (10% user edits, 10% LLM edits). Results go to JSON; with
+--baseline, a case slower than baseline * max_slowdown (and by more than the
+noise floor) is reported as a regression and the exit status is 1.
+"""
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+
+from html_utils import (
+    add_markers_to_html,
+    extract_module_content_by_markers,
+    generate_skeleton_with_placeholders,
+    integrate_final_code
+)
+from page_generator import generate_paper_page
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000, 50_000_000]
+DEFAULT_MODULE_COUNTS = [1, 10, 100, 1000, 5000]
+QUICK_SIZES = [10_000, 100_000, 1_000_000]
+QUICK_MODULE_COUNTS = [1, 10, 100, 1000]
+STAGES = ("add_markers", "extract_modules", "generate_skeleton", "integrate")
+MIN_BYTES_PER_MODULE = 400 # Below this the generator cannot honour the target size; such cases are skipped
+
+
+def _time_ms(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def run_case(target_bytes, module_count, repeat=3, seed=0):
+    """Times every stage `repeat` times on one synthetic page. Returns the case record."""
+    html, definitions = generate_paper_page(target_bytes, module_count, seed=seed)
+    timings = {stage: [] for stage in STAGES}
+    for _ in range(repeat):
+        elapsed, marked = _time_ms(add_markers_to_html, html, definitions)
+        timings["add_markers"].append(elapsed)
+
+        start = time.perf_counter()
+        modules = [{**d, "original_content": extract_module_content_by_markers(marked, d)} for d in definitions]
+        timings["extract_modules"].append((time.perf_counter() - start) * 1000)
+
+        elapsed, skeleton = _time_ms(generate_skeleton_with_placeholders, marked, modules)
+        timings["generate_skeleton"].append(elapsed)
+
+        user_edits = {m["id"]: {"html": m["original_content"].replace("<p>", "<p class=\"edited\">", 1)} for m in modules[::10]}
+        llm_store = {m["id"]: {"modified_code": {"html": m["original_content"], "css": f"#{m['id']} {{ outline: 1px solid red; }}", "js": ""}}
+                     for m in modules[5::10]}
+        elapsed, final_html = _time_ms(integrate_final_code, skeleton, modules, user_edits, llm_store, html)
+        timings["integrate"].append(elapsed)
+
+    assert all(m["original_content"] is not None for m in modules), "extraction failed"
+    assert "MODULE_PLACEHOLDER" not in final_html, "integration left placeholders"
+    return {
+        "target_bytes": target_bytes,
+        "bytes": len(html.encode("utf-8")),
+        "modules": len(definitions),
+        "timings_ms": {
+            stage: {"min": round(min(values), 3), "median": round(statistics.median(values), 3)}
+            for stage, values in timings.items()
+        },
+    }
+
+
+def _case_key(case):
+    return f"{case['target_bytes']}B/{case['modules']}m"
+
+
+def find_regressions(cases, baseline, max_slowdown=1.25, noise_floor_ms=2.0):
+    """Stages whose min time exceeds baseline * max_slowdown by more than noise_floor_ms."""
+    baseline_cases = {_case_key(case): case for case in baseline.get("cases", [])}
+    regressions = []
+    for case in cases:
+        reference = baseline_cases.get(_case_key(case))
+        if not reference:
+            continue
+        for stage, timing in case["timings_ms"].items():
+            before = reference["timings_ms"].get(stage, {}).get("min")
+            if before is None:
+                continue
+            limit = before * max_slowdown
+            if timing["min"] > limit and timing["min"] - before > noise_floor_ms:
+                regressions.append({"case": _case_key(case), "stage": stage, "baseline_ms": before,
+                                    "current_ms": timing["min"], "ratio": round(timing["min"] / max(before, 1e-9), 2)})
+    return regressions
+
+
+def run_suite(sizes, module_counts, repeat=3, max_case_seconds=None):
+    cases = []
+    skip_larger_counts = {}
+    for target_bytes in sizes:
+        for module_count in module_counts:
+            if module_count * MIN_BYTES_PER_MODULE > target_bytes:
+                continue
+            if skip_larger_counts.get(target_bytes, float("inf")) < module_count:
+                logging.warning(f"Skipping {target_bytes:,} B / {module_count} modules: a smaller case exceeded the time budget.")
+                continue
+            start = time.perf_counter()
+            case = run_case(target_bytes, module_count, repeat)
+            case["wall_seconds"] = round(time.perf_counter() - start, 3)
+            cases.append(case)
+            print(f"{case['bytes']:>12,} B {case['modules']:>5} modules  " +
+                  "  ".join(f"{stage} {case['timings_ms'][stage]['min']:>10.2f} ms" for stage in STAGES), flush=True)
+            if max_case_seconds and case["wall_seconds"] > max_case_seconds:
+                skip_larger_counts[target_bytes] = module_count
+    return cases
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the html_utils pipeline on synthetic pages.")
+    parser.add_argument("--quick", action="store_true", help=f"Sizes {QUICK_SIZES}, modules {QUICK_MODULE_COUNTS}.")
+    parser.add_argument("--sizes", type=int, nargs="+", help="Target page sizes in bytes.")
+    parser.add_argument("--modules", type=int, nargs="+", help="Module counts.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-case-seconds", type=float, default=None,
+                        help="Skip larger module counts for a size once a case takes longer than this.")
+    parser.add_argument("--output", default="bench_html_utils.json")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against.")
+    parser.add_argument("--max-slowdown", type=float, default=1.25)
+    parser.add_argument("--noise-floor-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING) # html_utils logs per module at DEBUG; keep it out of the timings
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    module_counts = args.modules or (QUICK_MODULE_COUNTS if args.quick else DEFAULT_MODULE_COUNTS)
+    cases = run_suite(sizes, module_counts, args.repeat, args.max_case_seconds)
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "cases": cases,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(cases, baseline, args.max_slowdown, args.noise_floor_ms)
+        results["thresholds"] = {"baseline": args.baseline, "max_slowdown": args.max_slowdown, "noise_floor_ms": args.noise_floor_ms}
+        results["regressions"] = regressions
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
+    for regression in regressions:
+        print(f"REGRESSION {regression['case']} {regression['stage']}: {regression['baseline_ms']} ms -> "
+              f"{regression['current_ms']} ms (x{regression['ratio']})")
+    sys.exit(1 if regressions else 0)
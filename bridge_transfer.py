@@ -0,0 +1,107 @@
+# bridge_transfer.py
+import base64
+import hashlib
+import logging
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+
+
+class TransferStore:
+    """
+    Holds large strings that should not cross the pywebview bridge in a single
+    evaluate_js round trip. The frontend receives a small descriptor and pulls
+    the payload back in sequenced chunks via get_chunk().
+
+    Compressed transfers are zlib streams, base64-encoded so each chunk stays
+    valid JSON; the browser inflates them with DecompressionStream('deflate').
+    """
+
+    def __init__(self, chunk_size=256 * 1024, inline_limit=512 * 1024, compress=True, max_transfers=32):
+        # Base64 slices decode independently only on 4-character boundaries
+        self.chunk_size = max(4, chunk_size - chunk_size % 4)
+        self.inline_limit = inline_limit
+        self.compress = compress
+        self.max_transfers = max_transfers
+        self._transfers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def wrap(self, text):
+        """
+        Returns text unchanged if it is small enough to send inline; otherwise
+        registers it for chunked transfer and returns the descriptor dict.
+        """
+        if text is None or len(text) <= self.inline_limit:
+            return text
+        return self.offer(text)
+
+    def offer(self, text, compress=None):
+        """Registers text for chunked transfer and returns its descriptor."""
+        compress = self.compress if compress is None else compress
+        raw_bytes = text.encode("utf-8")
+        if compress:
+            payload = base64.b64encode(zlib.compress(raw_bytes, 6)).decode("ascii")
+            encoding = "zlib+base64"
+        else:
+            payload = text
+            encoding = "plain"
+
+        chunks = [payload[i:i + self.chunk_size] for i in range(0, len(payload), self.chunk_size)] or [""]
+        descriptor = {
+            "transfer_id": uuid.uuid4().hex,
+            "encoding": encoding,
+            "total_chunks": len(chunks),
+            "total_bytes": len(raw_bytes),
+            "transfer_length": len(payload),
+            "sha256": hashlib.sha256(raw_bytes).hexdigest(),
+        }
+        with self._lock:
+            self._transfers[descriptor["transfer_id"]] = chunks
+            while len(self._transfers) > self.max_transfers:
+                evicted_id, _ = self._transfers.popitem(last=False)
+                logging.debug(f"Evicted unfinished bridge transfer '{evicted_id}'.")
+        logging.debug(f"Bridge transfer {descriptor['transfer_id']}: {len(raw_bytes)} bytes as {len(chunks)} {encoding} chunks.")
+        return descriptor
+
+    def get_chunk(self, transfer_id, index):
+        with self._lock:
+            chunks = self._transfers.get(transfer_id)
+            if chunks is None:
+                return {"status": "error", "message": f"未知或已过期的传输: {transfer_id}"}
+            if not 0 <= index < len(chunks):
+                return {"status": "error", "message": f"传输 {transfer_id} 的分块索引越界: {index}"}
+            self._transfers.move_to_end(transfer_id)
+            is_final = index == len(chunks) - 1
+            data = chunks[index]
+            if is_final:
+                # Chunks are fetched in order, so the last one releases the transfer
+                del self._transfers[transfer_id]
+        return {"status": "success", "index": index, "data": data, "final": is_final}
+
+    def release(self, transfer_id):
+        with self._lock:
+            return self._transfers.pop(transfer_id, None) is not None
+
+
+def reassemble(descriptor, chunks):
+    """Python-side counterpart of the frontend reassembly; used for verification."""
+    payload = "".join(chunks)
+    if descriptor["encoding"] == "zlib+base64":
+        return zlib.decompress(base64.b64decode(payload)).decode("utf-8")
+    return payload
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    store = TransferStore(chunk_size=1000, inline_limit=100)
+    assert store.wrap("short") == "short"
+
+    big_html = "<div class='animation-box'>动画内容</div>\n" * 5000
+    for compress in (True, False):
+        desc = store.offer(big_html, compress=compress)
+        received = [store.get_chunk(desc["transfer_id"], i)["data"] for i in range(desc["total_chunks"])]
+        assert reassemble(desc, received) == big_html
+        assert store.get_chunk(desc["transfer_id"], 0)["status"] == "error" # Released after final chunk
+        print(f"{desc['encoding']}: {desc['total_bytes']} bytes -> {desc['transfer_length']} chars in {desc['total_chunks']} chunks")
+    print("\nBridge Transfer Tests Completed.")
@@ -9,7 +9,48 @@ DEFAULT_API_CONFIG = {
     "request_timeout_seconds": 180,
     "llm_temperature": 0.05,
     "llm_max_tokens": 8192,
-    "max_modules_to_process_frontend": 20
+    "trace_enabled": False,
+    "trace_file": "traces.jsonl",
+    "trace_collector_url": "",
+    "session_snapshot_enabled": True,
+    "session_dir": "sessions",
+    "bridge_chunk_size_bytes": 262144,
+    "bridge_inline_limit_bytes": 524288,
+    "bridge_compress": True,
+    "module_library_enabled": True,
+    "module_library_dir": "module_library",
+    "module_library_min_coverage": 0.9,
+    "module_library_similarity_threshold": 0.8,
+    "module_library_similarity_max_page_chars": 300000,
+    "module_library_packs": [],
+    "modification_memo_enabled": True,
+    "modification_memo_instruction_threshold": 0.85,
+    "local_targeting_enabled": True,
+    "local_targeting_min_confidence": 0.6,
+    "scoped_modification_prompt": True,
+    "page_cluster_threshold": 0.8,
+    "heuristic_segmenter_enabled": True,
+    "heuristic_segmenter_min_coverage": 0.6,
+    "heuristic_segment_rules": None,
+    "heuristic_refine_async": True,
+    "definition_cache_enabled": True,
+    "definition_cache_dir": "definition_cache",
+    "llm_cassette_mode": "",
+    "llm_cassette_path": "llm_cassette.jsonl",
+    "llm_cassette_replay_latency": "zero",
+    "llm_cassette_on_miss": "error",
+    "memory_profile_enabled": False,
+    "memory_profile_snapshot_depth": 1,
+    "memory_profile_top_sites": 10,
+    "memory_profile_file": "",
+    "prompt_compaction_enabled": True,
+    "prompt_compaction_min_chars": 256,
+    "llm_max_tokens_auto": True,
+    "llm_chunk_max_prompt_tokens": 0,
+    "llm_chunk_concurrency": 4,
+    "model_profiles": {},
+    "llm_json_continuation_rounds": 2,
+    "llm_continuation_max_rounds": 3
 }
 
 def load_api_config(config_path="api_config.json"):
@@ -0,0 +1,132 @@
+# definition_cache.py
+import gzip
+import json
+import logging
+import os
+import time
+
+from html_canonical import canonical_hash, canonicalise_html, to_canonical_span, to_original_span
+
+CACHE_FORMAT_VERSION = 1
+
+
+class DefinitionCache:
+    """
+    get_module_definitions() results keyed by the canonical form of the page
+    (html_canonical), so re-saving a page with different indentation,
+    attribute order or comments still hits. Spans are stored in canonical
+    coordinates and mapped onto the raw text of whichever page looks them up.
+    Entries are gzip JSON files under cache_dir/<2-char prefix>/<hash>.json.gz,
+    written atomically.
+    """
+
+    def __init__(self, cache_dir="definition_cache"):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.gz")
+
+    def lookup(self, raw_html):
+        """Cached definitions remapped onto raw_html, or None."""
+        canonical, offsets = canonicalise_html(raw_html)
+        key = canonical_hash(canonical)
+        try:
+            with open(self._path(key), "rb") as f:
+                entry = json.loads(gzip.decompress(f.read()).decode("utf-8"))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, EOFError, ValueError) as e:
+            logging.warning(f"Definition cache entry {key} unreadable: {e}")
+            self.misses += 1
+            return None
+        if entry.get("format_version") != CACHE_FORMAT_VERSION:
+            self.misses += 1
+            return None
+        definitions = []
+        for definition in entry["definitions"]:
+            start, end = to_original_span(offsets, definition["start_char"], definition["end_char"])
+            definitions.append({**definition, "start_char": start, "end_char": end})
+        self.hits += 1
+        logging.info(f"Definition cache hit {key[:12]} ({len(definitions)} definitions, saved {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['saved_at']))}).")
+        return definitions
+
+    def store(self, raw_html, definitions, model=""):
+        """Stores definitions made for raw_html. Definitions without usable offsets are dropped."""
+        canonical, offsets = canonicalise_html(raw_html)
+        key = canonical_hash(canonical)
+        canonical_definitions = []
+        for definition in definitions:
+            try:
+                start, end = int(definition["start_char"]), int(definition["end_char"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            start, end = to_canonical_span(offsets, max(0, start), min(len(raw_html), end))
+            if end > start:
+                canonical_definitions.append({**definition, "start_char": start, "end_char": end})
+        if not canonical_definitions:
+            return None
+        entry = {
+            "format_version": CACHE_FORMAT_VERSION,
+            "saved_at": time.time(),
+            "model": model,
+            "definitions": canonical_definitions,
+        }
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8")))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Failed to write definition cache entry {key}: {e}")
+            return None
+        return key
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
+
+
+if __name__ == '__main__':
+    import tempfile
+    logging.basicConfig(level=logging.DEBUG)
+
+    original = """<html><body>
+  <header id="hdr" class="top"><h1>标题</h1></header>
+  <!-- 动画 -->
+  <div id="anim-container-1" class="animation-container"><h3>动画 1</h3></div>
+  <footer><p>版权所有</p></footer>
+</body></html>"""
+    reexported = ('<html>\n<body>\n<header class="top" id="hdr">\n    <h1>标题</h1>\n</header>\n'
+                  '<div class="animation-container" id="anim-container-1">\n    <h3>动画 1</h3>\n</div>\n'
+                  '<footer>\n    <p>版权所有</p>\n</footer>\n</body>\n</html>\n')
+
+    def span_of(html, open_tag, close_tag):
+        start = html.index(open_tag)
+        return start, html.index(close_tag, start) + len(close_tag)
+
+    definitions = []
+    for module_id, open_tag, close_tag in (("page_header", "<header", "</header>"),
+                                           ("animation_1", '<div id="anim-container-1"', "</div>"),
+                                           ("page_footer", "<footer", "</footer>")):
+        start, end = span_of(original, open_tag, close_tag)
+        definitions.append({"id": module_id, "description": module_id, "start_char": start, "end_char": end,
+                            "start_comment": f"LLM_MODULE_START: {module_id}", "end_comment": f"LLM_MODULE_END: {module_id}"})
+
+    cache = DefinitionCache(tempfile.mkdtemp())
+    assert cache.lookup(original) is None
+    cache.store(original, definitions, model="test-model")
+    remapped = cache.lookup(reexported)
+    for definition in remapped:
+        print(definition["id"], repr(reexported[definition["start_char"]:definition["end_char"]]))
+    assert [d["id"] for d in remapped] == ["page_header", "animation_1", "page_footer"]
+    assert reexported[remapped[1]["start_char"]:remapped[1]["end_char"]] == \
+        '<div class="animation-container" id="anim-container-1">\n    <h3>动画 1</h3>\n</div>'
+    assert reexported[remapped[2]["start_char"]:remapped[2]["end_char"]] == "<footer>\n    <p>版权所有</p>\n</footer>"
+    assert cache.lookup(original.replace("标题", "新标题")) is None
+    print(cache.stats())
+    print("\nDefinition Cache Tests Completed.")
@@ -0,0 +1,263 @@
+# dependency_graph.py
+import logging
+import re
+from collections import deque
+
+PAGE_NODE = "__page__" # Markup outside every module (the skeleton), e.g. global <style>/<script> in <head>
+
+_STYLE_RE = re.compile(r"<style\b[^>]*>(.*?)</style\s*>", re.IGNORECASE | re.DOTALL)
+_SCRIPT_RE = re.compile(r"<script\b[^>]*>(.*?)</script\s*>", re.IGNORECASE | re.DOTALL)
+_PAGE_BLOCK_RE = re.compile(r"<(style|script)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_SELECTOR_RE = re.compile(r"([^{}]+)\{")
+_SELECTOR_ID_RE = re.compile(r"#([A-Za-z_][\w-]*)")
+_SELECTOR_CLASS_RE = re.compile(r"\.([A-Za-z_][\w-]*)")
+_HTML_ID_RE = re.compile(r"""\sid\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+_HTML_CLASS_RE = re.compile(r"""\sclass\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+_HTML_HREF_ID_RE = re.compile(r"""\shref\s*=\s*["']#([A-Za-z_][\w-]*)["']""", re.IGNORECASE)
+_HTML_HANDLER_RE = re.compile(r"""\son\w+\s*=\s*"([^"]*)"|\son\w+\s*=\s*'([^']*)'""", re.IGNORECASE)
+_JS_FUNCTION_DEF_RES = (
+    re.compile(r"\bfunction\s+([A-Za-z_$][\w$]*)\s*\("),
+    re.compile(r"\b(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)"),
+    re.compile(r"(?:^|[;\n])\s*(?:window\.)?([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?function\b"),
+)
+_JS_CALL_RE = re.compile(r"(?<![\w$.])([A-Za-z_$][\w$]*)\s*\(")
+_JS_ID_RES = (
+    re.compile(r"""getElementById\(\s*["']([^"']+)["']"""),
+)
+_JS_SELECTOR_RE = re.compile(r"""(?:querySelector(?:All)?|\$|jQuery|closest|matches)\(\s*["']([^"']+)["']""")
+_JS_CLASS_RES = (
+    re.compile(r"""getElementsByClassName\(\s*["']([^"']+)["']"""),
+    re.compile(r"""classList\.(?:add|remove|toggle|contains|replace)\(\s*["']([^"']+)["']"""),
+)
+_JS_KEYWORDS = {
+    "if", "for", "while", "switch", "catch", "function", "return", "typeof", "new", "await",
+    "async", "with", "do", "else", "try", "delete", "void", "in", "of", "super", "this",
+}
+
+
+def _split_module(content):
+    """Splits module content into (html without style/script bodies, css text, js text)."""
+    css = "\n".join(_STYLE_RE.findall(content))
+    js_blocks = _SCRIPT_RE.findall(content)
+    html = _SCRIPT_RE.sub("<script></script>", _STYLE_RE.sub("<style></style>", content))
+    js_blocks.extend(a or b for a, b in _HTML_HANDLER_RE.findall(html))
+    return html, css, "\n".join(js_blocks)
+
+
+def extract_symbols(content):
+    """
+    Returns (defines, uses), each a set of (kind, name) pairs:
+    ids are defined by id= attributes and used by CSS #selectors, href="#..." and
+    getElementById/querySelector; classes are defined by CSS rules and used by
+    class= attributes and classList/querySelector; functions are defined by JS
+    declarations and used by calls in scripts and on* handlers.
+    """
+    html, css, js = _split_module(content)
+    defines, uses = set(), set()
+
+    defines.update(("id", i.strip()) for i in _HTML_ID_RE.findall(html))
+    for class_list in _HTML_CLASS_RE.findall(html):
+        uses.update(("class", c) for c in class_list.split())
+    uses.update(("id", i) for i in _HTML_HREF_ID_RE.findall(html))
+
+    for selector in _CSS_SELECTOR_RE.findall(_CSS_COMMENT_RE.sub("", css)):
+        selector = selector.strip()
+        if not selector or selector.startswith("@"):
+            continue
+        uses.update(("id", i) for i in _SELECTOR_ID_RE.findall(selector))
+        defines.update(("class", c) for c in _SELECTOR_CLASS_RE.findall(selector))
+
+    for pattern in _JS_FUNCTION_DEF_RES:
+        defines.update(("function", name) for name in pattern.findall(js))
+    uses.update(("function", name) for name in _JS_CALL_RE.findall(js) if name not in _JS_KEYWORDS)
+    for pattern in _JS_ID_RES:
+        uses.update(("id", i) for i in pattern.findall(js))
+    for selector in _JS_SELECTOR_RE.findall(js):
+        uses.update(("id", i) for i in _SELECTOR_ID_RE.findall(selector))
+        uses.update(("class", c) for c in _SELECTOR_CLASS_RE.findall(selector))
+    for pattern in _JS_CLASS_RES:
+        for class_list in pattern.findall(js):
+            uses.update(("class", c) for c in class_list.split())
+    return defines, uses - defines
+
+
+def format_symbol(symbol):
+    kind, name = symbol
+    return {"id": f"#{name}", "class": f".{name}", "function": f"{name}()"}[kind]
+
+
+class DependencyGraph:
+    """
+    Module-level dependency graph. Module A depends on module B when A uses
+    a symbol (element id, CSS class, JS function) that B defines. Edges are
+    kept in both directions as {module: {other_module: set(symbols)}}, so
+    dependencies/dependents of a module are single dict lookups.
+    """
+
+    def __init__(self):
+        self.defines = {}     # module_id -> set(symbols)
+        self.uses = {}        # module_id -> set(symbols)
+        self.definers = {}    # symbol -> set(module_ids)
+        self._depends_on = {} # module_id -> {definer_module_id: set(symbols)}
+        self._used_by = {}    # module_id -> {user_module_id: set(symbols)}
+        self.page_html = ""   # Markup outside every module, kept for page_blocks()
+
+    @classmethod
+    def build(cls, module_definitions, page_html=""):
+        """Builds the graph from [{id, original_content}] plus the markup outside modules (page_html)."""
+        graph = cls()
+        for module in module_definitions:
+            graph._add_node(module["id"], module.get("original_content", ""))
+        if page_html:
+            graph.page_html = page_html
+            graph._add_node(PAGE_NODE, page_html)
+        graph._link()
+        return graph
+
+    def _add_node(self, module_id, content):
+        defines, uses = extract_symbols(content)
+        self.defines[module_id] = defines
+        self.uses[module_id] = uses
+        for symbol in defines:
+            self.definers.setdefault(symbol, set()).add(module_id)
+
+    def _link(self):
+        self._depends_on = {module_id: {} for module_id in self.defines}
+        self._used_by = {module_id: {} for module_id in self.defines}
+        for user, symbols in self.uses.items():
+            for symbol in symbols:
+                for definer in self.definers.get(symbol, ()):
+                    if definer == user:
+                        continue
+                    self._depends_on[user].setdefault(definer, set()).add(symbol)
+                    self._used_by[definer].setdefault(user, set()).add(symbol)
+
+    def dependencies(self, module_id):
+        """{module: symbols} this module uses from other modules."""
+        return self._depends_on.get(module_id, {})
+
+    def dependents(self, module_id):
+        """{module: symbols} of modules that use what this module defines."""
+        return self._used_by.get(module_id, {})
+
+    def impact(self, module_id, transitive=False):
+        """
+        Modules affected if module_id changes: those using its definitions, or,
+        with transitive=True, everything reachable through further dependents.
+        """
+        if not transitive:
+            return set(self._used_by.get(module_id, {})) - {PAGE_NODE}
+        affected, queue = set(), deque([module_id])
+        while queue:
+            for dependent in self._used_by.get(queue.popleft(), {}):
+                if dependent not in affected and dependent != module_id:
+                    affected.add(dependent)
+                    queue.append(dependent)
+        affected.discard(PAGE_NODE)
+        return affected
+
+    def closure(self, module_ids, depth=1):
+        """
+        module_ids plus the modules within depth edges in either direction:
+        the context a modification of module_ids has to see.
+        """
+        selected, frontier = set(module_ids), set(module_ids)
+        for _ in range(depth):
+            neighbours = set()
+            for module_id in frontier:
+                neighbours.update(self._depends_on.get(module_id, {}))
+                neighbours.update(self._used_by.get(module_id, {}))
+            frontier = neighbours - selected
+            selected |= frontier
+        selected.discard(PAGE_NODE)
+        return selected
+
+    def page_blocks(self, module_ids):
+        """
+        The page-level <style>/<script> blocks (outside every module) that define or
+        use a symbol shared with module_ids, in page order. closure() leaves the page
+        out, so a scoped prompt adds these to see e.g. `#anim1-box .ball` in <head>.
+        """
+        symbols = set()
+        for module_id in module_ids:
+            symbols |= self._depends_on.get(module_id, {}).get(PAGE_NODE, set())
+            symbols |= self._used_by.get(module_id, {}).get(PAGE_NODE, set())
+        if not symbols:
+            return []
+        blocks = []
+        for match in _PAGE_BLOCK_RE.finditer(self.page_html):
+            defines, uses = extract_symbols(match.group(0))
+            if (defines | uses) & symbols:
+                blocks.append(match.group(0))
+        return blocks
+
+    def broken_references(self, module_id, new_content):
+        """
+        References that would break if module_id were replaced by new_content:
+        symbols it defined that other modules still use and nothing else defines,
+        and element ids the new content uses that no module defines.
+        Returns [{symbol, reason, modules}].
+        """
+        new_defines, new_uses = extract_symbols(new_content)
+        problems = []
+        for symbol in sorted(self.defines.get(module_id, set()) - new_defines):
+            if self.definers.get(symbol, set()) - {module_id}:
+                continue
+            users = sorted(user for user, symbols in self._used_by.get(module_id, {}).items() if symbol in symbols)
+            if users:
+                problems.append({"symbol": format_symbol(symbol), "reason": "removed_but_used", "modules": users})
+        for symbol in sorted(new_uses - new_defines):
+            if symbol[0] == "id" and not self.definers.get(symbol):
+                problems.append({"symbol": format_symbol(symbol), "reason": "undefined", "modules": [module_id]})
+        return problems
+
+    def to_dict(self):
+        """JSON-friendly summary: module -> {depends_on: {module: [symbols]}, used_by: {...}}."""
+        def edges(adjacency):
+            return {other: sorted(format_symbol(s) for s in symbols) for other, symbols in adjacency.items()}
+        return {
+            module_id: {"depends_on": edges(self._depends_on[module_id]), "used_by": edges(self._used_by[module_id])}
+            for module_id in self.defines
+        }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    modules = [
+        {"id": "anim1", "original_content": '<div class="animation-container"><div class="animation-box" id="anim1-box"></div>'
+                                            '<button onclick="playAnim1()">播放</button></div>'},
+        {"id": "anim2", "original_content": '<div class="animation-container"><div class="animation-box" id="anim2-box"></div>'
+                                            '<button onclick="playAnim2()">播放</button></div>'},
+        {"id": "styles", "original_content": "<style>.animation-box { width: 100px; color: #fff; }\n#anim1-box { background: red; }\n"
+                                             "@media (max-width: 600px) { .animation-container { padding: 0; } }</style>"},
+        {"id": "scripts", "original_content": "<script>function playAnim1() { const box = document.getElementById('anim1-box'); box.classList.add('spin'); }\n"
+                                              "function playAnim2() { document.querySelector('#anim2-box').style.opacity = 0; setTimeout(() => reset(), 10); }\n"
+                                              "const reset = () => {};</script>"},
+        {"id": "footer", "original_content": "<footer><p>版权所有</p></footer>"},
+    ]
+    graph = DependencyGraph.build(modules)
+    for module_id, edges in graph.to_dict().items():
+        print(module_id, edges)
+    assert set(graph.dependencies("anim1")) == {"styles", "scripts"}
+    assert graph.dependents("anim1") == {"styles": {("id", "anim1-box")}, "scripts": {("id", "anim1-box")}}
+    assert graph.impact("anim2") == {"scripts"}
+    assert graph.impact("anim2", transitive=True) == {"scripts", "anim1", "styles"}
+    assert graph.closure(["anim1"]) == {"anim1", "styles", "scripts"}
+    assert graph.closure(["footer"]) == {"footer"}
+
+    broken = graph.broken_references("anim1", '<div class="animation-box" id="cube-box"></div><button onclick="playAnim1()">播放</button>')
+    print(broken)
+    assert {"symbol": "#anim1-box", "reason": "removed_but_used", "modules": ["scripts", "styles"]} in broken
+    assert graph.broken_references("anim2", modules[1]["original_content"]) == []
+
+    # Global CSS/JS outside every module reaches scoped prompts through page_blocks()
+    page = ("<html><head><style>#anim1-box .ball { animation: move 2s; }</style><style>h1 { margin: 0; }</style></head>"
+            "<body><!-- MODULE_PLACEHOLDER: anim1 --><!-- MODULE_PLACEHOLDER: footer -->"
+            "<script>function playAnim1() { document.getElementById('anim1-box').classList.add('run'); }</script></body></html>")
+    page_graph = DependencyGraph.build(modules[:2] + modules[4:], page_html=page)
+    assert PAGE_NODE not in page_graph.closure(["anim1"])
+    blocks = page_graph.page_blocks(["anim1"])
+    assert len(blocks) == 2 and "#anim1-box .ball" in blocks[0] and "function playAnim1" in blocks[1]
+    assert page_graph.page_blocks(["footer"]) == []
+    print("\nDependency Graph Tests Completed.")
@@ -0,0 +1,201 @@
+# dom_utils.py
+import bisect
+import logging
+from html.parser import HTMLParser
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+
+class _SpanParser(HTMLParser):
+    """Records the exact character span of every element while parsing."""
+
+    def __init__(self, html):
+        super().__init__(convert_charrefs=False)
+        self.html = html
+        self.line_starts = [0]
+        for i, ch in enumerate(html):
+            if ch == "\n":
+                self.line_starts.append(i + 1)
+        self.elements = []
+        self.open_stack = []
+
+    def _offset(self):
+        line, col = self.getpos()
+        return self.line_starts[line - 1] + col
+
+    def _open(self, tag, attrs, self_closing):
+        start = self._offset()
+        start_tag_text = self.get_starttag_text() or ""
+        inner_start = start + len(start_tag_text)
+        element = {
+            "index": len(self.elements),
+            "tag": tag,
+            "attrs": {k: (v if v is not None else "") for k, v in attrs},
+            "start": start,
+            "inner_start": inner_start,
+            "inner_end": inner_start,
+            "end": inner_start,
+            "depth": len(self.open_stack),
+            "parent": self.open_stack[-1] if self.open_stack else None,
+        }
+        self.elements.append(element)
+        if not self_closing and tag not in VOID_ELEMENTS:
+            self.open_stack.append(element["index"])
+
+    def handle_starttag(self, tag, attrs):
+        self._open(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        self._open(tag, attrs, True)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        pos = self._offset()
+        # Find the matching open element; stray end tags are ignored
+        for depth in range(len(self.open_stack) - 1, -1, -1):
+            if self.elements[self.open_stack[depth]]["tag"] == tag:
+                break
+        else:
+            return
+        close = self.html.find(">", pos)
+        end = close + 1 if close != -1 else len(self.html)
+        # Implicitly close unclosed descendants (e.g. <p> without </p>) where the parent ends
+        while len(self.open_stack) > depth + 1:
+            element = self.elements[self.open_stack.pop()]
+            element["inner_end"] = element["end"] = pos
+        element = self.elements[self.open_stack.pop()]
+        element["inner_end"] = pos
+        element["end"] = end
+
+    def finish(self):
+        self.close()
+        while self.open_stack:
+            element = self.elements[self.open_stack.pop()]
+            element["inner_end"] = element["end"] = len(self.html)
+        return self.elements
+
+
+def parse_element_spans(html):
+    """
+    Returns every element of html in document order as a dict with its tag,
+    attrs, depth, parent index and exact character offsets:
+    [start, end) covers the whole element, [inner_start, inner_end) its content.
+    """
+    parser = _SpanParser(html)
+    try:
+        parser.feed(html)
+        return parser.finish()
+    except Exception as e: # HTMLParser is lenient, but never let a bad page break analysis
+        logging.warning(f"parse_element_spans failed: {e}")
+        return parser.elements
+
+
+def innermost_element_at(elements, position):
+    """Returns the deepest element whose span contains position, or None."""
+    starts = [e["start"] for e in elements]
+    i = bisect.bisect_right(starts, position) - 1
+    while i >= 0:
+        element = elements[i]
+        if element["start"] <= position < element["end"]:
+            return element
+        i = element["parent"] if element["parent"] is not None else -1
+    return None
+
+
+
+def split_at_element_boundaries(html, max_chars, elements=None):
+    """
+    Splits the content of <body> (or the whole document) into contiguous [start, end)
+    chunks of at most max_chars that start and end on element boundaries. Elements
+    larger than max_chars are split into their children; a childless one stays whole.
+    Text between chunks (the tags of split parents, whitespace) is not covered.
+    """
+    elements = parse_element_spans(html) if elements is None else elements
+    children = {}
+    for element in elements:
+        children.setdefault(element["parent"], []).append(element)
+    body = next((e for e in elements if e["tag"] == "body"), None)
+    pending = list(reversed(children.get(body["index"] if body else None, [])))
+    chunks = []
+    while pending:
+        element = pending.pop()
+        if element["end"] - element["start"] > max_chars and children.get(element["index"]):
+            pending.extend(reversed(children[element["index"]]))
+        elif chunks and element["end"] - chunks[-1][0] <= max_chars:
+            chunks[-1] = (chunks[-1][0], element["end"])
+        else:
+            chunks.append((element["start"], element["end"]))
+    return chunks
+
+
+def _stands_for(a, b):
+    """Same tag and id; for elements without an id, same tag and class list."""
+    if a["tag"] != b["tag"]:
+        return False
+    if a["attrs"].get("id") or b["attrs"].get("id"):
+        return a["attrs"].get("id") == b["attrs"].get("id")
+    return a["attrs"].get("class", "").split() == b["attrs"].get("class", "").split()
+
+
+def splice_elements(container_html, fragment_html):
+    """
+    Puts each top-level element of fragment_html in place of the element of
+    container_html it stands for (same id, or the only one with the same tag and
+    class list); a fragment whose root stands for the container root replaces it
+    whole. Returns the new container html, or None when an element has no
+    unambiguous counterpart.
+    """
+    container = parse_element_spans(container_html)
+    replacements = []
+    for element in parse_element_spans(fragment_html):
+        if element["depth"] != 0:
+            continue
+        counterparts = [c for c in container if _stands_for(c, element)]
+        if len(counterparts) != 1:
+            return None
+        replacements.append((counterparts[0]["start"], counterparts[0]["end"], fragment_html[element["start"]:element["end"]]))
+    if not replacements:
+        return None
+    replacements.sort()
+    if any(later[0] < earlier[1] for earlier, later in zip(replacements, replacements[1:])):
+        return None # One returned element sits inside another
+    for start, end, text in reversed(replacements):
+        container_html = container_html[:start] + text + container_html[end:]
+    return container_html
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    test_html = """<html><body>
+<header id="top"><h1>Title</h1><br></header>
+<div class="animation-box" id="anim1-box"><p>One<p>Two</div>
+<script>if (a < b) { document.write("</p>"); }</script>
+</body></html>"""
+    elements = parse_element_spans(test_html)
+    for e in elements:
+        print(e["depth"], e["tag"], repr(test_html[e["start"]:e["end"]][:60]))
+    header = next(e for e in elements if e["attrs"].get("id") == "top")
+    assert test_html[header["start"]:header["end"]] == '<header id="top"><h1>Title</h1><br></header>'
+    assert test_html[header["inner_start"]:header["inner_end"]] == "<h1>Title</h1><br>"
+    box = next(e for e in elements if e["attrs"].get("id") == "anim1-box")
+    assert test_html[box["start"]:box["end"]].endswith("Two</div>")
+    script = next(e for e in elements if e["tag"] == "script")
+    assert test_html[script["start"]:script["end"]].endswith("</script>")
+    assert innermost_element_at(elements, test_html.index("Title"))["tag"] == "h1"
+    chunks = split_at_element_boundaries(test_html, 60, elements)
+    assert [test_html[start:end][:7] for start, end in chunks] == ['<header', '<div cl', '<script']
+    assert split_at_element_boundaries(test_html, 1000, elements) == [(chunks[0][0], chunks[-1][1])]
+
+    module = ('<div class="animation-container" id="anim-container-1"><h3>动画 1</h3>'
+              '<div class="animation-box" id="anim1-box"><div class="ball"></div></div><button onclick="playAnim1()">播放</button></div>')
+    spliced = splice_elements(module, '<div class="animation-box" id="anim1-box"><div class="ball fast"></div></div>')
+    assert spliced == module.replace('class="ball"', 'class="ball fast"')
+    whole = '<div class="animation-container" id="anim-container-1"><p>新内容</p></div>'
+    assert splice_elements(module, whole) == whole
+    assert splice_elements(module, '<div class="cube" id="cube-box"></div>') is None
+    assert splice_elements(module, "纯文本") is None
+    print("\nDOM Utils Tests Completed.")
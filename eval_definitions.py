@@ -0,0 +1,253 @@
+# eval_definitions.py
+"""
+Accuracy-vs-cost evaluation of get_module_definitions across models:
+
+    python eval_definitions.py --corpus corpus/ \
+        --model gemini-flash=http://127.0.0.1:8765/api/v1/chat/completions \
+        --model gpt-4o-mini=cassette:cassettes/gpt-4o-mini.jsonl \
+        --price gemini-flash=0.15:0.6 --accuracy-bar 0.8
+
+A corpus is a directory of <name>.html pages with <name>.gold.json files
+holding the gold definitions ({"definitions": [{id, start_char, end_char}, ...]}).
+--generate N adds N synthetic pages from page_generator with their exact definitions.
+
+Each model is reached through LLMHandler, either at an OpenRouter-compatible URL
+(a local llm_standin, or the real API) or by replaying a cassette. Pages are
+evaluated in parallel. Predicted and gold spans are snapped to the outermost
+elements they contain and then compared by character IoU. The report shows
+mean best IoU per gold module, F1 at IoU >= 0.5, latency, tokens and cost, and
+marks the Pareto-optimal models (accuracy up; latency and cost down). It also
+recommends the fastest model that meets the accuracy bar.
+"""
+import glob
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config_loader import DEFAULT_API_CONFIG
+from dom_utils import parse_element_spans
+from page_generator import generate_paper_page
+from token_estimator import estimate_tokens
+
+MATCH_IOU = 0.5
+
+
+def load_corpus(corpus_dir=None, generate=0, seed=0):
+    """[(name, html, gold_definitions)] from a corpus directory and/or synthetic pages."""
+    corpus = []
+    if corpus_dir:
+        for html_path in sorted(glob.glob(os.path.join(corpus_dir, "*.html"))):
+            gold_path = html_path[:-len(".html")] + ".gold.json"
+            if not os.path.exists(gold_path):
+                logging.warning(f"No gold definitions for {html_path}; skipped.")
+                continue
+            with open(html_path, "r", encoding="utf-8") as f:
+                html = f.read()
+            with open(gold_path, "r", encoding="utf-8") as f:
+                gold = json.load(f)
+            corpus.append((os.path.basename(html_path), html, gold.get("definitions", gold)))
+    for i in range(generate):
+        html, definitions = generate_paper_page(20_000 + 15_000 * (i % 5), 4 + 3 * (i % 4), seed=seed + i)
+        corpus.append((f"synthetic_{i}.html", html, definitions))
+    return corpus
+
+
+def snap_span(elements, html, start, end):
+    """
+    A span reduced to the outermost elements it fully contains (first one's
+    start to last one's end); a span containing no element is only trimmed of
+    surrounding whitespace.
+    """
+    inside = [e for e in elements if start <= e["start"] and e["end"] <= end]
+    if inside:
+        inside_ids = {e["index"] for e in inside}
+        tops = [e for e in inside if e["parent"] not in inside_ids]
+        return tops[0]["start"], max(e["end"] for e in tops)
+    text = html[start:end]
+    return start + len(text) - len(text.lstrip()), end - (len(text) - len(text.rstrip()))
+
+
+def span_iou(a, b):
+    intersection = max(0, min(a[1], b[1]) - max(a[0], b[0]))
+    union = (a[1] - a[0]) + (b[1] - b[0]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def score_definitions(html, gold_definitions, predicted_definitions):
+    """mean best IoU per gold module, and precision/recall/F1 of a greedy one-to-one matching at IoU >= 0.5."""
+    elements = parse_element_spans(html)
+
+    def spans(definitions):
+        result = []
+        for d in definitions:
+            try:
+                start, end = int(d["start_char"]), int(d["end_char"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            start, end = max(0, start), min(len(html), end)
+            if end > start:
+                result.append(snap_span(elements, html, start, end))
+        return result
+
+    gold, predicted = spans(gold_definitions), spans(predicted_definitions)
+    best = [max((span_iou(g, p) for p in predicted), default=0.0) for g in gold]
+    pairs = sorted(((span_iou(g, p), i, j) for i, g in enumerate(gold) for j, p in enumerate(predicted)), reverse=True)
+    used_gold, used_predicted, matches = set(), set(), 0
+    for iou, i, j in pairs:
+        if iou < MATCH_IOU:
+            break
+        if i not in used_gold and j not in used_predicted:
+            used_gold.add(i)
+            used_predicted.add(j)
+            matches += 1
+    precision = matches / len(predicted) if predicted else 0.0
+    recall = matches / len(gold) if gold else 0.0
+    return {
+        "mean_iou": statistics.fmean(best) if best else 0.0,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+    }
+
+
+class _TokenObserver:
+    """Collects prompt/completion tokens from llm.call spans, per calling thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def reset(self):
+        self._local.tokens = {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0}
+
+    def tokens(self):
+        return dict(getattr(self._local, "tokens", {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0}))
+
+    def span_started(self, span, depth):
+        pass
+
+    def span_finished(self, span, depth):
+        if span.name == "llm.call" and hasattr(self._local, "tokens"):
+            self._local.tokens["calls"] += 1
+            for key in ("prompt_tokens", "completion_tokens"):
+                self._local.tokens[key] += span.attributes.get(key, 0)
+
+
+def make_handler(model, target):
+    """LLMHandler for a model reached at an HTTP URL or through "cassette:<path>" replay."""
+    from llm_handler import LLMHandler
+    config = dict(DEFAULT_API_CONFIG, default_model=model)
+    if target.startswith("cassette:"):
+        config.update(llm_cassette_mode="replay", llm_cassette_path=target[len("cassette:"):], llm_cassette_replay_latency="original")
+    else:
+        config["api_url"] = target
+    return LLMHandler(config, os.getenv("OPENROUTER_API_KEY") or "standin", "http://localhost/eval", "DefinitionEval")
+
+
+def evaluate_model(model, target, corpus, observer, workers=8):
+    handler = make_handler(model, target)
+
+    def run(item):
+        name, html, gold = item
+        observer.reset()
+        start = time.perf_counter()
+        response = handler.get_module_definitions(html)
+        latency_ms = (time.perf_counter() - start) * 1000
+        tokens = observer.tokens()
+        if not tokens["prompt_tokens"]: # Replayed or mock calls carry no usage; estimate locally
+            tokens["prompt_tokens"] = estimate_tokens(html) + 600
+            tokens["completion_tokens"] = estimate_tokens(json.dumps({"definitions": response.get("definitions", [])}, ensure_ascii=False))
+            tokens["estimated"] = True
+        scores = score_definitions(html, gold, response.get("definitions", [])) if response["status"] == "success" else \
+            {"mean_iou": 0.0, "precision": 0.0, "recall": 0.0, "f1": 0.0}
+        return {"page": name, "status": response["status"], "latency_ms": round(latency_ms, 2), **tokens,
+                **{k: round(v, 4) for k, v in scores.items()}}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pages = list(pool.map(run, corpus))
+    latencies = sorted(p["latency_ms"] for p in pages)
+    return {
+        "model": model,
+        "target": target,
+        "pages": pages,
+        "errors": sum(1 for p in pages if p["status"] != "success"),
+        "mean_iou": round(statistics.fmean(p["mean_iou"] for p in pages), 4),
+        "f1": round(statistics.fmean(p["f1"] for p in pages), 4),
+        "latency_p50_ms": round(statistics.median(latencies), 1),
+        "latency_p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 1),
+        "prompt_tokens": sum(p["prompt_tokens"] for p in pages),
+        "completion_tokens": sum(p["completion_tokens"] for p in pages),
+        "tokens_estimated": any(p.get("estimated") for p in pages),
+    }
+
+
+def mark_pareto(results, accuracy_key="mean_iou"):
+    """A model is Pareto-optimal when no other is at least as good on accuracy, p50 latency and cost, and better on one."""
+    def dominates(a, b):
+        at_least = a[accuracy_key] >= b[accuracy_key] and a["latency_p50_ms"] <= b["latency_p50_ms"] and a["cost"] <= b["cost"]
+        better = a[accuracy_key] > b[accuracy_key] or a["latency_p50_ms"] < b["latency_p50_ms"] or a["cost"] < b["cost"]
+        return at_least and better
+    for result in results:
+        result["pareto"] = not any(dominates(other, result) for other in results if other is not result)
+    return results
+
+
+def print_table(results, accuracy_key):
+    header = f"{'model':<28} {'meanIoU':>8} {'F1@0.5':>7} {'p50 ms':>9} {'p95 ms':>9} {'prompt tok':>11} {'compl tok':>10} {'cost $':>9}  pareto"
+    print(header)
+    print("-" * len(header))
+    for r in sorted(results, key=lambda r: r["latency_p50_ms"]):
+        print(f"{r['model'][:28]:<28} {r['mean_iou']:>8.3f} {r['f1']:>7.3f} {r['latency_p50_ms']:>9.1f} {r['latency_p95_ms']:>9.1f} "
+              f"{r['prompt_tokens']:>11} {r['completion_tokens']:>10} {r['cost']:>9.4f}  {'*' if r['pareto'] else ''}"
+              f"{' (tokens estimated)' if r['tokens_estimated'] else ''}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Accuracy vs latency/cost of module definitions across models.")
+    parser.add_argument("--corpus", help="Directory of <name>.html + <name>.gold.json.")
+    parser.add_argument("--generate", type=int, default=0, help="Add N synthetic pages with exact gold definitions.")
+    parser.add_argument("--model", action="append", required=True, metavar="NAME=URL|cassette:PATH")
+    parser.add_argument("--price", action="append", default=[], metavar="NAME=IN:OUT", help="USD per million prompt:completion tokens.")
+    parser.add_argument("--accuracy-bar", type=float, default=0.8)
+    parser.add_argument("--accuracy-metric", choices=("mean_iou", "f1"), default="mean_iou")
+    parser.add_argument("--workers", type=int, default=8, help="Parallel requests per model.")
+    parser.add_argument("--output", default="eval_definitions.json")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    corpus = load_corpus(args.corpus, args.generate)
+    if not corpus:
+        parser.error("empty corpus: give --corpus and/or --generate")
+    prices = {}
+    for item in args.price:
+        name, _, value = item.partition("=")
+        prompt_price, _, completion_price = value.partition(":")
+        prices[name] = (float(prompt_price), float(completion_price or prompt_price))
+
+    import tracing
+    observer = _TokenObserver()
+    tracing.get_tracer().observers.append(observer)
+
+    models = [item.partition("=") for item in args.model]
+    with ThreadPoolExecutor(max_workers=len(models)) as pool: # Models run side by side
+        results = list(pool.map(lambda m: evaluate_model(m[0], m[2], corpus, observer, args.workers), models))
+    for result in results:
+        prompt_price, completion_price = prices.get(result["model"], (0.0, 0.0))
+        result["cost"] = round((result["prompt_tokens"] * prompt_price + result["completion_tokens"] * completion_price) / 1e6, 6)
+    mark_pareto(results, args.accuracy_metric)
+
+    print(f"{len(corpus)} pages, accuracy bar {args.accuracy_metric} >= {args.accuracy_bar}")
+    print_table(results, args.accuracy_metric)
+    eligible = [r for r in results if r[args.accuracy_metric] >= args.accuracy_bar and not r["errors"]]
+    choice = min(eligible, key=lambda r: (r["latency_p50_ms"], r["cost"]), default=None)
+    print(f"Recommended: {choice['model']}" if choice else "No model meets the accuracy bar.")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "pages": len(corpus),
+                   "accuracy_metric": args.accuracy_metric, "accuracy_bar": args.accuracy_bar,
+                   "recommended": choice["model"] if choice else None, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
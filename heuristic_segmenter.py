@@ -0,0 +1,238 @@
+# heuristic_segmenter.py
+import html as html_lib
+import logging
+import re
+
+from dom_utils import parse_element_spans
+
+# Rules are tried in order on every element; the first match wins and the
+# element's descendants are not considered further (modules never nest).
+#   tag / class / attr : conditions (element tag, a class it carries, an attribute it must have)
+#   id / description   : templates; {id} = element id in snake_case, {n} = number in the id
+#                        (or 1-based ordinal of this rule's matches), {heading} = first heading text
+DEFAULT_SEGMENT_RULES = [
+    {"tag": "header", "id": "page_header", "description": "页眉区域"},
+    {"tag": "nav", "id": "navigation", "description": "导航栏"},
+    {"tag": "footer", "id": "page_footer", "description": "页脚区域"},
+    {"class": "animation-container", "id": "animation_container_{n}", "description": "动画容器 {n}：{heading}"},
+    {"tag": "section", "attr": "id", "id": "section_{id}", "description": "章节：{heading}"},
+    {"tag": "article", "id": "article_{n}", "description": "文章：{heading}"},
+    {"tag": "figure", "id": "figure_{n}", "description": "图 {n}：{heading}"},
+    {"tag": "aside", "id": "sidebar_{n}", "description": "侧边栏 {n}"},
+    {"tag": "form", "id": "form_{n}", "description": "表单 {n}"},
+]
+
+_HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6", "figcaption", "legend"}
+_TAG_RE = re.compile(r"<[^>]+>")
+_NON_IDENT_RE = re.compile(r"[^0-9a-z]+")
+_NUMBER_RE = re.compile(r"\d+")
+
+
+def _snake_case(value):
+    return _NON_IDENT_RE.sub("_", value.lower()).strip("_") or "module"
+
+
+def _matches(rule, element):
+    if "tag" in rule and element["tag"] != rule["tag"]:
+        return False
+    if "class" in rule and rule["class"] not in element["attrs"].get("class", "").split():
+        return False
+    if "attr" in rule and not element["attrs"].get(rule["attr"]):
+        return False
+    return True
+
+
+def _heading_text(raw_html, elements, element, max_chars=30):
+    for candidate in elements[element["index"] + 1:]:
+        if candidate["start"] >= element["end"]:
+            break
+        if candidate["tag"] in _HEADING_TAGS:
+            text = html_lib.unescape(_TAG_RE.sub("", raw_html[candidate["inner_start"]:candidate["inner_end"]]))
+            text = " ".join(text.split())
+            return text[:max_chars] + ("…" if len(text) > max_chars else "")
+    return ""
+
+
+def validate_segment_rules(rules):
+    """
+    The usable entries of a custom rule list (e.g. api_config "heuristic_segment_rules"):
+    rules that are not objects or whose id/description templates use fields other
+    than {id}, {n} and {heading} are dropped with a warning. None means the defaults.
+    """
+    if rules is None:
+        return None
+    valid = []
+    for rule in rules if isinstance(rules, list) else []:
+        if not isinstance(rule, dict):
+            logging.warning(f"Heuristic segment rule {rule!r} skipped: not an object.")
+            continue
+        try:
+            for key in ("id", "description"):
+                if key in rule:
+                    str(rule[key]).format(id="module", n="1", heading="")
+        except (KeyError, IndexError, ValueError, AttributeError) as e:
+            logging.warning(f"Heuristic segment rule {rule!r} skipped: invalid template ({e!r}).")
+            continue
+        valid.append(rule)
+    if not isinstance(rules, list):
+        logging.warning(f"heuristic_segment_rules must be a list, got {type(rules).__name__}; no rules used.")
+    return valid
+
+
+def match_rule(element, rules=None):
+    """Index of the first rule matching element, or None."""
+    rules = DEFAULT_SEGMENT_RULES if rules is None else rules
+    return next((i for i, rule in enumerate(rules) if _matches(rule, element)), None)
+
+
+def label_element(raw_html, elements, element, rule, ordinal=1):
+    """
+    (module_id, description) of element from a rule's id/description templates.
+    The id is not yet made unique on the page.
+    """
+    element_id = element["attrs"].get("id", "")
+    number = _NUMBER_RE.findall(element_id)
+    fields = {
+        "id": _snake_case(element_id) if element_id else str(ordinal),
+        "n": number[-1] if number else str(ordinal),
+        "heading": _heading_text(raw_html, elements, element),
+    }
+    module_id = _snake_case(rule.get("id", "{id}").format(**fields))
+    return module_id, rule.get("description", module_id).format(**fields).rstrip("：: ")
+
+
+def unique_module_id(module_id, used_ids):
+    """module_id, or module_id_<k> for its k-th use on the page; records the use in used_ids."""
+    used_ids[module_id] = used_ids.get(module_id, 0) + 1
+    return module_id if used_ids[module_id] == 1 else f"{module_id}_{used_ids[module_id]}"
+
+
+def segment_html(raw_html, rules=None, min_chars=20, extra_definitions=None):
+    """
+    Rule-based module definitions for raw_html in the get_module_definitions()
+    schema, with offsets taken from the parsed element spans (so they are
+    exact). extra_definitions (e.g. partial module library matches) fill the
+    gaps: each one overlapping no rule-based module is added, its id made
+    unique. Returns (definitions, coverage), coverage being the fraction of
+    the <body> content the definitions span.
+    """
+    rules = DEFAULT_SEGMENT_RULES if rules is None else rules
+    elements = parse_element_spans(raw_html)
+    body = next((e for e in elements if e["tag"] == "body"), None)
+    reference_length = (body["inner_end"] - body["inner_start"]) if body else len(raw_html)
+
+    definitions, used_ids, ordinals = [], {}, {}
+    covered_until = -1
+    for element in elements:
+        if element["start"] < covered_until: # Inside an element that is already a module
+            continue
+        if element["end"] - element["start"] < min_chars:
+            continue
+        rule_index = match_rule(element, rules)
+        if rule_index is None:
+            continue
+        ordinals[rule_index] = ordinals.get(rule_index, 0) + 1
+        module_id, description = label_element(raw_html, elements, element, rules[rule_index], ordinals[rule_index])
+        module_id = unique_module_id(module_id, used_ids)
+        definitions.append({
+            "id": module_id,
+            "description": description,
+            "start_char": element["start"],
+            "end_char": element["end"],
+            "start_comment": f"LLM_MODULE_START: {module_id}",
+            "end_comment": f"LLM_MODULE_END: {module_id}",
+            "source": "heuristic",
+        })
+        covered_until = element["end"]
+
+    added = 0
+    for extra in extra_definitions or []:
+        start, end = extra["start_char"], extra["end_char"]
+        if any(start < d["end_char"] and d["start_char"] < end for d in definitions):
+            continue
+        module_id = unique_module_id(extra["id"], used_ids)
+        definitions.append({**extra, "id": module_id, "start_comment": f"LLM_MODULE_START: {module_id}",
+                            "end_comment": f"LLM_MODULE_END: {module_id}"})
+        added += 1
+    if added:
+        definitions.sort(key=lambda d: d["start_char"])
+
+    coverage = sum(d["end_char"] - d["start_char"] for d in definitions) / max(1, reference_length)
+    logging.debug(f"Heuristic segmenter: {len(definitions)} modules ({added} from extra definitions), coverage {coverage:.0%}.")
+    return definitions, coverage
+
+
+def merge_refined_definitions(heuristic_definitions, llm_definitions, raw_html, tolerance=0):
+    """
+    Compares LLM definitions with heuristic ones. LLM definitions spanning the
+    same element (after trimming whitespace) relabel the heuristic module's
+    description; those not overlapping any heuristic module are returned as
+    additions. Returns (descriptions {heuristic_id: llm_description}, additional_definitions).
+    """
+    def trimmed_span(start, end):
+        text = raw_html[start:end]
+        return start + len(text) - len(text.lstrip()), end - (len(text) - len(text.rstrip()))
+
+    by_span = {trimmed_span(d["start_char"], d["end_char"]): d for d in heuristic_definitions}
+    descriptions, additions = {}, []
+    for definition in llm_definitions:
+        try:
+            start, end = trimmed_span(int(definition["start_char"]), int(definition["end_char"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+        match = next((d for (s, e), d in by_span.items() if abs(s - start) <= tolerance and abs(e - end) <= tolerance), None)
+        if match is not None:
+            if definition.get("description"):
+                descriptions[match["id"]] = definition["description"]
+        elif not any(start < d["end_char"] and d["start_char"] < end for d in heuristic_definitions):
+            additions.append(definition)
+    return descriptions, additions
+
+
+if __name__ == '__main__':
+    import time
+    logging.basicConfig(level=logging.DEBUG)
+    test_html = """<!DOCTYPE html>
+<html><head><title>示例</title></head>
+<body>
+<header><h1>论文解读：注意力机制</h1></header>
+<nav><ul><li><a href="#intro">引言</a></li></ul></nav>
+<section id="intro"><h2>引言</h2><p>本文介绍……</p></section>
+<div class="card" id="card-1"><p>卡片：实验设置与超参数</p></div>
+<div class="container">
+  <div class="animation-container" id="anim-container-1"><h3>动画模块 1</h3><div class="animation-box" id="anim1-box"></div></div>
+  <div class="animation-container" id="anim-container-2"><h3>动画模块 2</h3><div class="animation-box" id="anim2-box"></div></div>
+</div>
+<footer><p>版权所有 &copy; 2025</p></footer>
+</body></html>"""
+    start = time.perf_counter()
+    definitions, coverage = segment_html(test_html)
+    print(f"{(time.perf_counter() - start) * 1000:.2f} ms, coverage {coverage:.0%}")
+    for d in definitions:
+        print(d["id"], "|", d["description"], "|", repr(test_html[d["start_char"]:d["end_char"]][:50]))
+    assert [d["id"] for d in definitions] == ["page_header", "navigation", "section_intro",
+                                              "animation_container_1", "animation_container_2", "page_footer"]
+    assert test_html[definitions[-1]["start_char"]:definitions[-1]["end_char"]] == "<footer><p>版权所有 &copy; 2025</p></footer>"
+    assert definitions[3]["description"] == "动画容器 1：动画模块 1"
+
+    llm = [{"id": "animation_1", "description": "第一个动画：注意力权重", "start_char": definitions[3]["start_char"], "end_char": definitions[3]["end_char"]},
+           {"id": "title", "description": "标题", "start_char": 0, "end_char": 15}]
+    relabelled, additions = merge_refined_definitions(definitions, llm, test_html)
+    assert relabelled == {"animation_container_1": "第一个动画：注意力权重"} and [a["id"] for a in additions] == ["title"]
+
+    # Library matches fill what the rules leave uncovered; overlapping ones give way to the rules
+    card = (test_html.index('<div class="card"'), test_html.index("</div>", test_html.index('<div class="card"')) + 6)
+    library_matches = [{"id": "page_footer", "description": "实验卡片", "start_char": card[0], "end_char": card[1], "library_fingerprint": "f1"},
+                       {"id": "title", "description": "标题", "start_char": definitions[0]["start_char"], "end_char": definitions[0]["end_char"]}]
+    merged, merged_coverage = segment_html(test_html, extra_definitions=library_matches)
+    assert [d["id"] for d in merged] == ["page_header", "navigation", "section_intro", "page_footer_2",
+                                         "animation_container_1", "animation_container_2", "page_footer"]
+    assert merged[3]["start_comment"] == "LLM_MODULE_START: page_footer_2" and merged[3]["library_fingerprint"] == "f1"
+    assert merged_coverage > coverage
+
+    # Custom rules with unknown template fields are dropped instead of failing the analysis
+    custom = validate_segment_rules([{"tag": "header", "id": "top_{name}"}, {"class": "card", "id": "card_{n}", "description": "卡片 {0}"},
+                                     "footer", {"tag": "footer", "id": "footer_{n}"}])
+    assert custom == [{"tag": "footer", "id": "footer_{n}"}] and validate_segment_rules(None) is None
+    assert [d["id"] for d in segment_html(test_html, rules=custom)[0]] == ["footer_1"]
+    print("\nHeuristic Segmenter Tests Completed.")
@@ -0,0 +1,181 @@
+# html_canonical.py
+import hashlib
+import re
+from array import array
+from bisect import bisect_left
+
+# Comments, tags (quoted attribute values may contain '>') and the text between them
+_TOKEN_RE = re.compile(r"<!--.*?(?:-->|\Z)|<(?:[^>\"']|\"[^\"]*\"|'[^']*')*>?", re.DOTALL)
+_TAG_NAME_RE = re.compile(r"<\s*(/?)\s*([^\s/>]+)")
+_ATTR_RE = re.compile(r"""([^\s=/>"']+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?""")
+_NON_SPACE_RE = re.compile(r"\S+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_COLLAPSIBLE_RE = re.compile(r"\s\s|[^\S ]")
+# Elements whose content is not markup; it runs to the matching closing tag
+_RAW_TEXT_TAGS = {"script", "style"}
+# Elements whose whitespace is significant and kept verbatim
+_VERBATIM_TAGS = {"pre", "textarea"}
+
+
+def _canonical_tag(tag):
+    """Lower-case name, attributes sorted by name with double-quoted values, no self-closing slash."""
+    match = _TAG_NAME_RE.match(tag)
+    if not match:
+        return _WHITESPACE_RE.sub(" ", tag), ""
+    closing, name = match.group(1), match.group(2).lower()
+    if closing or name.startswith("!"):
+        return f"<{closing}{_WHITESPACE_RE.sub(' ', tag[match.start(2):].rstrip('>').strip()).lower()}>", ""
+    attrs = []
+    for attr_match in _ATTR_RE.finditer(tag, match.end(), len(tag) - 1 if tag.endswith(">") else len(tag)):
+        attr_name, value = attr_match.group(1).lower(), attr_match.group(2)
+        if value is None:
+            attrs.append((attr_name, attr_name))
+        else:
+            if value[:1] in "\"'":
+                value = value[1:-1]
+            attrs.append((attr_name, f'{attr_name}="{value.replace(chr(34), "&quot;")}"'))
+    attrs.sort()
+    return "<" + " ".join([name] + [text for _, text in attrs]) + ">", name
+
+
+def canonicalise_html(html):
+    """
+    Formatting-insensitive form of an HTML page: comments stripped, tags
+    rewritten with sorted attributes, whitespace-only text dropped and other
+    whitespace runs collapsed (except inside <pre>/<textarea>). Returns
+    (canonical, offsets): offsets[i] is the position in html that canonical
+    character i came from (a rewritten tag maps to its '<', its final '>' to
+    the original '>'), with offsets[len(canonical)] == len(html). offsets is
+    non-decreasing, so positions map back with bisect.
+    """
+    parts, offsets = [], array("q")
+
+    def emit_text(start, end, verbatim=False):
+        if verbatim:
+            parts.append(html[start:end])
+            offsets.extend(range(start, end))
+            return
+        while start < end and html[start].isspace():
+            start += 1
+        while end > start and html[end - 1].isspace():
+            end -= 1
+        if not _COLLAPSIBLE_RE.search(html, start, end): # Already single-spaced: copy as is
+            parts.append(html[start:end])
+            offsets.extend(range(start, end))
+            return
+        previous_end = None
+        for word in _NON_SPACE_RE.finditer(html, start, end):
+            if previous_end is not None:
+                parts.append(" ")
+                offsets.append(previous_end)
+            parts.append(word.group())
+            offsets.extend(range(word.start(), word.end()))
+            previous_end = word.end()
+
+    position, verbatim_depth = 0, 0
+    length = len(html)
+    while position < length:
+        match = _TOKEN_RE.search(html, position)
+        if not match:
+            emit_text(position, length, verbatim_depth > 0)
+            break
+        emit_text(position, match.start(), verbatim_depth > 0)
+        token = match.group()
+        position = match.end()
+        if token.startswith("<!--"):
+            continue
+        canonical, name = _canonical_tag(token)
+        parts.append(canonical)
+        offsets.extend([match.start()] * (len(canonical) - 1))
+        offsets.append(match.end() - 1)
+        if canonical.startswith("</") and canonical[2:-1] in _VERBATIM_TAGS:
+            verbatim_depth = max(0, verbatim_depth - 1)
+        elif name in _VERBATIM_TAGS:
+            verbatim_depth += 1
+        elif name in _RAW_TEXT_TAGS:
+            close = re.compile(rf"</\s*{name}\s*>", re.IGNORECASE).search(html, position)
+            end = close.start() if close else length
+            emit_text(position, end)
+            position = end
+    offsets.append(length)
+    return "".join(parts), offsets
+
+
+def canonical_hash(canonical):
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def to_canonical_span(offsets, start, end):
+    """Original [start, end) -> canonical [start, end): the canonical characters that came from inside it."""
+    canonical_length = len(offsets) - 1
+    canonical_start = min(bisect_left(offsets, start, 0, canonical_length), canonical_length)
+    canonical_end = min(bisect_left(offsets, end, 0, canonical_length), canonical_length)
+    return canonical_start, max(canonical_start, canonical_end)
+
+
+def to_original_span(offsets, start, end):
+    """Canonical [start, end) -> the original [start, end) covering those characters."""
+    if end <= start:
+        return offsets[start], offsets[start]
+    return offsets[start], offsets[end - 1] + 1
+
+
+if __name__ == '__main__':
+    import time
+
+    saved = """<!DOCTYPE html>
+<html><head><title>示例</title>
+<style>
+  .box { color: red; }
+</style></head>
+<body>
+  <!-- 页眉 -->
+  <header class="top" id="hdr"><h1>论文解读</h1></header>
+  <div id="anim-container-1" class="animation-container">
+    <h3>动画模块   1</h3>
+    <button onclick="playAnim1()" disabled>播放</button>
+  </div>
+  <pre>  a
+    b</pre>
+  <script>
+    function playAnim1() { if (a < b) { run(); } }
+  </script>
+</body></html>"""
+    reexported = """<!doctype html>
+<html>
+<head>
+    <title>示例</title>
+    <style>.box { color: red; }</style>
+</head>
+<body>
+    <HEADER id='hdr' class="top">
+        <h1>论文解读</h1>
+    </HEADER>
+    <div class="animation-container"
+         id="anim-container-1"><h3>动画模块 1</h3><button disabled onclick="playAnim1()">播放</button></div>
+    <pre>  a
+    b</pre>
+    <script>function playAnim1() { if (a < b) { run(); } }</script>
+</body>
+</html>"""
+    canonical_a, offsets_a = canonicalise_html(saved)
+    canonical_b, offsets_b = canonicalise_html(reexported)
+    print(canonical_a)
+    assert canonical_a == canonical_b, (canonical_a, canonical_b)
+    assert len(offsets_a) == len(canonical_a) + 1 and all(x <= y for x, y in zip(offsets_a, offsets_a[1:]))
+
+    # A span defined on the saved page lands on the same element of the re-exported one
+    start = saved.index('<div id="anim-container-1"')
+    end = saved.index("</div>") + len("</div>")
+    canonical_span = to_canonical_span(offsets_a, start, end)
+    new_start, new_end = to_original_span(offsets_b, *canonical_span)
+    print(repr(reexported[new_start:new_end]))
+    assert reexported[new_start:new_end].startswith('<div class="animation-container"')
+    assert reexported[new_start:new_end].endswith("播放</button></div>")
+    assert canonicalise_html("<p>a  b</p>")[0] != canonicalise_html("<p>a b c</p>")[0]
+
+    page = saved * 2000
+    t0 = time.perf_counter()
+    canonicalise_html(page)
+    print(f"{len(page) / 1024:.0f} KiB canonicalised in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    print("\nHTML Canonicalisation Tests Completed.")
@@ -1,6 +1,8 @@
 # html_utils.py
 import logging
+from tracing import traced
 
+@traced("html_utils.add_markers")
 def add_markers_to_html(original_html, definitions_from_llm):
     """
     Adds HTML comment markers around identified modules in the original HTML.
@@ -35,8 +37,8 @@ def add_markers_to_html(original_html, definitions_from_llm):
 
         d["s_char_final"], d["e_char_final"] = s_char, e_char
         # Construct full HTML comments
-        d["start_marker_tag_full"] = f"\n\n"
-        d["end_marker_tag_full"] = f"\n\n"
+        d["start_marker_tag_full"] = f"\n<!-- {start_comment_content} -->\n"
+        d["end_marker_tag_full"] = f"\n<!-- {end_comment_content} -->\n"
         processed_defs.append(d)
 
     # Sort by start character to process in order
@@ -63,6 +65,7 @@ def add_markers_to_html(original_html, definitions_from_llm):
     logging.debug(f"add_markers_to_html output (first 300 chars): {final_html_with_markers[:300]}...")
     return final_html_with_markers
 
+@traced("html_utils.extract_module")
 def extract_module_content_by_markers(html_with_markers, module_definition):
     """
     Extracts the content of a specific module from HTML based on its comment markers.
@@ -76,8 +79,8 @@ def extract_module_content_by_markers(html_with_markers, module_definition):
         return None
 
     # Construct the full HTML comment markers to search for
-    effective_start_marker = f""
-    effective_end_marker = f""
+    effective_start_marker = f"<!-- {start_comment_content} -->"
+    effective_end_marker = f"<!-- {end_comment_content} -->"
 
     start_idx = html_with_markers.find(effective_start_marker)
     if start_idx == -1:
@@ -150,6 +153,7 @@ def extract_module_content_by_markers(html_with_markers, module_definition):
     return html_with_markers[final_content_start:final_content_end]
 
 
+@traced("html_utils.generate_skeleton")
 def generate_skeleton_with_placeholders(html_with_markers, module_definitions):
     """
     Replaces module content (between markers) with placeholders in the HTML.
@@ -170,9 +174,9 @@ def generate_skeleton_with_placeholders(html_with_markers, module_definitions):
             logging.warning(f"Skipping module '{module_id}' in skeleton generation due to missing info.")
             continue
 
-        full_start_marker = f"" # Actual comment tag
-        full_end_marker = f""     # Actual comment tag
-        placeholder = f""
+        full_start_marker = f"<!-- {start_comment_content} -->" # Actual comment tag
+        full_end_marker = f"<!-- {end_comment_content} -->"     # Actual comment tag
+        placeholder = f"<!-- MODULE_PLACEHOLDER: {module_id} -->"
 
         start_marker_idx = skeleton.find(full_start_marker)
         if start_marker_idx == -1:
@@ -213,6 +217,7 @@ def generate_skeleton_with_placeholders(html_with_markers, module_definitions):
     
     return skeleton
 
+@traced("html_utils.integrate")
 def integrate_final_code(
     html_skeleton,
     module_definitions,
@@ -239,7 +244,7 @@ def integrate_final_code(
         if not module_id:
             continue
 
-        placeholder = f""
+        placeholder = f"<!-- MODULE_PLACEHOLDER: {module_id} -->"
         content_to_insert = ""
         source = "unknown"
 
@@ -255,7 +260,7 @@ def integrate_final_code(
                 all_modified_js.append(f"/* JS for module: {module_id} (LLM) */\n{llm_mod_data['js']}")
             source = "llm_edit"
         else:
-            content_to_insert = module_def.get("original_content", f"")
+            content_to_insert = module_def.get("original_content", f"<!-- Original content for {module_id} missing -->")
             source = "original"
         
         if placeholder in final_html:
@@ -295,9 +300,9 @@ if __name__ == '__main__':
     # --- Test add_markers_to_html and extract_module_content_by_markers ---
     test_html = "<header><h1>Title</h1></header><main><p>Content</p></main><footer>End</footer>"
     test_defs = [
-        {"id": "header", "description": "Header section", "start_char": 0, "end_char": 30, 
+        {"id": "header", "description": "Header section", "start_char": 8, "end_char": 22, 
          "start_comment": "LLM_MODULE_START: header", "end_comment": "LLM_MODULE_END: header"},
-        {"id": "main_content", "description": "Main area", "start_char": 30, "end_char": 54,
+        {"id": "main_content", "description": "Main area", "start_char": 37, "end_char": 51,
          "start_comment": "LLM_MODULE_START: main_content", "end_comment": "LLM_MODULE_END: main_content"}
     ]
     html_with_markers = add_markers_to_html(test_html, test_defs)
@@ -323,8 +328,8 @@ if __name__ == '__main__':
         skeleton = generate_skeleton_with_placeholders(html_with_markers, test_module_defs_for_skeleton)
         print("\n--- Generated Skeleton ---")
         print(skeleton)
-        assert "" in skeleton
-        assert "" in skeleton
+        assert "<!-- MODULE_PLACEHOLDER: header -->" in skeleton
+        assert "<!-- MODULE_PLACEHOLDER: main_content -->" in skeleton
         assert "<h1>Title</h1>" not in skeleton
 
         # --- Test integrate_final_code ---
@@ -0,0 +1,134 @@
+# llm_cassette.py
+import json
+import logging
+import os
+import threading
+import time
+
+from llm_standin import prompt_hash
+
+CASSETTE_FORMAT_VERSION = 1
+
+
+class LLMCassette:
+    """
+    Record/replay of LLMHandler._call_llm_api traffic for deterministic
+    benchmarks. In "record" mode every call is appended to a JSONL cassette
+    with its prompt hash, wall time and result; in "replay" mode calls are
+    answered from the cassette, either after the recorded latency
+    (replay_latency="original") or immediately ("zero"). Repeated prompts are
+    replayed in recording order, the last recording being reused once exhausted.
+    Records also carry the raw "content", so a cassette can be served by
+    llm_standin (--responses) to exercise the real transport.
+    """
+
+    def __init__(self, path, mode="replay", replay_latency="zero"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode '{mode}'")
+        if replay_latency not in ("original", "zero"):
+            raise ValueError(f"Unknown replay latency '{replay_latency}'")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._recordings = {} # prompt hash -> [record], in recording order
+        self._positions = {}
+        self.replayed = 0
+        self.missed = 0
+        self.recorded = 0
+        self.replayed_latency_ms = 0.0
+        if mode == "replay":
+            self._load()
+
+    @property
+    def recording(self):
+        return self.mode == "record"
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        logging.warning(f"Cassette {self.path}:{line_number}: skipped malformed line ({e})")
+                        continue
+                    self._recordings.setdefault(record["prompt_sha256"], []).append(record)
+        except FileNotFoundError:
+            logging.warning(f"Cassette '{self.path}' not found; every call will miss.")
+        logging.info(f"Cassette '{self.path}': {sum(len(r) for r in self._recordings.values())} recordings loaded for replay.")
+
+    def record(self, prompt, is_json_object_response, model, result, elapsed_ms):
+        data = result.get("data")
+        record = {
+            "format_version": CASSETTE_FORMAT_VERSION,
+            "prompt_sha256": prompt_hash(prompt),
+            "prompt_bytes": len(prompt.encode("utf-8")),
+            "is_json_object_response": is_json_object_response,
+            "model": model,
+            "recorded_at": time.time(),
+            "latency_ms": round(elapsed_ms, 3),
+            "content": json.dumps(data, ensure_ascii=False) if data is not None else "",
+            "result": result,
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.recorded += 1
+
+    def replay(self, prompt):
+        """The recorded result for prompt (after the recorded latency if configured), or None."""
+        key = prompt_hash(prompt)
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if not recordings:
+                self.missed += 1
+                return None
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            record = recordings[min(position, len(recordings) - 1)]
+            self.replayed += 1
+            self.replayed_latency_ms += record["latency_ms"]
+        if self.replay_latency == "original":
+            time.sleep(record["latency_ms"] / 1000)
+        return json.loads(json.dumps(record["result"])) # Callers may mutate the result
+
+    def stats(self):
+        with self._lock:
+            return {"mode": self.mode, "recorded": self.recorded, "replayed": self.replayed, "missed": self.missed,
+                    "replayed_latency_ms": round(self.replayed_latency_ms, 3)}
+
+
+if __name__ == '__main__':
+    import tempfile
+    logging.basicConfig(level=logging.DEBUG)
+
+    path = os.path.join(tempfile.mkdtemp(), "cassette.jsonl")
+    recorder = LLMCassette(path, mode="record")
+    recorder.record("定义提示", True, "m", {"status": "success", "message": "ok", "data": {"definitions": []}}, 850.0)
+    recorder.record("修改提示", True, "m", {"status": "success", "message": "ok", "data": {"status": "success", "n": 1}}, 40.0)
+    recorder.record("修改提示", True, "m", {"status": "success", "message": "ok", "data": {"status": "success", "n": 2}}, 60.0)
+
+    player = LLMCassette(path, mode="replay", replay_latency="zero")
+    start = time.perf_counter()
+    assert player.replay("定义提示")["data"] == {"definitions": []}
+    assert [player.replay("修改提示")["data"]["n"] for _ in range(3)] == [1, 2, 2]
+    assert player.replay("未录制的提示") is None
+    assert time.perf_counter() - start < 0.1
+    print(player.stats())
+
+    timed = LLMCassette(path, mode="replay", replay_latency="original")
+    start = time.perf_counter()
+    timed.replay("修改提示")
+    assert time.perf_counter() - start >= 0.04
+    print("\nLLM Cassette Tests Completed.")
@@ -3,6 +3,15 @@ import requests
 import json
 import logging
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tracing import get_tracer
+from dom_utils import split_at_element_boundaries
+from llm_cassette import LLMCassette
+from llm_json import MODIFICATION_SCHEMA, parse_llm_json, split_valid_definitions, validate
+from prompt_compaction import PROMPT_NOTE, compact_html
+from token_estimator import estimate_request, estimate_tokens, fit_max_tokens, model_profile
 
 # 从 main.py 移动过来，如果变化更多，可以进一步参数化或管理。
 PROMPT_TEMPLATE_BASE_MODIFICATION = """你是一个专业的Web前端开发助手。你的任务是帮助用户修改HTML网页的指定部分（如动画、样式、文本等），实现用户指定的功能，确保不影响其他组件（其他动画、文本、布局）。网页用于论文解读，包含HTML5、CSS、JavaScript和MathJax公式。
@@ -120,6 +129,17 @@ HTML代码：
 JSON输出（确保包含 "definitions" 键，并且 "start_char", "end_char" 精确包围模块内容，"start_comment" 和 "end_comment" 中的ID与模块"id"一致）：
 """
 
+# 续写请求要求模型先逐字重复上一条回复的结尾（锚点）再继续，拼接时只去掉被确认回显的锚点
+CONTINUATION_PROMPT = ("你的上一条回复因长度限制被截断。请先逐字重复下方 anchor 标签内的文字（上一条回复的结尾，用于对齐），"
+                       "然后紧接着输出剩余内容：不要重复其他已输出的部分，不要添加任何解释、前言或代码围栏（```）。\n"
+                       "<anchor>{anchor}</anchor>")
+CONTINUATION_ANCHOR_CHARS = 40
+
+# 预估输出规模：每个模块定义约 80 个 token；候选模块数按块级标签计数
+_BLOCK_TAG_RE = re.compile(r"<(?:section|article|header|footer|nav|aside|figure|main|div)\b", re.IGNORECASE)
+DEFINITION_TOKENS_PER_MODULE = 80
+MODIFICATION_OVERHEAD_TOKENS = 400 # status/message/modules/modification_manual
+
 
 class LLMHandler:
     def __init__(self, api_config, openrouter_api_key, site_url, site_name):
@@ -129,143 +149,435 @@ class LLMHandler:
         self.site_name = site_name
         if not self.openrouter_api_key:
             logging.warning("OPENROUTER_API_KEY 未设置。LLM 调用将被跳过/模拟。")
+        # 录制/回放 LLM 流量（llm_cassette），使基准测试可复现
+        self.cassette = None
+        cassette_mode = self.api_config.get("llm_cassette_mode", "")
+        if cassette_mode:
+            self.cassette = LLMCassette(
+                self.api_config.get("llm_cassette_path", "llm_cassette.jsonl"),
+                mode=cassette_mode,
+                replay_latency=self.api_config.get("llm_cassette_replay_latency", "zero")
+            )
+        # 本地预估（token_estimator）：提示大小、输出上限、费用和延迟
+        self.model_profile = model_profile(self.api_config.get("default_model"), self.api_config.get("model_profiles"))
 
-    def _call_llm_api(self, prompt_content, is_json_object_response=True):
-        if not self.openrouter_api_key:
-            # 这个模拟响应应与预期结构一致
-            logging.warning("由于未设置 API 密钥，跳过实际的 LLM 调用。")
-            if "definitions" in prompt_content.lower() : # 粗略检查是否为定义提示
-                 return {"status": "success_mock", "message": "模拟的 LLM 定义响应。", "data": {"definitions": [
-                    {"id": "mock_header", "description": "模拟页眉区域", "start_char": 0, "end_char": 20, "start_comment": "LLM_MODULE_START: mock_header", "end_comment": "LLM_MODULE_END: mock_header"},
-                    {"id": "mock_content", "description": "模拟内容区域", "start_char": 21, "end_char": 40, "start_comment": "LLM_MODULE_START: mock_content", "end_comment": "LLM_MODULE_END: mock_content"}
-                 ]}}
-            else: # 假设是修改提示
-                return {"status": "success_mock", "message": "模拟的 LLM 修改响应。", "data": {
-                    "status": "success",
-                    "message": "模拟修改完成。",
-                    "modules": [{"id":"mock_target_module", "description":"一个被模拟指令针对的模块"}],
-                    "modification_manual": "模拟手册：1. 这样做。2. 那样做。",
-                    "modified_code": {"html": "<p>模拟的HTML</p>", "css": "", "js": ""}
-                }}
-
-        headers = {
-            "Authorization": f"Bearer {self.openrouter_api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": self.site_url, # 可选，但建议设置
-            "X-Title": self.site_name      # 可选，但建议设置
-        }
-        payload = {
-            "model": self.api_config.get("default_model"),
-            "messages": [{"role": "user", "content": prompt_content}],
-            "temperature": self.api_config.get("llm_temperature"),
-            "max_tokens": self.api_config.get("llm_max_tokens")
-        }
-        if is_json_object_response:
-            payload["response_format"] = {"type": "json_object"}
+    def _call_llm_api(self, prompt_content, is_json_object_response=True, max_tokens=None):
+        """调用 LLM；启用 cassette 时录制调用结果，或从录制中回放。max_tokens 为空时使用 llm_max_tokens。"""
+        if self.cassette is None:
+            return self._call_llm_api_live(prompt_content, is_json_object_response, max_tokens)
+        if self.cassette.replaying:
+            with get_tracer().span("llm.call", prompt_bytes=len(prompt_content.encode("utf-8")), model=self.api_config.get("default_model")) as span:
+                result = self.cassette.replay(prompt_content)
+                span.set_attribute("cache", "replay" if result is not None else "replay_miss")
+            if result is not None:
+                return result
+            if self.api_config.get("llm_cassette_on_miss", "error") != "live":
+                logging.error("回放记录中没有该提示对应的响应。")
+                return {"status": "error", "message": "回放记录中没有该提示对应的响应。", "data": None}
+            return self._call_llm_api_live(prompt_content, is_json_object_response, max_tokens)
+        start = time.perf_counter()
+        result = self._call_llm_api_live(prompt_content, is_json_object_response, max_tokens)
+        self.cassette.record(prompt_content, is_json_object_response, self.api_config.get("default_model"),
+                             result, (time.perf_counter() - start) * 1000)
+        return result
 
-        try:
-            logging.info(f"调用 LLM API: {self.api_config.get('api_url')} 使用模型 {payload['model']}")
+    def _call_llm_api_live(self, prompt_content, is_json_object_response=True, max_tokens=None):
+        tracer = get_tracer()
+        with tracer.span("llm.call", prompt_bytes=len(prompt_content.encode("utf-8")), model=self.api_config.get("default_model")) as span:
+            if not self.openrouter_api_key:
+                # 这个模拟响应应与预期结构一致
+                logging.warning("由于未设置 API 密钥，跳过实际的 LLM 调用。")
+                span.set_attribute("cache", "mock")
+                if "definitions" in prompt_content.lower() : # 粗略检查是否为定义提示
+                     return {"status": "success_mock", "message": "模拟的 LLM 定义响应。", "data": {"definitions": [
+                        {"id": "mock_header", "description": "模拟页眉区域", "start_char": 0, "end_char": 20, "start_comment": "LLM_MODULE_START: mock_header", "end_comment": "LLM_MODULE_END: mock_header"},
+                        {"id": "mock_content", "description": "模拟内容区域", "start_char": 21, "end_char": 40, "start_comment": "LLM_MODULE_START: mock_content", "end_comment": "LLM_MODULE_END: mock_content"}
+                     ]}}
+                else: # 假设是修改提示
+                    return {"status": "success_mock", "message": "模拟的 LLM 修改响应。", "data": {
+                        "status": "success",
+                        "message": "模拟修改完成。",
+                        "modules": [{"id":"mock_target_module", "description":"一个被模拟指令针对的模块"}],
+                        "modification_manual": "模拟手册：1. 这样做。2. 那样做。",
+                        "modified_code": {"html": "<p>模拟的HTML</p>", "css": "", "js": ""}
+                    }}
+
+            headers = {
+                "Authorization": f"Bearer {self.openrouter_api_key}",
+                "Content-Type": "application/json",
+                "HTTP-Referer": self.site_url, # 可选，但建议设置
+                "X-Title": self.site_name      # 可选，但建议设置
+            }
+            payload = {
+                "model": self.api_config.get("default_model"),
+                "messages": [{"role": "user", "content": prompt_content}],
+                "temperature": self.api_config.get("llm_temperature"),
+                "max_tokens": max_tokens or self.api_config.get("llm_max_tokens")
+            }
+            if is_json_object_response:
+                payload["response_format"] = {"type": "json_object"}
+
+            span.set_attribute("cache", "miss") # 目前没有响应缓存，每次调用都会访问 API
+            try:
+                logging.info(f"调用 LLM API: {self.api_config.get('api_url')} 使用模型 {payload['model']}")
+                raw_response_text, finish_reason, usage, response_bytes = self._request_completion(headers, payload)
+                prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+                # 输出达到 max_tokens 时续写：把已输出的部分作为 assistant 消息，请求模型从中断处继续，再拼接
+                rounds, max_rounds = 0, self.api_config.get("llm_continuation_max_rounds", 3)
+                while finish_reason == "length" and rounds < max_rounds:
+                    rounds += 1
+                    logging.warning(f"LLM 输出达到 max_tokens 被截断，发起第 {rounds} 轮续写请求。")
+                    anchor = raw_response_text[-CONTINUATION_ANCHOR_CHARS:]
+                    continuation_payload = dict(payload, messages=[
+                        {"role": "user", "content": prompt_content},
+                        {"role": "assistant", "content": raw_response_text},
+                        {"role": "user", "content": CONTINUATION_PROMPT.format(anchor=anchor)}
+                    ])
+                    continuation_payload.pop("response_format", None) # 续写片段本身不是完整的 JSON
+                    with tracer.span("llm.continuation", round=rounds) as continuation_span:
+                        segment, finish_reason, round_usage, round_bytes = self._request_completion(headers, continuation_payload)
+                        raw_response_text, anchored = self._stitch_continuation(raw_response_text, segment, anchor)
+                        continuation_span.set_attribute("anchored", anchored)
+                    prompt_tokens += round_usage.get("prompt_tokens", 0)
+                    completion_tokens += round_usage.get("completion_tokens", 0)
+                    response_bytes += round_bytes
+                usage_report = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "continuation_rounds": rounds,
+                                "extra_prompt_tokens": prompt_tokens - usage.get("prompt_tokens", 0),
+                                "extra_completion_tokens": completion_tokens - usage.get("completion_tokens", 0)}
+                span.set_attributes(response_bytes=response_bytes, finish_reason=finish_reason, **usage_report)
+                if rounds:
+                    logging.info(f"续写 {rounds} 轮后结束（finish_reason={finish_reason}），额外消耗 "
+                                 f"{usage_report['extra_prompt_tokens']} 个提示 token、{usage_report['extra_completion_tokens']} 个输出 token。")
+
+                logging.debug(f"LLM 原始响应 (前 1000 个字符): {raw_response_text[:1000]}")
+
+                # 清理和解析 JSON：容错解析（代码围栏、注释、尾随逗号、截断的数组）
+                with tracer.span("llm.json_cleanup", raw_bytes=len(raw_response_text.encode("utf-8"))) as cleanup_span:
+                    if not raw_response_text.strip():
+                        raise ValueError("LLM 返回了空内容。")
+                    parsed_json, parse_info = parse_llm_json(raw_response_text)
+                    cleanup_span.set_attributes(repairs=",".join(parse_info["repairs"]), truncated=parse_info["truncated"])
+                if parse_info["repairs"] and parse_info["repairs"] != ["code_fence"]:
+                    logging.warning(f"LLM 响应 JSON 已修复: {', '.join(parse_info['repairs'])}")
+                return {"status": "success", "message": "LLM 调用成功。", "data": parsed_json,
+                        "truncated": parse_info["truncated"], "repairs": parse_info["repairs"], "usage": usage_report}
+
+            except requests.exceptions.RequestException as req_e:
+                logging.error(f"LLM API RequestException: {req_e}")
+                span.set_attribute("result", "error")
+                return {"status": "error", "message": f"LLM API 请求错误: {req_e}", "data": None}
+            except json.JSONDecodeError as json_e:
+                logging.error(f"解析 LLM 响应时发生 JSONDecodeError: {json_e}")
+                span.set_attribute("result", "error")
+                logging.error(f"导致 JSON 解析问题的文本 (前 500 个字符): {raw_response_text[:500]}")
+                return {"status": "error", "message": f"LLM 响应不是有效的 JSON 格式: {json_e}", "data": None}
+            except Exception as e:
+                logging.error(f"LLM 调用或解析过程中发生意外错误: {e}")
+                span.set_attribute("result", "error")
+                return {"status": "error", "message": f"意外的 LLM 错误: {e}", "data": None}
+
+    def _request_completion(self, headers, payload):
+        """发送一次 chat/completions 请求，返回 (内容, finish_reason, usage, 响应字节数)。HTTP 错误会抛出异常。"""
+        with get_tracer().span("llm.wait"):
             response = requests.post(
                 self.api_config.get("api_url"),
                 headers=headers,
                 json=payload,
                 timeout=self.api_config.get("request_timeout_seconds")
             )
-            response.raise_for_status() # 对于错误的响应 (4XX 或 5XX) 会引发 HTTPError
-            
-            raw_response_text = ""
-            # 尝试获取内容，保持健壮性
-            try:
-                json_response = response.json()
-                if json_response.get("choices") and len(json_response["choices"]) > 0:
-                    message = json_response["choices"][0].get("message", {})
-                    raw_response_text = message.get("content", "")
-                else: # 如果结构不符合预期，则回退
-                    logging.warning("LLM 响应 'choices' 结构不符合预期。使用完整的响应文本。")
-                    raw_response_text = response.text
-            except (json.JSONDecodeError, KeyError, AttributeError) as e:
-                logging.error(f"无法解析 LLM JSON 响应或访问内容: {e}。使用完整的响应文本。")
-                raw_response_text = response.text
-
-            logging.debug(f"LLM 原始响应 (前 1000 个字符): {raw_response_text[:1000]}")
-
-            # 清理和解析 JSON
-            cleaned_text = raw_response_text.strip()
-            if cleaned_text.startswith("```json"):
-                cleaned_text = cleaned_text[len("```json"):].strip()
-            if cleaned_text.endswith("```"):
-                cleaned_text = cleaned_text[:-len("```")].strip()
-            
-            if not cleaned_text:
-                raise ValueError("LLM 在清理装饰器后返回了空内容。")
-
-            parsed_json = json.loads(cleaned_text)
-            return {"status": "success", "message": "LLM 调用成功。", "data": parsed_json}
-
-        except requests.exceptions.RequestException as req_e:
-            logging.error(f"LLM API RequestException: {req_e}")
-            return {"status": "error", "message": f"LLM API 请求错误: {req_e}", "data": None}
-        except json.JSONDecodeError as json_e:
-            logging.error(f"解析 LLM 响应时发生 JSONDecodeError: {json_e}")
-            logging.error(f"导致 JSON 解析问题的文本 (前 500 个字符): {cleaned_text[:500] if 'cleaned_text' in locals() else raw_response_text[:500]}")
-            return {"status": "error", "message": f"LLM 响应不是有效的 JSON 格式: {json_e}", "data": None}
-        except Exception as e:
-            logging.error(f"LLM 调用或解析过程中发生意外错误: {e}")
-            return {"status": "error", "message": f"意外的 LLM 错误: {e}", "data": None}
+        response.raise_for_status() # 对于错误的响应 (4XX 或 5XX) 会引发 HTTPError
+        # 尝试获取内容，保持健壮性
+        try:
+            json_response = response.json()
+            if json_response.get("choices") and len(json_response["choices"]) > 0:
+                choice = json_response["choices"][0]
+                content, finish_reason = choice.get("message", {}).get("content", ""), choice.get("finish_reason")
+            else: # 如果结构不符合预期，则回退
+                logging.warning("LLM 响应 'choices' 结构不符合预期。使用完整的响应文本。")
+                content, finish_reason = response.text, None
+            return content or "", finish_reason, json_response.get("usage") or {}, len(response.content)
+        except (json.JSONDecodeError, KeyError, AttributeError) as e:
+            logging.error(f"无法解析 LLM JSON 响应或访问内容: {e}。使用完整的响应文本。")
+            return response.text, None, {}, len(response.content)
 
-    def get_module_definitions(self, raw_original_code):
-        """从 LLM 获取模块定义。"""
-        prompt = PROMPT_TEMPLATE_DEFINITION.format(raw_html_code=raw_original_code)
-        logging.info("正在从 LLM 请求模块定义。")
-        
-        response = self._call_llm_api(prompt)
+    @staticmethod
+    def _stitch_continuation(partial, segment, anchor):
+        """
+        把续写片段接到已有输出后，返回 (拼接结果, 是否对齐到锚点)。片段开头的代码围栏会被去掉；
+        只有片段确实以请求中的锚点（已有输出的结尾）开头时才去掉这段回显，否则原样追加——
+        HTML 中常有合法的重复内容（如连续的 </div>），按重叠猜测去重会误删真实内容。
+        """
+        stripped = segment.lstrip()
+        if stripped.startswith("```"):
+            segment = stripped[stripped.find("\n") + 1:] if "\n" in stripped else ""
+        if anchor and segment.startswith(anchor):
+            return partial + segment[len(anchor):], True
+        if anchor.strip() and segment.lstrip().startswith(anchor.lstrip()): # 回显时丢了锚点开头的空白
+            return partial + segment.lstrip()[len(anchor.lstrip()):], True
+        logging.warning("续写片段没有以锚点开头，按原样拼接。")
+        return partial + segment, False
 
-        if response["status"] in ["success", "success_mock"] and response["data"]:
-            if isinstance(response["data"], dict):
-                definitions = response["data"].get("definitions", [])
-                if not isinstance(definitions, list):
-                    logging.error(f"LLM 'definitions' 不是列表: {type(definitions)}。数据: {response['data']}")
-                    return {"status": "error", "message": "LLM 'definitions' 字段不是列表。", "definitions": []}
-                logging.info(f"LLM 返回了 {len(definitions)} 个模块定义。")
-                return {"status": "success", "message": response["message"], "definitions": definitions}
-            else: # 如果 json_object 类型被遵守并且解析正确，则不应发生这种情况
+    def _compact_for_prompt(self, code):
+        """
+        可逆的提示压缩：把 base64 数据、SVG 路径、压缩脚本和 MathJax 配置替换为占位符（prompt_compaction）。
+        返回 (提示中使用的代码, 附加说明, PromptCompaction 或 None)。
+        """
+        if not self.api_config.get("prompt_compaction_enabled", True) or not code:
+            return code, "", None
+        with get_tracer().span("llm.prompt_compaction", original_bytes=len(code.encode("utf-8"))) as span:
+            compaction = compact_html(code, self.api_config.get("prompt_compaction_min_chars", 256))
+            span.set_attributes(compacted_bytes=len(compaction.compacted.encode("utf-8")), payloads=len(compaction.replacements))
+        if not compaction.replacements:
+            return code, "", None
+        logging.info(f"提示压缩: {len(code)} -> {len(compaction.compacted)} 个字符（{len(compaction.replacements)} 个占位符）。")
+        return compaction.compacted, PROMPT_NOTE, compaction
+
+    def _prompt_budget(self):
+        """单次调用的提示 token 上限：llm_chunk_max_prompt_tokens，未设置时为上下文窗口的 60%。"""
+        return self.api_config.get("llm_chunk_max_prompt_tokens") or int(self.model_profile["context_window"] * 0.6)
+
+    def _fit_max_tokens(self, prompt_tokens, expected_output_tokens):
+        """按预计输出设置 max_tokens（不低于 llm_max_tokens，不超过模型输出上限和剩余上下文）；llm_max_tokens_auto 关闭时沿用 llm_max_tokens。"""
+        configured = self.api_config.get("llm_max_tokens")
+        if not self.api_config.get("llm_max_tokens_auto", True):
+            return configured
+        floor = min(configured or 0, self.model_profile["max_output_tokens"])
+        return fit_max_tokens(prompt_tokens, expected_output_tokens, self.model_profile, floor=floor) or configured
+
+    def _combine_estimates(self, requests):
+        """多次调用的总费用；分块调用并发执行（llm_chunk_concurrency），延迟按并发折算。"""
+        estimates = [estimate_request(r["prompt_tokens"], r["expected_output_tokens"], self.model_profile) for r in requests]
+        concurrency = max(1, min(len(requests), self.api_config.get("llm_chunk_concurrency", 4)))
+        return {
+            "calls": len(requests),
+            "prompt_tokens": sum(e["prompt_tokens"] for e in estimates),
+            "expected_output_tokens": sum(e["expected_output_tokens"] for e in estimates),
+            "max_tokens": max(r["max_tokens"] or 0 for r in requests),
+            "cost_usd": round(sum(e["cost_usd"] for e in estimates), 6),
+            "latency_ms": max(max(e["latency_ms"] for e in estimates), round(sum(e["latency_ms"] for e in estimates) / concurrency)),
+            "model": self.api_config.get("default_model"),
+        }
+
+    def plan_definition_request(self, raw_original_code):
+        """
+        定义请求的预检（不发送任何请求）：压缩后的提示 token 数、预计输出、max_tokens、费用和延迟。
+        提示超出预算或预计输出超过模型输出上限时改为分块模式：按元素边界切分，每块单独请求。
+        返回 {code, note, compaction, requests: [{start, end, prompt_tokens, expected_output_tokens, max_tokens}], estimate}。
+        """
+        code_for_prompt, note, compaction = self._compact_for_prompt(raw_original_code)
+        with get_tracer().span("llm.preflight", kind="definitions") as span:
+            template_tokens = estimate_tokens(note + PROMPT_TEMPLATE_DEFINITION)
+            code_tokens = estimate_tokens(code_for_prompt)
+
+            def expected_output(code):
+                return DEFINITION_TOKENS_PER_MODULE * max(1, min(400, len(_BLOCK_TAG_RE.findall(code))))
+
+            budget = self._prompt_budget()
+            output_limit = self.model_profile["max_output_tokens"]
+            expected = expected_output(code_for_prompt)
+            spans = [(0, len(code_for_prompt))]
+            if template_tokens + code_tokens > budget or expected > output_limit:
+                chunk_tokens = min(budget - template_tokens, code_tokens * 0.7 * output_limit / expected)
+                max_chars = max(1, int(chunk_tokens * len(code_for_prompt) / max(1, code_tokens)))
+                spans = split_at_element_boundaries(code_for_prompt, max_chars) or spans
+            requests = []
+            for start, end in spans:
+                chunk = code_for_prompt[start:end]
+                prompt_tokens = template_tokens + (code_tokens if len(spans) == 1 else estimate_tokens(chunk))
+                expected_tokens = expected if len(spans) == 1 else expected_output(chunk)
+                requests.append({"start": start, "end": end, "prompt_tokens": prompt_tokens, "expected_output_tokens": expected_tokens,
+                                 "max_tokens": self._fit_max_tokens(prompt_tokens, expected_tokens)})
+            estimate = self._combine_estimates(requests)
+            span.set_attributes(calls=len(requests), prompt_tokens=estimate["prompt_tokens"],
+                                max_tokens=estimate["max_tokens"], cost_usd=estimate["cost_usd"])
+        if len(requests) > 1:
+            logging.info(f"定义提示约 {template_tokens + code_tokens} 个 token，超出单次调用预算，分为 {len(requests)} 块请求。")
+        return {"code": code_for_prompt, "note": note, "compaction": compaction, "requests": requests, "estimate": estimate}
+
+    def _request_definitions(self, code, note, request):
+        """
+        对 code[start:end] 发起定义请求；返回的偏移量换算为整个 code 中的位置。
+        不符合结构的定义项被丢弃；输出被截断时保留完整的定义项，并用续写提示只请求剩余部分
+        （最多 llm_json_continuation_rounds 轮）。
+        """
+        base_prompt = note + PROMPT_TEMPLATE_DEFINITION.format(raw_html_code=code[request["start"]:request["end"]])
+        prompt, definitions, rounds = base_prompt, [], 0
+        max_rounds = self.api_config.get("llm_json_continuation_rounds", 2)
+        while True:
+            response = self._call_llm_api(prompt, max_tokens=request["max_tokens"])
+            if response["status"] not in ["success", "success_mock"] or not response["data"]:
+                if definitions: # 续写失败时保留已经得到的定义
+                    logging.warning(f"定义续写请求失败，保留已收到的 {len(definitions)} 个模块定义: {response['message']}")
+                    break
+                return {"status": "error", "message": response["message"], "definitions": []}
+            if not isinstance(response["data"], dict): # 如果 json_object 类型被遵守并且解析正确，则不应发生这种情况
                 logging.error(f"LLM 定义响应数据不是字典: {type(response['data'])}。数据: {response['data']}")
                 return {"status": "error", "message": "LLM 定义响应不是预期的 JSON 对象。", "definitions": []}
+            received = response["data"].get("definitions", [])
+            if not isinstance(received, list):
+                logging.error(f"LLM 'definitions' 不是列表: {type(received)}。数据: {response['data']}")
+                return {"status": "error", "message": "LLM 'definitions' 字段不是列表。", "definitions": []}
+            valid, errors = split_valid_definitions(received)
+            if errors:
+                logging.warning(f"丢弃了 {len(received) - len(valid)} 个不符合结构的模块定义: {'; '.join(errors[:5])}")
+            if definitions: # 续写结果中只保留新的、位于已收到部分之后的模块
+                seen_ids, last_end = {d["id"] for d in definitions}, max(d["end_char"] for d in definitions)
+                valid = [d for d in valid if d["id"] not in seen_ids and d["start_char"] >= last_end]
+            definitions.extend(valid)
+            if not response.get("truncated") or rounds >= max_rounds or not definitions or (rounds and not valid):
+                break
+            rounds += 1
+            logging.info(f"定义输出被截断，已收到 {len(definitions)} 个模块，发起第 {rounds} 轮续写请求。")
+            prompt = base_prompt + self._definition_continuation_hint(definitions)
+        if request["start"]:
+            definitions = [dict(d, start_char=d["start_char"] + request["start"], end_char=d["end_char"] + request["start"]) for d in definitions]
+        return {"status": "success", "message": response["message"], "definitions": definitions}
 
-        logging.error(f"从 LLM 获取模块定义失败: {response['message']}")
-        return {"status": "error", "message": response["message"], "definitions": []}
+    @staticmethod
+    def _definition_continuation_hint(definitions):
+        """续写提示：列出已收到的模块，只请求其后的剩余定义。"""
+        received = "\n".join(f"- {d['id']}: {d['start_char']}-{d['end_char']}" for d in definitions)
+        last_end = max(d["end_char"] for d in definitions)
+        return (f"\n你上一次的输出因长度限制被截断。以下模块定义已经收到，请不要重复输出：\n{received}\n"
+                f"请只输出从字符位置 {last_end} 之后开始、尚未返回的模块定义，JSON 格式与上面相同：{{\"definitions\": [...]}}；"
+                f"若没有剩余模块，返回 {{\"definitions\": []}}。\n")
 
+    @staticmethod
+    def _merge_chunk_definitions(chunk_responses):
+        """合并分块结果；不同块中重复的模块 ID 加上序号后缀，并同步注释中的 ID。"""
+        merged, seen = [], set()
+        for response in chunk_responses:
+            for definition in response["definitions"]:
+                if isinstance(definition, dict) and definition.get("id") in seen:
+                    base, n = definition["id"], 2
+                    while f"{base}_{n}" in seen:
+                        n += 1
+                    definition = dict(definition, id=f"{base}_{n}", start_comment=f"LLM_MODULE_START: {base}_{n}",
+                                      end_comment=f"LLM_MODULE_END: {base}_{n}")
+                if isinstance(definition, dict):
+                    seen.add(definition.get("id"))
+                merged.append(definition)
+        return merged
+
+    def get_module_definitions(self, raw_original_code):
+        """
+        从 LLM 获取模块定义。提示中的代码经过压缩时，返回的 start_char/end_char 会换算回原始 HTML；
+        页面过大时按预检结果分块请求（plan_definition_request）。
+        """
+        plan = self.plan_definition_request(raw_original_code)
+        logging.info(f"正在从 LLM 请求模块定义（{plan['estimate']['calls']} 次调用，预计 {plan['estimate']['prompt_tokens']} 个提示 token）。")
+
+        if len(plan["requests"]) == 1:
+            chunk_responses = [self._request_definitions(plan["code"], plan["note"], plan["requests"][0])]
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, self.api_config.get("llm_chunk_concurrency", 4))) as pool:
+                chunk_responses = list(pool.map(lambda request: self._request_definitions(plan["code"], plan["note"], request), plan["requests"]))
+
+        failed = next((r for r in chunk_responses if r["status"] != "success"), None)
+        if failed is not None:
+            logging.error(f"从 LLM 获取模块定义失败: {failed['message']}")
+            return {"status": "error", "message": failed["message"], "definitions": [], "estimate": plan["estimate"]}
+        definitions = self._merge_chunk_definitions(chunk_responses)
+        if plan["compaction"] is not None:
+            definitions = plan["compaction"].restore_definitions(definitions)
+        logging.info(f"LLM 返回了 {len(definitions)} 个模块定义。")
+        return {"status": "success", "message": chunk_responses[0]["message"], "definitions": definitions, "estimate": plan["estimate"]}
+
+    def _build_modification_prompt(self, raw_original_code, specific_instruction, reference_edits, target_modules, scoped,
+                                   page_blocks=None):
+        """返回 (修改提示, PromptCompaction 或 None)。"""
+        if scoped and target_modules:
+            code_intro = "以下仅为页面中与修改指令相关的模块代码（页面其余部分保持不变，无需输出）:"
+            code_for_prompt = "\n\n".join(m["original_content"] for m in target_modules)
+            if page_blocks: # 模块之外的全局样式/脚本（如 <head> 中的 CSS、<body> 末尾的函数）
+                code_intro = "以下仅为页面中与修改指令相关的模块代码，以及它们用到的页面级样式和脚本（页面其余部分保持不变，无需输出）:"
+                code_for_prompt += "\n\n<!-- 页面级样式/脚本（位于所有模块之外） -->\n" + "\n".join(page_blocks)
+        else:
+            code_intro = "用户提供的HTML代码如下:"
+            code_for_prompt = raw_original_code
+        code_for_prompt, compaction_note, compaction = self._compact_for_prompt(code_for_prompt)
+        if compaction_note:
+            code_intro = compaction_note + code_intro
 
-    def get_code_modification(self, raw_original_code, specific_instruction):
-        """根据指令从 LLM 获取代码修改。"""
-        if not specific_instruction:
-            return {"status": "skipped", "message": "未提供具体指令。", "data": None}
-        
         # 构造修改提示内容
         # 这种方法更好：在提示中直接包含 HTML。
         prompt_content_for_modification = f"""{PROMPT_TEMPLATE_BASE_MODIFICATION}
 
-用户提供的HTML代码如下:
+{code_intro}
 ```html
-{raw_original_code}
+{code_for_prompt}
 ```
-
+{self._format_reference_edits(reference_edits)}{self._format_target_hint(target_modules)}
 请根据以上HTML代码和之前的修改指令 ({specific_instruction}) 来执行任务。
 """
+        return prompt_content_for_modification, compaction
+
+    def plan_modification_request(self, raw_original_code, specific_instruction, reference_edits=None,
+                                  target_modules=None, scoped=False, page_blocks=None):
+        """
+        修改请求的预检（不发送任何请求）。整页提示超出预算且已知目标模块时改用仅含目标模块的提示；
+        预计输出按目标模块代码量估算（重写后的模块代码 + 说明）。
+        返回 {prompt, compaction, scoped, max_tokens, estimate}。
+        """
+        prompt, compaction = self._build_modification_prompt(raw_original_code, specific_instruction, reference_edits, target_modules, scoped,
+                                                             page_blocks)
+        with get_tracer().span("llm.preflight", kind="modification") as span:
+            prompt_tokens = estimate_tokens(prompt)
+            if prompt_tokens > self._prompt_budget() and target_modules and not scoped:
+                logging.info(f"整页修改提示约 {prompt_tokens} 个 token，超出预算，改为仅发送目标模块。")
+                scoped = True
+                prompt, compaction = self._build_modification_prompt(raw_original_code, specific_instruction, reference_edits, target_modules,
+                                                                     scoped, page_blocks)
+                prompt_tokens = estimate_tokens(prompt)
+            if target_modules:
+                target_code = target_modules[0]["original_content"]
+                if self.api_config.get("prompt_compaction_enabled", True):
+                    target_code = compact_html(target_code, self.api_config.get("prompt_compaction_min_chars", 256)).compacted
+                output_tokens = estimate_tokens(target_code)
+            else: # 目标未知：LLM 通常只输出被修改的部分
+                output_tokens = min(prompt_tokens, self.api_config.get("llm_max_tokens") or 8192) // 2
+            expected = MODIFICATION_OVERHEAD_TOKENS + int(output_tokens * 1.1)
+            request = {"prompt_tokens": prompt_tokens, "expected_output_tokens": expected, "max_tokens": self._fit_max_tokens(prompt_tokens, expected)}
+            estimate = self._combine_estimates([request])
+            span.set_attributes(prompt_tokens=prompt_tokens, max_tokens=request["max_tokens"], cost_usd=estimate["cost_usd"], scoped=scoped)
+        return {"prompt": prompt, "compaction": compaction, "scoped": scoped, "max_tokens": request["max_tokens"], "estimate": estimate}
+
+    def get_code_modification(self, raw_original_code, specific_instruction, reference_edits=None,
+                              target_modules=None, scoped=False, page_blocks=None):
+        """
+        根据指令从 LLM 获取代码修改。
+        reference_edits: 可选，相似模块上曾经成功的修改 [{instruction, modified_code, ...}]，作为示例放入提示。
+        target_modules: 可选，本地定位得到的目标模块及其依赖闭包 [{id, description, original_content}]，第一个为目标模块。
+        scoped: 为 True 时只把这些模块的代码（而不是整页 HTML）发给 LLM。
+        page_blocks: 可选，这些模块用到的页面级 <style>/<script> 代码块，在 scoped 模式下一并发送。
+        """
+        if not specific_instruction:
+            return {"status": "skipped", "message": "未提供具体指令。", "data": None}
+
+        plan = self.plan_modification_request(raw_original_code, specific_instruction, reference_edits, target_modules, scoped,
+                                              page_blocks)
+        compaction = plan["compaction"]
         logging.info(f"正在从 LLM 请求代码修改，指令为: {specific_instruction}")
-        response = self._call_llm_api(prompt_content_for_modification) # 期望一个 JSON 对象
+        response = self._call_llm_api(plan["prompt"], max_tokens=plan["max_tokens"]) # 期望一个 JSON 对象
 
         if response["status"] in ["success", "success_mock"] and response["data"]:
             # 预期的响应结构直接是来自提示的 JSON。
             llm_output_data = response["data"]
+            schema_errors = validate(llm_output_data, MODIFICATION_SCHEMA)
+            if response.get("truncated") or schema_errors:
+                error_msg = "LLM 修改输出被截断。" if response.get("truncated") else f"LLM 修改输出不符合预期结构: {'; '.join(schema_errors[:3])}"
+                logging.error(error_msg)
+                return {"status": "error", "message": error_msg, "data": llm_output_data}
             if llm_output_data.get("status") == "success":
                 logging.info("LLM 修改成功。")
                 return {
                     "status": "success",
                     "message": llm_output_data.get("message", "修改成功。"),
-                    "modified_code": llm_output_data.get("modified_code", {}),
+                    "modified_code": compaction.expand_code(llm_output_data.get("modified_code", {})) if compaction else llm_output_data.get("modified_code", {}),
                     "modification_manual": llm_output_data.get("modification_manual", ""),
-                    "affected_modules_by_llm": llm_output_data.get("modules", []) # LLM 可能会识别它认为已修改的模块
+                    "affected_modules_by_llm": llm_output_data.get("modules", []), # LLM 可能会识别它认为已修改的模块
+                    "estimate": plan["estimate"]
                 }
             else:
                 error_msg = llm_output_data.get('message', 'LLM 在修改过程中报告错误。')
@@ -275,6 +587,31 @@ class LLMHandler:
         logging.error(f"从 LLM 获取代码修改失败: {response['message']}")
         return {"status": "error", "message": response["message"], "data": response.get("data")}
 
+    @staticmethod
+    def _format_reference_edits(reference_edits, max_chars_per_edit=4000):
+        """把先前成功的修改格式化为提示中的参考示例；过长的代码会被截断。"""
+        if not reference_edits:
+            return ""
+        examples = []
+        for i, edit in enumerate(reference_edits, 1):
+            code_json = json.dumps(edit.get("modified_code", {}), ensure_ascii=False)
+            if len(code_json) > max_chars_per_edit:
+                code_json = code_json[:max_chars_per_edit] + "...(已截断)"
+            examples.append(f"示例 {i}：指令「{edit.get('instruction', '')}」\nmodified_code: {code_json}")
+        return "\n以下是相似模块上曾经成功的修改示例，仅供参考（请以当前HTML和指令为准）：\n" + "\n\n".join(examples) + "\n"
+
+    @staticmethod
+    def _format_target_hint(target_modules):
+        """本地定位结果（目标模块及依赖模块）作为提示中的线索，便于整合时对应到模块 ID。"""
+        if not target_modules:
+            return ""
+        target = target_modules[0]
+        hint = f"\n本地分析认为本次修改的目标模块是: {target['id']}（{target.get('description', '')}）。若确认无误，请在 modules[0].id 中使用该模块 ID。\n"
+        if len(target_modules) > 1:
+            related = "、".join(m["id"] for m in target_modules[1:])
+            hint += f"与其存在依赖关系（样式、脚本、元素ID）的模块: {related}，修改时请保持这些引用有效。\n"
+        return hint
+
     def get_prompt_template_for_frontend(self):
         """返回用于前端显示的基本修改提示模板。"""
         # 替换掉前端不需要看到或可能引起混淆的占位符。
@@ -315,6 +652,14 @@ if __name__ == '__main__':
     </body>
     </html>"""
 
+    print("\n--- 测试 _stitch_continuation ---")
+    partial = '{"html": "<div class=\\"card\\">\\n    <p>A</p>\\n    </div>\\n    </div>\\n'
+    anchor = partial[-CONTINUATION_ANCHOR_CHARS:]
+    rest = '    </div>\\n    </div>\\n<div class=\\"card\\">\\n    <p>B</p>\\n    </div>\\n"}' # 真实续写以已有结尾中出现过的文字开头
+    assert LLMHandler._stitch_continuation(partial, anchor + rest, anchor) == (partial + rest, True)
+    assert LLMHandler._stitch_continuation(partial, "```json\n" + anchor + rest, anchor) == (partial + rest, True)
+    assert LLMHandler._stitch_continuation(partial, rest, anchor) == (partial + rest, False) # 未回显锚点：不猜测重叠
+
     print("\n--- 测试 get_module_definitions ---")
     definitions_result = handler.get_module_definitions(sample_html)
     print(json.dumps(definitions_result, indent=2, ensure_ascii=False)) # ensure_ascii=False 以正确显示中文
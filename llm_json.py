@@ -0,0 +1,223 @@
+# llm_json.py
+import json
+import re
+
+_FENCE_RE = re.compile(r"^```(?:json|JSON)?\s*|\s*```\s*$")
+_CLOSERS = {"{": "}", "[": "]"}
+MAX_SALVAGE_ATTEMPTS = 64
+
+DEFINITION_ITEM_SCHEMA = {
+    "type": "object",
+    "required": ["id", "start_char", "end_char"],
+    "properties": {
+        "id": {"type": "string"},
+        "description": {"type": "string"},
+        "start_char": {"type": "integer"},
+        "end_char": {"type": "integer"},
+        "start_comment": {"type": "string"},
+        "end_comment": {"type": "string"},
+    },
+}
+DEFINITIONS_SCHEMA = {
+    "type": "object",
+    "required": ["definitions"],
+    "properties": {"definitions": {"type": "array", "items": DEFINITION_ITEM_SCHEMA}},
+}
+MODIFICATION_SCHEMA = {
+    "type": "object",
+    "required": ["status"],
+    "properties": {
+        "status": {"type": "string"},
+        "message": {"type": "string"},
+        "modules": {"type": "array", "items": {"type": "object", "required": ["id"], "properties": {"id": {"type": "string"}}}},
+        "modification_manual": {"type": "string"},
+        "modified_code": {"type": "object", "properties": {"html": {"type": "string"}, "css": {"type": "string"}, "js": {"type": "string"}}},
+    },
+}
+_TYPES = {"object": dict, "array": list, "string": str, "number": (int, float)}
+
+
+def _strip_comments(text):
+    """// and /* */ comments outside strings removed."""
+    out, i, in_string, n = [], 0, False, len(text)
+    while i < n:
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if char == "\\" and i + 1 < n:
+                out.append(text[i + 1])
+                i += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            out.append(char)
+        elif text.startswith("//", i):
+            newline = text.find("\n", i)
+            i = n if newline < 0 else newline
+            continue
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        else:
+            out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def _scan(text):
+    """
+    Trailing commas removed; returns (text, open_stack, in_string, cuts) where cuts are
+    (position, stack) pairs just after a complete value, for salvaging a truncated document.
+    """
+    out, stack, cuts, in_string, i, n = [], [], [], False, 0, len(text)
+    while i < n:
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if char == "\\" and i + 1 < n:
+                out.append(text[i + 1])
+                i += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            out.append(char)
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+        elif char in "}]":
+            last = len(out) - 1
+            while last >= 0 and out[last].isspace():
+                last -= 1
+            if last >= 0 and out[last] == ",":
+                del out[last]
+            if stack:
+                stack.pop()
+            out.append(char)
+            cuts.append((len(out), tuple(stack)))
+        elif char == ",":
+            cuts.append((len(out), tuple(stack)))
+            out.append(char)
+        else:
+            out.append(char)
+        i += 1
+    return "".join(out), stack, in_string, cuts
+
+
+def parse_llm_json(text):
+    """
+    Tolerant JSON parsing of an LLM response: code fences and prose around the
+    document, comments and trailing commas are removed; a truncated document is
+    cut back to its last complete array item (else its last complete value) and
+    closed. Returns (data, info) with info = {"repairs": [...], "truncated": bool}.
+    Raises json.JSONDecodeError when nothing can be recovered.
+    """
+    repairs = []
+    cleaned = text.strip()
+    unfenced = _FENCE_RE.sub("", cleaned)
+    if unfenced != cleaned:
+        repairs.append("code_fence")
+    cleaned = unfenced.strip()
+    starts = [i for i in (cleaned.find("{"), cleaned.find("[")) if i >= 0]
+    if not starts:
+        raise json.JSONDecodeError("No JSON object or array in the response", cleaned, 0)
+    if min(starts) > 0:
+        repairs.append("leading_text")
+        cleaned = cleaned[min(starts):]
+    try:
+        return json.loads(cleaned, strict=False), {"repairs": repairs, "truncated": False}
+    except json.JSONDecodeError as e:
+        first_error = e
+
+    uncommented = _strip_comments(cleaned)
+    if uncommented != cleaned:
+        repairs.append("comments")
+    scanned, stack, in_string, cuts = _scan(uncommented)
+    if len(scanned) != len(uncommented):
+        repairs.append("trailing_commas")
+    if not stack and not in_string:
+        try:
+            return json.loads(scanned, strict=False), {"repairs": repairs, "truncated": False}
+        except json.JSONDecodeError:
+            # Complete but with text after the document (e.g. a trailing explanation)
+            try:
+                data, end = json.JSONDecoder(strict=False).raw_decode(scanned)
+                return data, {"repairs": repairs + ["trailing_text"], "truncated": False}
+            except json.JSONDecodeError:
+                raise first_error
+    # Prefer cuts between array items (only whole items survive), then any complete value
+    recent = list(reversed(cuts[-MAX_SALVAGE_ATTEMPTS:]))
+    for position, cut_stack in [c for c in recent if c[1] and c[1][-1] == "["] + [c for c in recent if c[1] and c[1][-1] == "{"]:
+        candidate = scanned[:position].rstrip().rstrip(",") + "".join(_CLOSERS[c] for c in reversed(cut_stack))
+        try:
+            return json.loads(candidate, strict=False), {"repairs": repairs + ["truncated"], "truncated": True}
+        except json.JSONDecodeError:
+            continue
+    raise first_error
+
+
+def validate(data, schema, path="$"):
+    """Errors (as "path: problem" strings) of data against a small JSON-schema subset: type, required, properties, items."""
+    expected = schema.get("type")
+    if expected == "integer":
+        if not isinstance(data, int) or isinstance(data, bool):
+            return [f"{path}: expected integer"]
+    elif expected and (not isinstance(data, _TYPES[expected]) or isinstance(data, bool)):
+        return [f"{path}: expected {expected}"]
+    errors = []
+    if isinstance(data, dict):
+        errors.extend(f"{path}: missing '{key}'" for key in schema.get("required", []) if key not in data)
+        for key, subschema in schema.get("properties", {}).items():
+            if key in data:
+                errors.extend(validate(data[key], subschema, f"{path}.{key}"))
+    elif isinstance(data, list) and "items" in schema:
+        for i, item in enumerate(data):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+def split_valid_definitions(definitions):
+    """
+    (valid, errors): definitions that satisfy DEFINITION_ITEM_SCHEMA, with integer
+    strings ("120") coerced; the rest are reported and left out.
+    """
+    valid, errors = [], []
+    for i, definition in enumerate(definitions):
+        if isinstance(definition, dict):
+            for key in ("start_char", "end_char"):
+                value = definition.get(key)
+                if isinstance(value, str) and value.strip().isdigit():
+                    definition = dict(definition, **{key: int(value)})
+        problems = validate(definition, DEFINITION_ITEM_SCHEMA, f"$.definitions[{i}]")
+        if problems:
+            errors.extend(problems)
+        else:
+            valid.append(definition)
+    return valid, errors
+
+
+if __name__ == '__main__':
+    data, info = parse_llm_json('```json\n{"definitions": [{"id": "a", "start_char": 0, "end_char": 5},]}\n```')
+    assert data["definitions"][0]["id"] == "a" and info == {"repairs": ["code_fence", "trailing_commas"], "truncated": False}
+
+    data, info = parse_llm_json('好的，结果如下：\n{\n  // 模块列表\n  "definitions": [ /* 第一个 */ {"id": "a // not a comment", "start_char": 0, "end_char": 5}]\n}')
+    assert data["definitions"][0]["id"] == "a // not a comment" and "comments" in info["repairs"] and "leading_text" in info["repairs"]
+
+    truncated = '{"definitions": [{"id": "a", "start_char": 0, "end_char": 5}, {"id": "b", "start_char": 6, "end_char": 9}, {"id": "c", "desc'
+    data, info = parse_llm_json(truncated)
+    assert info["truncated"] and [d["id"] for d in data["definitions"]] == ["a", "b"]
+    valid, errors = split_valid_definitions(data["definitions"] + [{"id": "x", "start_char": "12", "end_char": 20}, {"id": "y"}])
+    assert [d["id"] for d in valid] == ["a", "b", "x"] and valid[2]["start_char"] == 12 and len(errors) == 2
+
+    data, info = parse_llm_json('{"status": "success", "modified_code": {"html": "<p>a,</p>"}} 以上为修改结果。')
+    assert data["status"] == "success" and "trailing_text" in info["repairs"]
+    assert validate({"status": "success", "modified_code": {"html": 1}}, MODIFICATION_SCHEMA) == ["$.modified_code.html: expected string"]
+    assert validate({"definitions": {}}, DEFINITIONS_SCHEMA) == ["$.definitions: expected array"]
+    try:
+        parse_llm_json("抱歉，我无法完成这个任务。")
+        raise AssertionError("expected JSONDecodeError")
+    except json.JSONDecodeError:
+        pass
+    print("LLM JSON Tests Completed.")
@@ -0,0 +1,377 @@
+# llm_standin.py
+"""
+Local stand-in for the OpenRouter chat-completions endpoint, for benchmarking
+and load-testing the real transport without network access or an API key:
+
+    python llm_standin.py --serve --port 8765 --latency lognormal:800:0.5 --per-token-ms 5 --error-429 0.05
+
+then point api_config.json at it ("api_url": "http://127.0.0.1:8765/api/v1/chat/completions")
+and set OPENROUTER_API_KEY to any value.
+
+Responses come from a scripted/recorded JSONL file keyed by prompt hash when
+one matches, otherwise they are synthesised from the prompt: definition prompts
+get definitions whose spans really match the page (rule-based segmentation),
+modification prompts get a small edit of the first element with an id.
+A request whose messages include an assistant message (a continuation after
+finish_reason "length") gets the rest of the same content after that partial
+output, prefixed with the <anchor>...</anchor> text its last message asks to repeat.
+"""
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+
+from dom_utils import parse_element_spans
+from heuristic_segmenter import segment_html
+from token_estimator import estimate_tokens
+
+_DEFINITION_HTML_RE = re.compile(r"HTML代码：\n(.*)\n\nJSON输出", re.DOTALL)
+_MODIFICATION_HTML_RE = re.compile(r"```html\n(.*?)\n```", re.DOTALL)
+_TARGET_HINT_RE = re.compile(r"目标模块是: ([\w-]+)")
+_INSTRUCTION_RE = re.compile(r"之前的修改指令 \((.*)\) 来执行任务", re.DOTALL)
+_ANCHOR_RE = re.compile(r"<anchor>(.*)</anchor>", re.DOTALL)
+
+
+def _truncate_to_tokens(text, max_tokens):
+    """Longest prefix of text whose estimate_tokens() is within max_tokens."""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class LatencyModel:
+    """
+    Response latency = a base delay drawn from a distribution plus per_token_ms
+    for every completion token. Distributions: "fixed:<ms>", "uniform:<min_ms>:<max_ms>",
+    "lognormal:<median_ms>:<sigma>".
+    """
+
+    def __init__(self, spec="fixed:0", per_token_ms=0.0):
+        kind, *params = spec.split(":")
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution '{spec}'")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        self.per_token_ms = per_token_ms
+
+    def base_ms(self, rng):
+        if self.kind == "fixed":
+            return self.params[0] if self.params else 0.0
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[1])
+        return self.params[0] * math.exp(rng.gauss(0.0, self.params[1]))
+
+
+def load_scripted_responses(path):
+    """
+    JSONL file of {"prompt_sha256": ..., "content": ...} (optionally "finish_reason",
+    "latency_ms"), or {"contains": <substring>, "content": ...} for hand-written
+    scripts. Returns (by_hash, substring_rules).
+    """
+    by_hash, rules = {}, []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                logging.warning(f"{path}:{line_number}: skipped malformed line ({e})")
+                continue
+            if "prompt_sha256" in entry:
+                by_hash[entry["prompt_sha256"]] = entry
+            elif "contains" in entry:
+                rules.append(entry)
+    return by_hash, rules
+
+
+def synthesise_content(prompt):
+    """Plausible JSON content for the app's definition and modification prompts."""
+    match = _DEFINITION_HTML_RE.search(prompt)
+    if match:
+        html = match.group(1)
+        definitions, _ = segment_html(html)
+        if not definitions: # No rule matched: every top-level element inside <body>
+            elements = parse_element_spans(html)
+            body = next((e["index"] for e in elements if e["tag"] == "body"), None)
+            definitions = [
+                {"id": f"block_{i}", "description": f"区块 {i}", "start_char": e["start"], "end_char": e["end"]}
+                for i, e in enumerate((e for e in elements if e["parent"] == body), 1)
+            ]
+        return json.dumps({"definitions": [
+            {"id": d["id"], "description": d["description"], "start_char": d["start_char"], "end_char": d["end_char"],
+             "start_comment": f"LLM_MODULE_START: {d['id']}", "end_comment": f"LLM_MODULE_END: {d['id']}"}
+            for d in definitions
+        ]}, ensure_ascii=False)
+
+    match = _MODIFICATION_HTML_RE.search(prompt)
+    if match:
+        html = match.group(1)
+        element = next((e for e in parse_element_spans(html) if e["attrs"].get("id")), None)
+        instruction = _INSTRUCTION_RE.search(prompt)
+        hint = _TARGET_HINT_RE.search(prompt)
+        if element is None:
+            new_html, module_id = html, hint.group(1) if hint else "page"
+        else:
+            original = html[element["start"]:element["end"]]
+            insert_at = original.index(">")
+            new_html = original[:insert_at] + ' data-modified="standin"' + original[insert_at:]
+            module_id = hint.group(1) if hint else element["attrs"]["id"]
+        return json.dumps({
+            "status": "success",
+            "message": "修改完成。",
+            "modules": [{"id": module_id, "description": "替身服务器选中的模块"}],
+            "modification_manual": f"替换模块 {module_id} 的 HTML（指令：{instruction.group(1) if instruction else ''}）。",
+            "modified_code": {"html": new_html, "css": "", "js": ""},
+        }, ensure_ascii=False)
+
+    return json.dumps({"status": "success", "message": "ok"}, ensure_ascii=False)
+
+
+class StandinStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.counts[key] = self.counts.get(key, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+def run_llm_standin(host="127.0.0.1", port=8765, latency="fixed:0", per_token_ms=0.0,
+                    error_429_rate=0.0, error_5xx_rate=0.0, responses_path=None, seed=None, stream_chunk_tokens=16):
+    """
+    OpenRouter-compatible POST .../chat/completions (JSON or SSE when the payload
+    has "stream": true) plus GET /stats with request, error and token counters.
+    max_tokens is honoured: longer content is cut and finish_reason is "length".
+    Returns the server; call serve_forever() (e.g. in a thread) and shutdown().
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    latency_model = LatencyModel(latency, per_token_ms)
+    by_hash, rules = load_scripted_responses(responses_path) if responses_path else ({}, [])
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    stats = StandinStats()
+
+    def draw():
+        with rng_lock:
+            return rng.random(), latency_model.base_ms(rng)
+
+    class StandinHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                self._send_json(200, stats.snapshot())
+            else:
+                self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+                return
+            try:
+                payload = json.loads(body or b"{}")
+                messages = payload.get("messages", [])
+                billed_prompt = prompt = "\n".join(m.get("content", "") for m in messages)
+                continued = "".join(m.get("content", "") for m in messages if m.get("role") == "assistant")
+                anchor = ""
+                if continued: # Continuation request: answer the original prompt from where the partial output stopped
+                    prompt = messages[0].get("content", "")
+                    anchor_match = _ANCHOR_RE.search(messages[-1].get("content", ""))
+                    anchor = anchor_match.group(1) if anchor_match else ""
+            except (json.JSONDecodeError, AttributeError, TypeError) as e:
+                self._send_json(400, {"error": {"code": 400, "message": f"invalid payload: {e}"}})
+                return
+
+            stats.add(requests=1)
+            roll, base_ms = draw()
+            if roll < error_429_rate:
+                stats.add(injected_429=1)
+                self._send_json(429, {"error": {"code": 429, "message": "Rate limit exceeded (injected)"}}, {"Retry-After": "1"})
+                return
+            if roll < error_429_rate + error_5xx_rate:
+                status = (500, 502, 503)[int(roll * 1000) % 3]
+                stats.add(injected_5xx=1)
+                time.sleep(base_ms / 1000)
+                self._send_json(status, {"error": {"code": status, "message": "Upstream error (injected)"}})
+                return
+
+            key = prompt_hash(prompt)
+            scripted = by_hash.get(key) or next((r for r in rules if r["contains"] in prompt), None)
+            content = scripted["content"] if scripted else synthesise_content(prompt)
+            finish_reason = scripted.get("finish_reason", "stop") if scripted else "stop"
+            if scripted and "latency_ms" in scripted:
+                base_ms = scripted["latency_ms"]
+            stats.add(scripted=1 if scripted else 0, synthesised=0 if scripted else 1)
+
+            if continued and content.startswith(continued):
+                content = anchor + content[len(continued):]
+            completion_tokens = estimate_tokens(content)
+            max_tokens = payload.get("max_tokens")
+            if max_tokens and completion_tokens > max_tokens:
+                content = _truncate_to_tokens(content, max_tokens)
+                completion_tokens, finish_reason = estimate_tokens(content), "length"
+            prompt_tokens = estimate_tokens(billed_prompt)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            stats.add(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            response_id = f"gen-standin-{uuid.uuid4().hex[:16]}"
+            model = payload.get("model", "standin")
+
+            if payload.get("stream"):
+                self._stream(response_id, model, content, finish_reason, usage, base_ms)
+                return
+            time.sleep((base_ms + latency_model.per_token_ms * completion_tokens) / 1000)
+            self._send_json(200, {
+                "id": response_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+        def _stream(self, response_id, model, content, finish_reason, usage, base_ms):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def event(delta, finish=None, extra=None):
+                chunk = {"id": response_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **(extra or {})}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            time.sleep(base_ms / 1000) # Time to first token
+            piece_chars = max(1, stream_chunk_tokens * 4)
+            for i in range(0, len(content), piece_chars):
+                piece = content[i:i + piece_chars]
+                time.sleep(latency_model.per_token_ms * estimate_tokens(piece) / 1000)
+                event({"role": "assistant", "content": piece} if i == 0 else {"content": piece})
+            event({}, finish_reason, {"usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            stats.add(streamed=1)
+
+        def log_message(self, format, *args):
+            logging.debug("llm stand-in: " + format % args)
+
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.stats = stats
+    logging.info(f"LLM stand-in listening on http://{host}:{server.server_address[1]}/api/v1/chat/completions "
+                 f"(latency {latency} + {per_token_ms} ms/token, 429 rate {error_429_rate}, 5xx rate {error_5xx_rate}, "
+                 f"{len(by_hash) + len(rules)} scripted responses)")
+    return server
+
+
+if __name__ == '__main__':
+    import argparse
+    import urllib.error
+    import urllib.request
+
+    parser = argparse.ArgumentParser(description="Local OpenRouter-compatible LLM stand-in.")
+    parser.add_argument("--serve", action="store_true", help="Run the stand-in server (otherwise run the self-test).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0", help="fixed:<ms> | uniform:<min>:<max> | lognormal:<median>:<sigma>")
+    parser.add_argument("--per-token-ms", type=float, default=0.0)
+    parser.add_argument("--error-429", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="Fraction of requests answered with 500/502/503.")
+    parser.add_argument("--responses", help="JSONL of scripted/recorded responses keyed by prompt_sha256.")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.serve:
+        run_llm_standin(args.host, args.port, args.latency, args.per_token_ms, args.error_429, args.error_5xx,
+                        args.responses, args.seed).serve_forever()
+    else:
+        from llm_handler import PROMPT_TEMPLATE_DEFINITION
+
+        server = run_llm_standin(port=0, latency="uniform:5:15", per_token_ms=0.01, error_429_rate=0.2, seed=7)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions"
+
+        def post(payload):
+            request = urllib.request.Request(url, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    return response.status, response.read().decode("utf-8")
+            except urllib.error.HTTPError as e:
+                return e.code, e.read().decode("utf-8")
+
+        page = ('<html><body><header><h1>论文解读：注意力机制</h1></header>'
+                '<div class="animation-container" id="anim-container-1"><h3>动画 1</h3><div id="anim1-box"></div></div>'
+                '<footer><p>版权所有 2025</p></footer></body></html>')
+        prompt = PROMPT_TEMPLATE_DEFINITION.format(raw_html_code=page)
+        statuses = []
+        for _ in range(20):
+            status, text = post({"model": "m", "messages": [{"role": "user", "content": prompt}]})
+            statuses.append(status)
+        print("statuses:", statuses)
+        assert 429 in statuses and 200 in statuses
+        body = json.loads(text if status == 200 else post({"model": "m", "messages": [{"role": "user", "content": prompt}]})[1])
+        definitions = json.loads(body["choices"][0]["message"]["content"])["definitions"]
+        for d in definitions:
+            print(d["id"], repr(page[d["start_char"]:d["end_char"]]))
+        assert page[definitions[-1]["start_char"]:definitions[-1]["end_char"]] == "<footer><p>版权所有 2025</p></footer>"
+        assert body["usage"]["prompt_tokens"] == estimate_tokens(prompt)
+
+        while True: # Streaming, with max_tokens cutting the content short
+            status, text = post({"model": "m", "stream": True, "max_tokens": 20, "messages": [{"role": "user", "content": prompt}]})
+            if status == 200:
+                break
+        events = [json.loads(line[6:]) for line in text.split("\n\n") if line.startswith("data: {")]
+        streamed = "".join(e["choices"][0]["delta"].get("content", "") for e in events)
+        assert text.rstrip().endswith("data: [DONE]") and events[-1]["choices"][0]["finish_reason"] == "length"
+        assert estimate_tokens(streamed) == events[-1]["usage"]["completion_tokens"] <= 20
+        full_content = body["choices"][0]["message"]["content"]
+        while True: # A continuation request (partial output as an assistant message) gets the rest
+            status, text = post({"model": "m", "messages": [{"role": "user", "content": prompt}, {"role": "assistant", "content": streamed},
+                                                             {"role": "user", "content": "继续"}]})
+            if status == 200:
+                break
+        assert streamed + json.loads(text)["choices"][0]["message"]["content"] == full_content
+        while True: # ... repeating the anchor it was asked to echo first
+            status, text = post({"model": "m", "messages": [{"role": "user", "content": prompt}, {"role": "assistant", "content": streamed},
+                                                             {"role": "user", "content": f"继续 <anchor>{streamed[-10:]}</anchor>"}]})
+            if status == 200:
+                break
+        assert streamed[:-10] + json.loads(text)["choices"][0]["message"]["content"] == full_content
+        print("stats:", server.stats.snapshot())
+        server.shutdown()
+        print("\nLLM Stand-in Tests Completed.")
@@ -1,7 +1,11 @@
 import webview
 import json
 import os
+import hashlib
+import sqlite3
 import logging
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
 
 # New modular imports
@@ -13,18 +17,44 @@ from html_utils import (
     integrate_final_code
 )
 from llm_handler import LLMHandler, PROMPT_TEMPLATE_BASE_MODIFICATION # For frontend display
+from tracing import configure_tracer
+from session_store import SessionStore, new_session_id
+from bridge_transfer import TransferStore
+from version_store import VersionStore
+from module_library import ModuleLibrary, normalised_fingerprint
+from module_pack import PackFormatError
+from modification_memo import ModificationMemo
+from search_index import ModuleSearchIndex, code_identifiers
+from module_targeting import ModuleTargeter
+from dependency_graph import DependencyGraph, format_symbol
+from page_clustering import define_modules_for_pages
+from heuristic_segmenter import segment_html, merge_refined_definitions, validate_segment_rules
+from definition_cache import DefinitionCache
+from dom_utils import splice_elements
+from memory_profiler import MemoryProfiler
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 load_dotenv()
 
+COST_ESTIMATE_MEMO_PAGES = 8 # Pages whose pre-flight estimates are kept (estimate_analysis_cost)
+
 class Api:
     def __init__(self):
         self.raw_original_html_content = "" # The very first HTML input by user
         self.html_content_with_markers = "" # HTML after LLM defs and marker insertion
         self.html_skeleton = ""
         self.api_config = load_api_config("api_config.json") # Uses new loader
+        self.tracer = configure_tracer(self.api_config) # Per-stage spans; no-op unless trace_enabled
+        self.memory_profiler = None # tracemalloc snapshots around every traced stage, when enabled
+        if self.api_config.get("memory_profile_enabled", False):
+            self.memory_profiler = MemoryProfiler(
+                snapshot_depth=self.api_config.get("memory_profile_snapshot_depth", 1),
+                top_sites=self.api_config.get("memory_profile_top_sites", 10),
+                report_file=self.api_config.get("memory_profile_file", "")
+            )
+            self.memory_profiler.attach(self.tracer)
         
         # Initialize LLMHandler
         self.llm_handler = LLMHandler(
@@ -37,68 +67,379 @@ class Api:
         self.llm_defined_modules = [] # Stores {id, description, start_char, end_char, start_comment, end_comment, original_content}
         self.llm_modification_results = {} # Stores {module_id (if targeted): {"modified_code": {...}, "modification_manual": "...", "affected_modules_by_llm": []}}
                                            # Or a general structure if not module-specific: {"modified_code": {...}, "modification_manual": "..."}
+        self.user_edited_modules = {} # Last user edits received from the frontend, kept for session snapshots
+        self.version_store = None # Edit history for the current analysis; revision 0 holds the original modules
+        self.dependency_graph = None # Ids/classes/functions each module defines and uses, linked across modules
+        self.integration_warnings = [] # Broken cross-module references found by the last integration
+        self.definitions_source = "" # "cache", "library", "heuristic" or "llm"
+        self.definition_refinement = {"status": "none"} # Background LLM pass over heuristic definitions
+        # Guards the analysis state (modules, edits, versions, search index) shared with the refinement thread
+        self._state_lock = threading.RLock()
+        self._analysis_generation = 0 # Bumped by every analysis or restore; stale background results are dropped
+        self._cost_estimates = OrderedDict() # Page SHA-256 -> {"definitions": ..., "modifications": {instruction: ...}}
+        self.segment_rules = validate_segment_rules(self.api_config.get("heuristic_segment_rules")) # None: built-in rules
+
+        # Session snapshots let a restarted app resume without paying for the LLM calls again
+        self.session_id = None
+        self.session_store = None
+        if self.api_config.get("session_snapshot_enabled", True):
+            self.session_store = SessionStore(self.api_config.get("session_dir", "sessions"))
+
+        # Definition responses keyed by the canonical (formatting-insensitive) page, reused for re-saved pages
+        self.definition_cache = None
+        if self.api_config.get("definition_cache_enabled", True):
+            self.definition_cache = DefinitionCache(self.api_config.get("definition_cache_dir", "definition_cache"))
+
+        # Library of previously analysed modules, checked before paying for a definition call
+        self.module_library = None
+        if self.api_config.get("module_library_enabled", True):
+            try:
+                self.module_library = ModuleLibrary(self.api_config.get("module_library_dir", "module_library"))
+            except (OSError, sqlite3.Error) as e:
+                logging.error(f"Module library unavailable, continuing without it: {e}")
+        if self.module_library:
+            for pack_path in self.api_config.get("module_library_packs", []):
+                try:
+                    self.module_library.attach_pack(pack_path)
+                except (OSError, PackFormatError) as e:
+                    logging.error(f"Module pack '{pack_path}' could not be attached: {e}")
+        self.modification_memo = None
+        if self.module_library and self.api_config.get("modification_memo_enabled", True):
+            self.modification_memo = ModificationMemo(
+                self.module_library,
+                instruction_threshold=self.api_config.get("modification_memo_instruction_threshold", 0.85),
+                module_threshold=self.api_config.get("module_library_similarity_threshold", 0.8)
+            )
+
+        # BM25 index over the current page's modules ("page:<id>") and, once first searched, the library ("lib:<fingerprint>")
+        self.search_index = ModuleSearchIndex()
+        self._indexed_page_keys = []
+        self._library_indexed = False
+
+        # Large strings cross the pywebview bridge as chunked (optionally compressed) transfers
+        self.transfer_store = TransferStore(
+            chunk_size=self.api_config.get("bridge_chunk_size_bytes", 256 * 1024),
+            inline_limit=self.api_config.get("bridge_inline_limit_bytes", 512 * 1024),
+            compress=self.api_config.get("bridge_compress", True)
+        )
+
+    def _lookup_definition_cache(self, raw_html):
+        """
+        Step 1 (cache): definitions the LLM made for this page or a re-saved copy of it
+        (whitespace, attribute order and comments ignored), with spans mapped onto raw_html.
+        Returns a get_module_definitions()-style response, or None.
+        """
+        if not self.definition_cache:
+            return None
+        with self.tracer.span("analyze.definition_cache") as span:
+            definitions = self.definition_cache.lookup(raw_html)
+            span.set_attribute("cache", "hit" if definitions else "miss")
+        if not definitions:
+            return None
+        return {"status": "success", "message": "模块定义来自定义缓存。", "definitions": definitions}
+
+    def _store_definition_cache(self, raw_html, definition_response):
+        # Mock responses (no API key) are placeholders and must not be reused
+        if self.definition_cache and self.llm_handler.openrouter_api_key and definition_response["status"] == "success":
+            with self._state_lock: # Also reached from the refinement thread while an analysis may be running
+                self.definition_cache.store(raw_html, definition_response["definitions"], model=self.api_config.get("default_model", ""))
+                self._cost_estimates.clear() # Memoised estimates may have priced a definition call that is now cached
+
+    def _define_modules_with_llm(self, raw_html):
+        """get_module_definitions() behind the definition cache."""
+        response = self._lookup_definition_cache(raw_html)
+        if response is None:
+            response = self.llm_handler.get_module_definitions(raw_html)
+            self._store_definition_cache(raw_html, response)
+        return response
+
+    def _match_module_library(self):
+        """
+        Step 1 (library): fingerprints the page's DOM subtrees against the module library.
+        Returns (response, matches): a get_module_definitions()-style response when known
+        modules cover (nearly) all of the page, otherwise None and the partial matches
+        for the rule-based step to merge.
+        """
+        if not self.module_library:
+            return None, []
+        with self.tracer.span("analyze.match_module_library") as span:
+            definitions, coverage = self.module_library.match_page(
+                self.raw_original_html_content,
+                similarity_threshold=self.api_config.get("module_library_similarity_threshold", 0.8),
+                max_page_chars_for_similarity=self.api_config.get("module_library_similarity_max_page_chars", 300_000)
+            )
+            span.set_attributes(matches=len(definitions), coverage=round(coverage, 3))
+        min_coverage = self.api_config.get("module_library_min_coverage", 0.9)
+        if definitions and coverage >= min_coverage:
+            logging.info(f"Step 1: Reusing {len(definitions)} module definitions from the library (coverage {coverage:.0%}); skipping LLM.")
+            return {"status": "success", "message": "模块定义来自模块库。", "definitions": definitions}, definitions
+        if definitions:
+            logging.info(f"Module library matched {len(definitions)} modules but coverage {coverage:.0%} < {min_coverage:.0%}; "
+                         f"merging them into rule-based segmentation.")
+        return None, definitions
+
+    def _segment_heuristically(self, library_definitions=None):
+        """
+        Step 1 (rules): deterministic segmentation of obvious modules (header, nav, footer,
+        section[id], .animation-container, ...), with partial module library matches filling
+        what the rules leave uncovered. Returns a get_module_definitions()-style response when
+        together they cover enough of the page to skip the LLM, otherwise None.
+        """
+        if not self.api_config.get("heuristic_segmenter_enabled", True):
+            return None
+        with self.tracer.span("analyze.heuristic_segment") as span:
+            definitions, coverage = segment_html(self.raw_original_html_content, rules=self.segment_rules,
+                                                 extra_definitions=library_definitions)
+            span.set_attribute("modules", len(definitions))
+            span.set_attribute("coverage", round(coverage, 3))
+        min_coverage = self.api_config.get("heuristic_segmenter_min_coverage", 0.6)
+        if definitions and coverage >= min_coverage:
+            logging.info(f"Step 1: Rule-based segmentation found {len(definitions)} modules (coverage {coverage:.0%}); skipping LLM.")
+            return {"status": "success", "message": "模块定义来自规则分段。", "definitions": definitions}
+        logging.info(f"Rule-based segmentation coverage {coverage:.0%} < {min_coverage:.0%}; calling LLM.")
+        return None
+
+    def _start_definition_refinement(self):
+        self.definition_refinement = {"status": "pending", "session_id": self.session_id}
+        threading.Thread(
+            target=self._refine_heuristic_definitions,
+            args=(self._analysis_generation, self.session_id, self.raw_original_html_content,
+                  [dict(m) for m in self.llm_defined_modules]),
+            daemon=True
+        ).start()
+
+    def _refine_heuristic_definitions(self, generation, session_id, raw_html, heuristic_modules):
+        """
+        Background LLM definition pass for a page segmented by rules. Module ids and spans
+        stay as they are (the user may already be editing); the LLM only relabels modules
+        whose span it agrees with, and its other modules are offered as suggestions.
+        The result is dropped if another analysis or restore happened in the meantime.
+        """
+        with self.tracer.span("analyze.refine_definitions") as span:
+            response = self._define_modules_with_llm(raw_html)
+            span.set_attribute("result", response["status"])
+        if response["status"] == "success":
+            descriptions, additions = merge_refined_definitions(heuristic_modules, response["definitions"], raw_html)
+            if self.module_library:
+                _, llm_modules = self._extract_defined_modules(raw_html, [dict(d) for d in response["definitions"]])
+                self.module_library.add_modules(llm_modules)
+        with self._state_lock:
+            if self._analysis_generation != generation:
+                logging.info(f"Definition refinement for session {session_id} finished after a new analysis started; discarded.")
+                return
+            if response["status"] != "success":
+                self.definition_refinement = {"status": "error", "session_id": session_id, "message": response["message"]}
+                return
+            for module in self.llm_defined_modules:
+                if module["id"] in descriptions:
+                    module["description"] = descriptions[module["id"]]
+            self._index_page_modules()
+            self.definition_refinement = {
+                "status": "done",
+                "session_id": session_id,
+                "relabelled": descriptions,
+                "suggested_definitions": [
+                    {k: d.get(k) for k in ("id", "description", "start_char", "end_char")} for d in additions
+                ]
+            }
+            logging.info(f"Definition refinement: {len(descriptions)} modules relabelled, {len(additions)} additional modules suggested.")
+            self._save_session_snapshot("refined")
+
+    def get_definition_refinement(self):
+        """State of the background LLM pass over rule-based definitions; when done, includes the updated module list."""
+        with self._state_lock:
+            refinement = dict(self.definition_refinement)
+            if refinement["status"] == "done":
+                refinement["active_module_definitions"] = self._build_analysis_response("", {}, "")["active_module_definitions"]
+        return refinement
+
+    def _find_reference_edits(self, limit=2):
+        """Prior successful edits on this page's modules (or near-duplicates) to seed the modification prompt."""
+        if not self.module_library:
+            return []
+        threshold = self.api_config.get("module_library_similarity_threshold", 0.8)
+        with self.tracer.span("analyze.find_reference_edits"):
+            edits = []
+            for module in self.llm_defined_modules:
+                edits.extend(self.module_library.prior_edits(module["original_content"], threshold=threshold, limit=limit))
+        edits.sort(key=lambda e: e["similarity"], reverse=True)
+        return edits[:limit]
+
+    def _lookup_modification_memo(self, instruction, local_target_id):
+        """
+        Step 5 (memo): returns a get_code_modification()-style success result built from a
+        prior modification with the same (or a near) instruction on this or a similar module,
+        or None on a miss. Only the module local targeting picked is considered, so without a
+        clear local target the instruction always goes to the LLM.
+        """
+        if not self.modification_memo:
+            return None
+        module = next((m for m in self.llm_defined_modules if m["id"] == local_target_id), None)
+        if module is None:
+            logging.info("Modification memo not consulted: no clear local target for the instruction.")
+            return None
+        with self.tracer.span("analyze.lookup_modification_memo") as span:
+            hit = self.modification_memo.lookup(instruction, [module])
+            span.set_attribute("cache", hit["match"] if hit else "miss")
+        if not hit:
+            return None
+        logging.info(f"Step 5: Reusing memoised modification ({hit['match']} match) for module '{hit['module_id']}'; skipping LLM.")
+        return {
+            "status": "success",
+            "message": f"复用了先前的修改结果 ({'精确' if hit['match'] == 'exact' else '近似'}匹配, 相似度 {hit['similarity']})。",
+            "modified_code": hit["modified_code"],
+            "modification_manual": hit["modification_manual"],
+            "affected_modules_by_llm": [{"id": module["id"], "description": module["description"]}],
+            "memo_match": hit["match"]
+        }
+
+    def _record_successful_edit(self, instruction, modification_result):
+        """Stores a successful modification against its target module so similar modules can reuse it."""
+        if not self.modification_memo:
+            return
+        target_id = self._resolve_modification_target(instruction, modification_result)
+        module = next((m for m in self.llm_defined_modules if m["id"] == target_id), None)
+        if module is None:
+            logging.debug(f"Successful edit not recorded in module library: target '{target_id}' is not a defined module.")
+            return
+        self.modification_memo.record(
+            instruction, module,
+            modification_result.get("modified_code", {}), modification_result.get("modification_manual", "")
+        )
+
+    def _target_module_locally(self, instruction, extra_text=""):
+        """Ranks llm_defined_modules against the instruction without an LLM call. Returns a module id or None."""
+        if not self.api_config.get("local_targeting_enabled", True) or not self.llm_defined_modules:
+            return None
+        with self.tracer.span("analyze.local_targeting") as span:
+            target_id = ModuleTargeter(self.llm_defined_modules).pick_target(
+                instruction, extra_text, min_confidence=self.api_config.get("local_targeting_min_confidence", 0.6)
+            )
+            span.set_attribute("target", target_id or "")
+        return target_id
+
+    def _build_dependency_graph(self):
+        with self.tracer.span("analyze.dependency_graph", modules=len(self.llm_defined_modules)):
+            self.dependency_graph = DependencyGraph.build(self.llm_defined_modules, page_html=self.html_skeleton)
+
+    def _modification_context_modules(self, target_id):
+        """
+        The target module followed by its dependency closure (modules it uses or that use it), in page order.
+        Page-level CSS/JS outside every module comes from dependency_graph.page_blocks().
+        """
+        if not target_id:
+            return []
+        closure = self.dependency_graph.closure([target_id]) if self.dependency_graph else {target_id}
+        target = [m for m in self.llm_defined_modules if m["id"] == target_id]
+        return target + [m for m in self.llm_defined_modules if m["id"] in closure and m["id"] != target_id]
+
+    def _resolve_modification_target(self, instruction, modification_result):
+        """
+        The module a modification belongs to: the LLM's first affected module if it is a
+        defined module, else the local target chosen before the call, else a local ranking
+        of the instruction plus the code the LLM returned.
+        """
+        known_ids = {m["id"] for m in self.llm_defined_modules}
+        affected = modification_result.get("affected_modules_by_llm") or []
+        first = affected[0] if affected and isinstance(affected[0], dict) else {}
+        if first.get("id") in known_ids:
+            return first["id"]
+        if modification_result.get("local_target_id") in known_ids:
+            logging.info(f"LLM target '{first.get('id')}' is not a defined module; using local target '{modification_result['local_target_id']}'.")
+            return modification_result["local_target_id"]
+        modified_html = (modification_result.get("modified_code") or {}).get("html", "")
+        return self._target_module_locally(instruction, f"{first.get('html', '')} {modified_html}")
+
+    def _save_session_snapshot(self, stage):
+        """Writes the current analysis state to disk. Called after each pipeline stage."""
+        if not self.session_store or not self.session_id:
+            return
+        with self.tracer.span("session.save_snapshot", stage=stage):
+            self.session_store.save(self.session_id, stage, {
+                "raw_original_html_content": self.raw_original_html_content,
+                "html_skeleton": self.html_skeleton,
+                "llm_defined_modules": self.llm_defined_modules,
+                "llm_modification_results": self.llm_modification_results,
+                "user_edited_modules": self.user_edited_modules
+            })
 
 
     def analyze_html(self, original_code_from_frontend, specific_instruction=""):
+        with self.tracer.span("analyze_html", has_instruction=bool(specific_instruction)) as span, self._state_lock:
+            result = self._analyze_html(original_code_from_frontend, specific_instruction)
+            span.set_attributes(
+                status=result.get("status"),
+                html_bytes=len(self.raw_original_html_content.encode("utf-8")),
+                module_count=len(self.llm_defined_modules)
+            )
+        if self.memory_profiler:
+            self.memory_profiler.record_retained(self, "analyze_html")
+        return result
+
+    def _analyze_html(self, original_code_from_frontend, specific_instruction=""):
         logging.info("Python API: analyze_html called.")
         self.raw_original_html_content = original_code_from_frontend.strip() if original_code_from_frontend else ""
 
         if not self.raw_original_html_content:
             return {"status": "error", "message": "无效或空HTML", "active_module_definitions": [], 
-                    "html_skeleton": "", "modified_code": {}, "modification_manual": ""}
+                    "has_html_skeleton": False, "modified_code": {}, "modification_manual": ""}
 
         # Reset state for new analysis
+        self._analysis_generation += 1
         self.html_content_with_markers = ""
         self.html_skeleton = ""
         self.llm_defined_modules = []
         self.llm_modification_results = {}
+        self.user_edited_modules = {}
+        self.version_store = None
+        self.dependency_graph = None
+        self.integration_warnings = []
+        self.session_id = new_session_id(self.raw_original_html_content)
 
-        # 1. Get module definitions from LLM
-        logging.info("Step 1: Getting module definitions from LLM.")
-        definition_response = self.llm_handler.get_module_definitions(self.raw_original_html_content)
+        # 1. Get module definitions: definition cache, module library, rule-based segmentation, then LLM
+        self.definitions_source = "cache"
+        self.definition_refinement = {"status": "none"}
+        definition_response = self._lookup_definition_cache(self.raw_original_html_content)
+        library_definitions = []
+        if definition_response is None:
+            self.definitions_source = "library"
+            definition_response, library_definitions = self._match_module_library()
+        if definition_response is None:
+            self.definitions_source = "heuristic"
+            definition_response = self._segment_heuristically(library_definitions)
+        if definition_response is None:
+            self.definitions_source = "llm"
+            logging.info("Step 1: Getting module definitions from LLM.")
+            with self.tracer.span("analyze.get_module_definitions"):
+                definition_response = self.llm_handler.get_module_definitions(self.raw_original_html_content)
+            self._store_definition_cache(self.raw_original_html_content, definition_response)
 
         if definition_response["status"] != "success":
             return {"status": "error", "message": f"LLM未能定义模块: {definition_response['message']}",
-                    "active_module_definitions": [], "html_skeleton": "", "modified_code": {}, "modification_manual": ""}
+                    "active_module_definitions": [], "has_html_skeleton": False, "modified_code": {}, "modification_manual": ""}
         
         raw_definitions_from_llm = definition_response["definitions"]
         if not raw_definitions_from_llm:
             return {"status": "warning", "message": "LLM未识别出任何模块定义。",
-                    "active_module_definitions": [], "html_skeleton": self.raw_original_html_content, # Return raw if no defs
+                    "active_module_definitions": [], "has_html_skeleton": False,
                      "modified_code": {}, "modification_manual": ""}
 
-        # 2. Add markers to HTML based on LLM definitions
-        logging.info("Step 2: Adding markers to HTML.")
-        self.html_content_with_markers = add_markers_to_html(self.raw_original_html_content, raw_definitions_from_llm)
-        if not self.html_content_with_markers: # Should not happen if raw_original_html_content exists
-             self.html_content_with_markers = self.raw_original_html_content # Fallback
-             logging.warning("add_markers_to_html returned empty, using raw HTML for marked content.")
-
-
-        # 3. Extract original content for each module and store definitions
-        logging.info("Step 3: Extracting original content for each module.")
-        temp_processed_definitions = []
-        for module_def_llm in raw_definitions_from_llm:
-            # Ensure the id from the comment matches the module id for consistency
-            if module_def_llm.get("id") not in module_def_llm.get("start_comment", ""):
-                logging.warning(f"Mismatch between module ID '{module_def_llm.get('id')}' and start_comment '{module_def_llm.get('start_comment')}'. Fixing comment for internal use.")
-                module_def_llm["start_comment"] = f"LLM_MODULE_START: {module_def_llm.get('id')}"
-                module_def_llm["end_comment"] = f"LLM_MODULE_END: {module_def_llm.get('id')}"
-
-            content = extract_module_content_by_markers(self.html_content_with_markers, module_def_llm)
-            if content is not None:
-                temp_processed_definitions.append({**module_def_llm, "original_content": content.strip()})
-                logging.debug(f"  Module '{module_def_llm.get('id')}': Original Content (first 100 chars): '{content.strip()[:100]}'")
-            else:
-                logging.warning(f"Could not extract original content for module ID: {module_def_llm.get('id')}. It will be excluded from active definitions for frontend.")
-        
-        self.llm_defined_modules = temp_processed_definitions
+        # 2./3. Add markers to HTML and extract each module's original content
+        self.html_content_with_markers, self.llm_defined_modules = self._extract_defined_modules(
+            self.raw_original_html_content, raw_definitions_from_llm
+        )
         logging.info(f"Processed {len(self.llm_defined_modules)} modules and stored with their original content.")
 
         if not self.llm_defined_modules: # If all extractions failed
              return {"status": "warning", "message": "LLM定义了模块，但无法从中提取内容。",
-                    "active_module_definitions": [], "html_skeleton": self.raw_original_html_content,
+                    "active_module_definitions": [], "has_html_skeleton": False,
                      "modified_code": {}, "modification_manual": ""}
+        self._save_session_snapshot("definitions") # The paid definition call is now safe on disk
+        if self.module_library and self.definitions_source == "llm":
+            with self.tracer.span("analyze.record_module_library"):
+                self.module_library.add_modules(self.llm_defined_modules)
+        self._index_page_modules()
+        self._reset_version_store()
 
 
         # 4. Generate HTML skeleton
@@ -108,6 +449,10 @@ class Api:
             logging.error("Failed to generate HTML skeleton. This is unexpected if markers were added.")
             # Fallback or error, for now, let's allow proceeding if some modules are defined.
             # The frontend might not be able to integrate if skeleton is missing.
+        self._build_dependency_graph()
+        self._save_session_snapshot("skeleton")
+        if self.definitions_source == "heuristic" and self.api_config.get("heuristic_refine_async", True):
+            self._start_definition_refinement()
 
         # 5. Handle specific modification instruction if provided
         modified_code_for_response = {}
@@ -115,12 +460,29 @@ class Api:
 
         if specific_instruction:
             logging.info(f"Step 5: Processing specific instruction with LLM: {specific_instruction}")
-            modification_call_result = self.llm_handler.get_code_modification(
-                self.raw_original_html_content, # Pass the original clean HTML for modification context
-                specific_instruction
-            )
-            
+            local_target_id = self._target_module_locally(specific_instruction)
+            modification_call_result = self._lookup_modification_memo(specific_instruction, local_target_id)
+            memo_hit = modification_call_result is not None
+            if not memo_hit:
+                target_modules = self._modification_context_modules(local_target_id)
+                scoped = bool(target_modules) and self.api_config.get("scoped_modification_prompt", True)
+                page_blocks = self.dependency_graph.page_blocks([m["id"] for m in target_modules]) if self.dependency_graph else []
+                reference_edits = self._find_reference_edits()
+                with self.tracer.span("analyze.get_code_modification", reference_edits=len(reference_edits), scoped=scoped,
+                                      page_blocks=len(page_blocks)):
+                    modification_call_result = self.llm_handler.get_code_modification(
+                        self.raw_original_html_content, # Pass the original clean HTML for modification context
+                        specific_instruction,
+                        reference_edits=reference_edits,
+                        target_modules=target_modules,
+                        scoped=scoped,
+                        page_blocks=page_blocks
+                    )
+                if modification_call_result["status"] == "success":
+                    modification_call_result["local_target_id"] = local_target_id
+
             if modification_call_result["status"] == "success":
+                modification_call_result["instruction"] = specific_instruction # Lets integration re-run local targeting
                 self.llm_modification_results = modification_call_result # Store the whole result
                 modified_code_for_response = modification_call_result.get("modified_code", {})
                 modification_manual_for_response = modification_call_result.get("modification_manual", "")
@@ -128,34 +490,132 @@ class Api:
                 # affected_by_llm = modification_call_result.get("affected_modules_by_llm", [])
                 # For now, `self.llm_modification_results` holds this if needed for integration logic.
                 logging.info("LLM successfully processed modification instruction.")
+                self._save_session_snapshot("modification")
+                if not memo_hit:
+                    self._record_successful_edit(specific_instruction, modification_call_result)
             elif modification_call_result["status"] == "error":
                 logging.error(f"LLM modification failed: {modification_call_result['message']}")
                 modification_manual_for_response = f"LLM 修改指令处理失败: {modification_call_result['message']}"
                 # Keep empty modified_code_for_response
-            else: // "skipped" or other
+            else: # "skipped" or other
                 logging.info(f"LLM modification skipped or other status: {modification_call_result['message']}")
                 modification_manual_for_response = modification_call_result['message']
 
 
+        response = self._build_analysis_response(
+            f"分析完成, 识别到 {len(self.llm_defined_modules)} 个模块。",
+            modified_code_for_response,
+            modification_manual_for_response
+        )
+        response["definitions_source"] = self.definitions_source
+        return response
+
+    def _extract_defined_modules(self, raw_html, raw_definitions_from_llm):
+        """Inserts marker comments for the definitions and extracts each module's content. Returns (html_with_markers, modules)."""
+        # 2. Add markers to HTML based on LLM definitions
+        logging.info("Step 2: Adding markers to HTML.")
+        html_with_markers = add_markers_to_html(raw_html, raw_definitions_from_llm)
+        if not html_with_markers: # Should not happen if raw_html is non-empty
+             html_with_markers = raw_html # Fallback
+             logging.warning("add_markers_to_html returned empty, using raw HTML for marked content.")
+
+        # 3. Extract original content for each module and store definitions
+        logging.info("Step 3: Extracting original content for each module.")
+        temp_processed_definitions = []
+        with self.tracer.span("analyze.extract_modules", definition_count=len(raw_definitions_from_llm)):
+            for module_def_llm in raw_definitions_from_llm:
+                # Ensure the id from the comment matches the module id for consistency
+                if module_def_llm.get("id") not in module_def_llm.get("start_comment", ""):
+                    logging.warning(f"Mismatch between module ID '{module_def_llm.get('id')}' and start_comment '{module_def_llm.get('start_comment')}'. Fixing comment for internal use.")
+                    module_def_llm["start_comment"] = f"LLM_MODULE_START: {module_def_llm.get('id')}"
+                    module_def_llm["end_comment"] = f"LLM_MODULE_END: {module_def_llm.get('id')}"
+
+                content = extract_module_content_by_markers(html_with_markers, module_def_llm)
+                if content is not None:
+                    temp_processed_definitions.append({**module_def_llm, "original_content": content.strip()})
+                    logging.debug(f"  Module '{module_def_llm.get('id')}': Original Content (first 100 chars): '{content.strip()[:100]}'")
+                else:
+                    logging.warning(f"Could not extract original content for module ID: {module_def_llm.get('id')}. It will be excluded from active definitions for frontend.")
+        return html_with_markers, temp_processed_definitions
+
+    def _build_analysis_response(self, message, modified_code, modification_manual):
         # Prepare response for frontend
-        # `active_module_definitions` for frontend should be {id, description, original_content}
+        # `active_module_definitions` for frontend carries lightweight metadata only:
+        # {id, description, size, content_hash}. Bodies are fetched on demand via get_module_content().
         frontend_module_defs = [
-            {"id": m["id"], "description": m["description"], "original_content": m["original_content"]}
+            {
+                "id": m["id"],
+                "description": m["description"],
+                "size": len(m["original_content"]),
+                "content_hash": self._module_content_hash(m)
+            }
             for m in self.llm_defined_modules
         ]
 
-        max_modules_frontend = self.api_config.get("max_modules_to_process_frontend", 20)
-
         return {
             "status": "success",
-            "message": f"分析完成, 识别到 {len(self.llm_defined_modules)} 个模块。",
-            "active_module_definitions": frontend_module_defs[:max_modules_frontend],
-            "html_skeleton": self.html_skeleton, # Send skeleton for potential later use or debug
-            "modified_code": modified_code_for_response, # This is LLM's direct modification output
-            "modification_manual": modification_manual_for_response
+            "message": message,
+            "active_module_definitions": frontend_module_defs,
+            "has_html_skeleton": bool(self.html_skeleton), # The skeleton itself stays in the backend until integration
+            "modified_code": modified_code, # This is LLM's direct modification output
+            "modification_manual": modification_manual
         }
 
+    def list_sessions(self):
+        """Returns saved session snapshots, newest first."""
+        if not self.session_store:
+            return []
+        return self.session_store.list_sessions()
+
+    def restore_session(self, session_id=""):
+        with self._state_lock:
+            return self._restore_session(session_id)
+
+    def _restore_session(self, session_id=""):
+        """
+        Restores a saved session (the latest one if no ID is given) without
+        calling the LLM. Returns the same shape as analyze_html, plus the
+        user's saved edits under 'user_edited_modules'.
+        """
+        logging.info(f"Python API: restore_session called (session_id='{session_id}').")
+        if not self.session_store:
+            return {"status": "error", "message": "会话快照功能未启用。"}
+
+        session_id = session_id or self.session_store.latest_session_id()
+        snapshot = self.session_store.load(session_id) if session_id else None
+        if not snapshot:
+            return {"status": "error", "message": "没有可恢复的会话快照。"}
+
+        with self.tracer.span("session.restore", stage=snapshot["stage"]):
+            state = snapshot["state"]
+            self._analysis_generation += 1
+            self.session_id = snapshot["session_id"]
+            self.raw_original_html_content = state.get("raw_original_html_content", "")
+            self.html_content_with_markers = "" # Only needed while analysing; not persisted
+            self.html_skeleton = state.get("html_skeleton", "")
+            self.llm_defined_modules = state.get("llm_defined_modules", [])
+            self.llm_modification_results = state.get("llm_modification_results", {})
+            self.user_edited_modules = state.get("user_edited_modules", {})
+            self._index_page_modules()
+            self._build_dependency_graph()
+            self.integration_warnings = []
+            self._reset_version_store()
+
+        response = self._build_analysis_response(
+            f"已恢复会话 {self.session_id} (阶段: {snapshot['stage']}), 共 {len(self.llm_defined_modules)} 个模块。",
+            self.llm_modification_results.get("modified_code", {}),
+            self.llm_modification_results.get("modification_manual", "")
+        )
+        response["session_id"] = self.session_id
+        response["original_html"] = self.transfer_store.wrap(self.raw_original_html_content)
+        response["user_edited_modules"] = self.user_edited_modules
+        return response
+
     def integrate_modules_with_user_edits(self, user_edited_modules_json_string="{}"):
+        with self._state_lock:
+            return self._integrate_modules_with_user_edits(user_edited_modules_json_string)
+
+    def _integrate_modules_with_user_edits(self, user_edited_modules_json_string="{}"):
         logging.info("Python API: integrate_modules_with_user_edits called.")
         user_edited_modules_dict = {}
         try:
@@ -165,6 +625,9 @@ class Api:
             logging.error(f"Error parsing user_edited_modules_json_string: {e}")
             return f"错误：用户编辑数据解析失败 - {e}"
 
+        if user_edited_modules_dict != self.user_edited_modules:
+            self._commit_user_edits(user_edited_modules_dict, "整合时的用户编辑", complete=True)
+
         if not self.html_skeleton:
             logging.error("Integration called but HTML skeleton is not available.")
             return getattr(self, 'raw_original_html_content', "错误：HTML骨架未生成，且无原始HTML。")
@@ -179,36 +642,414 @@ class Api:
         # Let's use the first module ID from that if present.
 
         llm_targeted_mod_store = {}
+        placement_warnings = []
         if self.llm_modification_results and self.llm_modification_results.get("status") == "success":
             llm_data = self.llm_modification_results
-            # If LLM specified modules it touched in "affected_modules_by_llm"
-            affected_llm_modules = llm_data.get("affected_modules_by_llm", [])
-            if affected_llm_modules and isinstance(affected_llm_modules, list) and len(affected_llm_modules) > 0:
-                # Assume the first module in that list is the primary target for the `modified_code`
-                target_module_id = affected_llm_modules[0].get("id")
-                if target_module_id:
-                    llm_targeted_mod_store[target_module_id] = {
-                        "modified_code": llm_data.get("modified_code", {}),
-                        "modification_manual": llm_data.get("modification_manual", "")
-                    }
-                    logging.info(f"LLM modification will target module ID: {target_module_id} for integration.")
-                else:
-                    logging.warning("LLM indicated affected modules but no ID found for the primary one.")
+            # The LLM's "affected_modules_by_llm" ids are free-form; fall back to local targeting when
+            # they don't name a defined module, instead of silently dropping the modification.
+            target_module_id = self._resolve_modification_target(llm_data.get("instruction", ""), llm_data)
+            if target_module_id:
+                module = next(m for m in self.llm_defined_modules if m["id"] == target_module_id)
+                modified_code, warning = self._place_modified_html(module, llm_data.get("modified_code", {}))
+                if warning and target_module_id not in user_edited_modules_dict: # User edits take precedence
+                    placement_warnings.append(warning)
+                llm_targeted_mod_store[target_module_id] = {
+                    "modified_code": modified_code,
+                    "modification_manual": llm_data.get("modification_manual", "")
+                }
+                logging.info(f"LLM modification will target module ID: {target_module_id} for integration.")
             else:
-                # If LLM doesn't specify a target module for its `modified_code`, this is problematic for integration
-                # unless the modification is wholesale or affects non-modular parts.
-                # For now, we won't automatically apply it if no target module ID is clear from LLM.
-                logging.warning("LLM modification occurred but no specific target module ID was identified by LLM in 'modules' list. LLM's direct 'modified_code' will not be automatically integrated by module ID.")
-
-
-        final_html = integrate_final_code(
-            html_skeleton=self.html_skeleton,
-            module_definitions=self.llm_defined_modules, # Contains original_content
-            user_edited_modules=user_edited_modules_dict,
-            llm_modified_code_store=llm_targeted_mod_store, # Pass the mapped store
-            default_original_html_if_skeleton_missing=self.raw_original_html_content
+                logging.warning("LLM modification occurred but no target module could be identified, by the LLM or locally. LLM's direct 'modified_code' will not be automatically integrated by module ID.")
+
+
+        self.integration_warnings = placement_warnings + self._check_integration_references(user_edited_modules_dict, llm_targeted_mod_store)
+
+        with self.tracer.span("integrate_modules_with_user_edits", user_edit_count=len(user_edited_modules_dict)) as span:
+            final_html = integrate_final_code(
+                html_skeleton=self.html_skeleton,
+                module_definitions=self.llm_defined_modules, # Contains original_content
+                user_edited_modules=user_edited_modules_dict,
+                llm_modified_code_store=llm_targeted_mod_store, # Pass the mapped store
+                default_original_html_if_skeleton_missing=self.raw_original_html_content
+            )
+            span.set_attribute("output_bytes", len(final_html.encode("utf-8")))
+        wrapped = self.transfer_store.wrap(final_html)
+        if self.memory_profiler:
+            self.memory_profiler.record_retained(self, "integrate_modules_with_user_edits")
+        return wrapped
+
+    def _place_modified_html(self, module, modified_code):
+        """
+        The LLM returns new HTML for the target element (e.g. #anim1-box), not necessarily
+        the whole module: splice it in at the matching element, replacing the whole module
+        only when the returned root is the module root. Returns (modified_code with the
+        module's full html, warning or None); HTML that cannot be placed leaves the module
+        markup as it was and is reported instead.
+        """
+        original = module["original_content"]
+        new_html = (modified_code or {}).get("html", "")
+        if not new_html.strip():
+            return dict(modified_code or {}, html=original), None # CSS/JS-only modification
+        spliced = splice_elements(original, new_html)
+        if spliced is not None:
+            return dict(modified_code, html=spliced), None
+        logging.warning(f"Integration: LLM HTML for module '{module['id']}' matches no single element in it; module markup kept.")
+        return dict(modified_code, html=original), {
+            "module_id": module["id"], "source": "llm_edit", "symbol": "", "reason": "unplaced_html", "modules": [module["id"]]
+        }
+
+    def _check_integration_references(self, user_edits, llm_store):
+        """Cross-module references each replaced module would break, as [{module_id, source, symbol, reason, modules}]."""
+        if not self.dependency_graph:
+            return []
+        warnings = []
+        for module_id, edit in user_edits.items():
+            if "html" in edit:
+                for problem in self.dependency_graph.broken_references(module_id, edit["html"]):
+                    warnings.append(dict(problem, module_id=module_id, source="user_edit"))
+        for module_id, entry in llm_store.items():
+            if module_id in user_edits:
+                continue # User edits take precedence during integration
+            code = entry.get("modified_code", {})
+            # LLM CSS/JS is appended page-wide, so what it defines counts for the module
+            new_content = f"{code.get('html', '')}<style>{code.get('css', '')}</style><script>{code.get('js', '')}</script>"
+            for problem in self.dependency_graph.broken_references(module_id, new_content):
+                warnings.append(dict(problem, module_id=module_id, source="llm_edit"))
+        for warning in warnings:
+            logging.warning(f"Integration: module '{warning['module_id']}' ({warning['source']}) {warning['reason']} {warning['symbol']} (modules: {', '.join(warning['modules'])}).")
+        return warnings
+
+    def estimate_analysis_cost(self, original_code_from_frontend, specific_instruction=""):
+        with self._state_lock: # The memo is cleared when the refinement thread stores definitions
+            return self._estimate_analysis_cost(original_code_from_frontend, specific_instruction)
+
+    def _estimate_analysis_cost(self, original_code_from_frontend, specific_instruction=""):
+        """
+        Pre-flight estimate of the LLM calls analyze_html would make (token_estimator):
+        prompt/output tokens, cost and latency, computed locally before anything is sent.
+        The definition call is free on a definition cache hit; the module library or
+        rule-based segmentation may also avoid it, so its figures are an upper bound.
+        Estimates are memoised by page hash, so re-estimating an unchanged page is cheap.
+        """
+        raw_html = original_code_from_frontend.strip() if original_code_from_frontend else ""
+        if not raw_html:
+            return {"status": "error", "message": "无效或空HTML"}
+        page_hash = hashlib.sha256(raw_html.encode("utf-8")).hexdigest()
+        memo = self._cost_estimates.get(page_hash)
+        if memo is None:
+            definitions = {"calls": 0, "prompt_tokens": 0, "expected_output_tokens": 0, "cost_usd": 0.0, "latency_ms": 0, "source": "cache"}
+            if self._lookup_definition_cache(raw_html) is None:
+                definitions = dict(self.llm_handler.plan_definition_request(raw_html)["estimate"], source="llm")
+            memo = self._cost_estimates[page_hash] = {"definitions": definitions, "modifications": {}}
+            while len(self._cost_estimates) > COST_ESTIMATE_MEMO_PAGES:
+                self._cost_estimates.popitem(last=False)
+        self._cost_estimates.move_to_end(page_hash)
+        definitions = memo["definitions"]
+        modification = None
+        if specific_instruction:
+            modification = memo["modifications"].get(specific_instruction)
+            if modification is None:
+                modification = self.llm_handler.plan_modification_request(raw_html, specific_instruction)["estimate"]
+                memo["modifications"][specific_instruction] = modification
+                if len(memo["modifications"]) > COST_ESTIMATE_MEMO_PAGES:
+                    memo["modifications"].pop(next(iter(memo["modifications"])))
+        calls = [definitions] + ([modification] if modification else [])
+        return {
+            "status": "success",
+            "model": self.api_config.get("default_model"),
+            "page_chars": len(raw_html),
+            "definitions": definitions,
+            "modification": modification,
+            "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+            "expected_output_tokens": sum(c["expected_output_tokens"] for c in calls),
+            "cost_usd": round(sum(c["cost_usd"] for c in calls), 6),
+            "latency_ms": sum(c["latency_ms"] for c in calls), # Definitions, then modification
+        }
+
+    def get_memory_profile(self):
+        """Per-stage allocations and retained sizes per Api attribute (memory_profile_enabled)."""
+        if not self.memory_profiler:
+            return {"status": "error", "message": "内存分析未启用（memory_profile_enabled）。"}
+        return {"status": "success", **self.memory_profiler.report()}
+
+    def get_integration_warnings(self):
+        """Broken cross-module references found by the last integrate_modules_with_user_edits call."""
+        return {"status": "success", "warnings": self.integration_warnings}
+
+    def get_module_dependencies(self, module_id):
+        """What a module uses from other modules, what uses it, and what a change to it affects."""
+        if not self.dependency_graph or module_id not in self.dependency_graph.defines:
+            return {"status": "error", "message": f"未找到模块: {module_id}"}
+        def edges(adjacency):
+            return {other: sorted(format_symbol(s) for s in symbols) for other, symbols in adjacency.items()}
+        return {
+            "status": "success",
+            "module_id": module_id,
+            "depends_on": edges(self.dependency_graph.dependencies(module_id)),
+            "used_by": edges(self.dependency_graph.dependents(module_id)),
+            "impact": sorted(self.dependency_graph.impact(module_id))
+        }
+
+    def _reset_version_store(self):
+        """Starts a new edit history: revision 0 holds the original modules, revision 1 any existing user edits."""
+        self.version_store = VersionStore()
+        self.version_store.commit({m["id"]: m["original_content"] for m in self.llm_defined_modules}, "原始分析结果")
+        if self.user_edited_modules:
+            self.version_store.commit(
+                {module_id: edit["html"] for module_id, edit in self.user_edited_modules.items() if "html" in edit},
+                "恢复的用户编辑"
+            )
+
+    def _sync_user_edits_from_versions(self):
+        """Derives user_edited_modules from the modules whose current blob differs from revision 0."""
+        current = self.version_store.checkout()
+        self.user_edited_modules = {
+            module_id: {"html": current[module_id]}
+            for module_id in self.version_store.changed_modules(0, self.version_store.head)
+            if module_id in current
+        }
+
+    def _commit_user_edits(self, user_edits, message, complete=False):
+        """
+        Commits user edits as a new revision. With complete=True, user_edits is the full
+        set of edits (as sent at integration) and modules missing from it revert to the original.
+        """
+        if not self.version_store:
+            self.user_edited_modules = user_edits
+        else:
+            originals = {m["id"]: m["original_content"] for m in self.llm_defined_modules}
+            # Unknown ids (stale frontend state) must not enter the manifest
+            changes = {module_id: edit["html"] for module_id, edit in user_edits.items() if "html" in edit and module_id in originals}
+            if complete:
+                changes = dict(originals, **changes)
+            self.version_store.commit(changes, message, replace=complete)
+            self._sync_user_edits_from_versions()
+        self._save_session_snapshot("user_edits")
+
+    def _edit_history_response(self, message):
+        return {
+            "status": "success",
+            "message": message,
+            "revision": self.version_store.head,
+            "can_undo": self.version_store.can_undo(),
+            "can_redo": self.version_store.can_redo(),
+            "user_edited_modules": self.user_edited_modules
+        }
+
+    def save_module_edit(self, module_id, html):
+        """Records a user edit of one module as a new revision."""
+        with self._state_lock:
+            if not self.version_store:
+                return {"status": "error", "message": "尚未进行分析，无法保存编辑。"}
+            if not any(m["id"] == module_id for m in self.llm_defined_modules):
+                return {"status": "error", "message": f"未找到模块: {module_id}"}
+            self._commit_user_edits({module_id: {"html": html}}, f"编辑模块 {module_id}")
+            return self._edit_history_response(f"模块 '{module_id}' 的编辑已保存为修订 {self.version_store.head}。")
+
+    def undo_edit(self):
+        with self._state_lock:
+            if not self.version_store or not self.version_store.can_undo():
+                return {"status": "error", "message": "没有可撤销的编辑。"}
+            self.version_store.undo()
+            self._sync_user_edits_from_versions()
+            self._save_session_snapshot("user_edits")
+            return self._edit_history_response(f"已撤销到修订 {self.version_store.head}。")
+
+    def redo_edit(self):
+        with self._state_lock:
+            if not self.version_store or not self.version_store.can_redo():
+                return {"status": "error", "message": "没有可重做的编辑。"}
+            self.version_store.redo()
+            self._sync_user_edits_from_versions()
+            self._save_session_snapshot("user_edits")
+            return self._edit_history_response(f"已重做到修订 {self.version_store.head}。")
+
+    def list_revisions(self):
+        with self._state_lock:
+            if not self.version_store:
+                return []
+            return self.version_store.list_revisions()
+
+    def diff_revisions(self, revision_a, revision_b):
+        """Returns per-module unified diffs between two revisions."""
+        with self._state_lock:
+            if not self.version_store:
+                return {"status": "error", "message": "尚未进行分析。", "diffs": []}
+            try:
+                diffs = self.version_store.diff(int(revision_a), int(revision_b))
+            except (IndexError, ValueError, TypeError) as e:
+                return {"status": "error", "message": f"无效的修订号: {e}", "diffs": []}
+        return {"status": "success", "message": f"{len(diffs)} 个模块有差异。", "diffs": diffs}
+
+    @staticmethod
+    def _module_content_hash(module):
+        # Cached on the module dict; sessions restored from older snapshots compute it on first use
+        if "content_hash" not in module:
+            module["content_hash"] = hashlib.sha256(module.get("original_content", "").encode("utf-8")).hexdigest()[:16]
+        return module["content_hash"]
+
+    def get_module_content(self, module_id, content_range=None):
+        """
+        Serves one module's original content on demand. content_range is an
+        optional [start, end) character range for paging through very large
+        modules. The content is inline, or a transfer descriptor if large.
+        """
+        with self._state_lock:
+            module = next((m for m in self.llm_defined_modules if m.get("id") == module_id), None)
+            if module is None:
+                return {"status": "error", "message": f"未找到模块: {module_id}"}
+
+            content = module.get("original_content", "")
+            start, end = 0, len(content)
+            if content_range:
+                try:
+                    start = max(0, int(content_range[0]))
+                    end = len(content) if content_range[1] is None else min(len(content), int(content_range[1]))
+                except (TypeError, ValueError, IndexError):
+                    return {"status": "error", "message": f"无效的内容范围: {content_range}"}
+                if start > end:
+                    return {"status": "error", "message": f"无效的内容范围: {content_range}"}
+
+            return {
+                "status": "success",
+                "module_id": module_id,
+                "range": [start, end],
+                "size": len(content),
+                "content_hash": self._module_content_hash(module),
+                "content": self.transfer_store.wrap(content[start:end])
+            }
+
+    def _index_page_modules(self):
+        """Replaces the page documents of the search index with the current modules."""
+        for key in self._indexed_page_keys:
+            self.search_index.remove(key)
+        self._indexed_page_keys = []
+        for module in self.llm_defined_modules:
+            key = f"page:{module['id']}"
+            self.search_index.add(
+                key, module["id"], module.get("description", ""), code_identifiers(module.get("original_content", "")),
+                meta={"source": "page", "id": module["id"], "description": module.get("description", "")}, scope="page"
+            )
+            self._indexed_page_keys.append(key)
+            if self._library_indexed: # add_modules() has just stored it, keep the library side current too
+                self._index_library_entry(module["id"], module.get("description", ""),
+                                          normalised_fingerprint(module.get("original_content", "")),
+                                          code_identifiers(module.get("original_content", "")))
+
+    def _index_library_entry(self, module_id, description, fingerprint, code):
+        self.search_index.add(
+            f"lib:{fingerprint}", module_id, description, code,
+            meta={"source": "library", "id": module_id, "description": description, "fingerprint": fingerprint}, scope="library"
         )
-        return final_html
+
+    def _ensure_library_indexed(self):
+        # Indexed from the SQLite rows only (ids, descriptions, css/js dependencies); no blob reads
+        if self._library_indexed or not self.module_library:
+            return
+        with self.tracer.span("search.index_library") as span:
+            count = 0
+            for entry in self.module_library.iter_entries():
+                self._index_library_entry(entry["module_id"], entry["description"], entry["fingerprint"],
+                                          " ".join(entry["css_deps"] + entry["js_deps"]))
+                count += 1
+            span.set_attribute("modules", count)
+        self._library_indexed = True
+
+    def search_modules(self, query, scope="page", limit=20):
+        """
+        Lexical (BM25) search over module ids, descriptions and code identifiers.
+        scope is "page" (current analysis), "library" (all previously analysed
+        modules) or "all". Results are best first.
+        """
+        with self._state_lock:
+            if scope not in ("page", "library", "all"):
+                return {"status": "error", "message": f"无效的搜索范围: {scope}", "results": []}
+            if scope != "page":
+                self._ensure_library_indexed()
+            scopes = ("page", "library") if scope == "all" else (scope,)
+            with self.tracer.span("search.query", scope=scope) as span:
+                hits = self.search_index.search(query or "", limit=int(limit), scopes=scopes)
+                span.set_attribute("results", len(hits))
+            results = [dict(meta, score=round(score, 3)) for _, score, meta in hits]
+            return {"status": "success", "message": f"找到 {len(results)} 个匹配模块。", "results": results}
+
+    def export_module_pack(self, path=""):
+        """Writes the module library to a pack file (default: <module_library_dir>/library.pack)."""
+        if not self.module_library:
+            return {"status": "error", "message": "模块库未启用。"}
+        path = path or os.path.join(self.module_library.library_dir, "library.pack")
+        try:
+            with self.tracer.span("library.export_pack") as span:
+                count = self.module_library.export_pack(path)
+                span.set_attribute("modules", count)
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"Module pack export to '{path}' failed: {e}")
+            return {"status": "error", "message": f"导出模块库失败: {e}"}
+        return {"status": "success", "message": f"已导出 {count} 个模块到 {path}。", "path": path, "module_count": count}
+
+    def import_module_pack(self, path):
+        """Copies the modules of a pack file into the module library."""
+        if not self.module_library:
+            return {"status": "error", "message": "模块库未启用。"}
+        try:
+            with self.tracer.span("library.import_pack") as span:
+                added = self.module_library.import_pack(path)
+                span.set_attribute("modules", added)
+        except (OSError, sqlite3.Error, PackFormatError) as e:
+            logging.error(f"Module pack import from '{path}' failed: {e}")
+            return {"status": "error", "message": f"导入模块包失败: {e}"}
+        self._library_indexed = False # Re-index the library side of module search on next use
+        return {"status": "success", "message": f"已从 {path} 导入 {added} 个新模块。", "module_count": added}
+
+    def define_modules_batch(self, file_paths):
+        """
+        Batch path: defines modules for many HTML files with one LLM definition
+        call per template cluster (see page_clustering). Modules of every page
+        are recorded in the module library, so analysing any of these pages later
+        reuses them. Returns per-page results and call statistics.
+        """
+        pages = {}
+        for path in file_paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    pages[path] = f.read().strip()
+            except (OSError, UnicodeDecodeError) as e:
+                logging.error(f"Batch: could not read '{path}': {e}")
+        pages = {path: html for path, html in pages.items() if html}
+        if not pages:
+            return {"status": "error", "message": "没有可处理的HTML文件。", "pages": [], "stats": {}}
+
+        with self.tracer.span("batch.define_modules", pages=len(pages)) as span:
+            results, stats = define_modules_for_pages(
+                pages, self._define_modules_with_llm,
+                threshold=self.api_config.get("page_cluster_threshold", 0.8)
+            )
+            span.set_attribute("llm_calls", stats["llm_calls"])
+
+        page_summaries = []
+        for path, result in results.items():
+            modules = []
+            if result["status"] == "success" and result["definitions"]:
+                _, modules = self._extract_defined_modules(pages[path], [dict(d) for d in result["definitions"]])
+                if self.module_library and modules:
+                    self.module_library.add_modules(modules)
+            page_summaries.append({
+                "path": path, "status": result["status"], "source": result["source"],
+                "representative": result["representative"], "module_ids": [m["id"] for m in modules]
+            })
+        return {
+            "status": "success",
+            "message": f"{stats['pages']} 个页面分为 {stats['clusters']} 个模板簇，共调用 LLM {stats['llm_calls']} 次。",
+            "pages": page_summaries,
+            "stats": stats
+        }
+
+    def get_transfer_chunk(self, transfer_id, index):
+        """Serves one sequenced chunk of a large payload registered with the transfer store."""
+        return self.transfer_store.get_chunk(transfer_id, int(index))
+
+    def release_transfer(self, transfer_id):
+        return self.transfer_store.release(transfer_id)
 
     def get_prompt_template_for_frontend(self):
         # Use the method from LLMHandler to get the template
@@ -0,0 +1,261 @@
+# memory_profiler.py
+"""
+tracemalloc-based memory profiling of the analyze/integrate pipeline. The
+profiler observes tracer spans (tracing.Tracer.observers), so every traced
+stage is measured without extra call sites:
+
+    python memory_profiler.py page.html --instruction "把动画1改成旋转立方体"
+    python memory_profiler.py --generate 5000000 200 --output memory_profile.json
+
+or set "memory_profile_enabled": true in api_config.json and call
+Api.get_memory_profile(). Traced memory and peaks are process-wide, so
+figures for concurrent stages (e.g. background refinement) overlap.
+"""
+import itertools
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import tracemalloc
+import types
+
+_SHALLOW_TYPES = (types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                  threading.Thread, sqlite3.Connection, logging.Logger)
+_LOCK_TYPES = (type(threading.Lock()), type(threading.RLock()))
+
+
+def deep_size(obj, seen=None):
+    """
+    Bytes reachable from obj: containers, strings and plain objects' __dict__ are
+    followed; modules, classes, functions, threads, locks and connections count shallow.
+    Objects already in seen are skipped, so one seen set across calls counts shared data once.
+    """
+    seen = set() if seen is None else seen
+    total, pending = 0, [obj]
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, (str, bytes, bytearray, int, float, bool)) or current is None:
+            continue
+        if isinstance(current, _SHALLOW_TYPES) or isinstance(current, _LOCK_TYPES):
+            continue
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            pending.extend(current)
+        elif hasattr(current, "__dict__") and not isinstance(current, threading.local):
+            pending.append(current.__dict__)
+    return total
+
+
+class MemoryProfiler:
+    """
+    Observes tracer spans: every span records traced memory at start/end and
+    the peak in between; spans up to snapshot_depth also get a tracemalloc
+    snapshot diff listing the top allocation sites. A span at depth 0
+    (analyze_html, integrate_modules_with_user_edits) starts a new run;
+    record_retained() adds per-attribute retained sizes of an object to it.
+    """
+
+    def __init__(self, snapshot_depth=1, top_sites=10, frames=1, max_runs=20, report_file=""):
+        self.snapshot_depth = snapshot_depth
+        self.top_sites = top_sites
+        self.max_runs = max_runs
+        self.report_file = report_file
+        self.runs = []
+        self._lock = threading.Lock()
+        self._open = {} # thread id -> stack of open stages
+        self._order = itertools.count()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+
+    def attach(self, tracer):
+        if self not in tracer.observers:
+            tracer.observers.append(self)
+
+    def _open_stages(self):
+        return self._open.setdefault(threading.get_ident(), [])
+
+    def _fold_peak(self):
+        """Propagates the peak since the last reset to every open stage (of any thread), then resets it."""
+        _, peak = tracemalloc.get_traced_memory()
+        for stages in self._open.values():
+            for stage in stages:
+                stage["peak"] = max(stage["peak"], peak)
+        tracemalloc.reset_peak()
+
+    def span_started(self, span, depth):
+        snapshot = tracemalloc.take_snapshot().filter_traces(self._filters) if depth <= self.snapshot_depth else None
+        with self._lock:
+            self._fold_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            stage = {"name": span.name, "order": next(self._order), "start": current, "peak": current, "snapshot": snapshot}
+            open_stages = self._open_stages()
+            if open_stages: # Records go to this thread's run, even if another thread started one since
+                stage["run"] = open_stages[0]["run"]
+            else:
+                stage["run"] = {"root": span.name, "stages": [], "retained": {}}
+                self.runs.append(stage["run"])
+                del self.runs[:-self.max_runs]
+            open_stages.append(stage)
+
+    def span_finished(self, span, depth):
+        with self._lock:
+            self._fold_peak()
+            stage = self._open_stages().pop()
+            current, _ = tracemalloc.get_traced_memory()
+        record = {
+            "name": stage["name"],
+            "order": stage["order"],
+            "depth": depth,
+            "duration_ms": round(span.duration_ms, 3),
+            "start_kb": round(stage["start"] / 1024, 1),
+            "end_kb": round(current / 1024, 1),
+            "delta_kb": round((current - stage["start"]) / 1024, 1),
+            "peak_kb": round(stage["peak"] / 1024, 1),
+            "peak_over_start_kb": round((stage["peak"] - stage["start"]) / 1024, 1),
+        }
+        if stage["snapshot"] is not None:
+            after = tracemalloc.take_snapshot().filter_traces(self._filters)
+            record["top_sites"] = [
+                {"site": str(diff.traceback[0]) if diff.traceback else "?", "size_kb": round(diff.size_diff / 1024, 1), "count": diff.count_diff}
+                for diff in after.compare_to(stage["snapshot"], "lineno")[:self.top_sites]
+                if diff.size_diff > 0
+            ]
+        with self._lock:
+            stage["run"]["stages"].append(record)
+        if depth == 0 and self.report_file:
+            self.write_report(self.report_file)
+
+    def record_retained(self, obj, label, skip=("memory_profiler", "tracer")):
+        """
+        Retained size per attribute of obj (each attribute on its own) and the de-duplicated
+        total, added to the most recent run whose root span is named label (else the most recent run).
+        """
+        attributes = {name: value for name, value in vars(obj).items() if name not in skip}
+        sizes = {name: deep_size(value) for name, value in attributes.items()}
+        shared_seen = set()
+        unique_total = sum(deep_size(value, shared_seen) for value in attributes.values())
+        retained = {
+            "attributes_kb": {name: round(size / 1024, 1) for name, size in sorted(sizes.items(), key=lambda item: -item[1])},
+            "sum_kb": round(sum(sizes.values()) / 1024, 1),
+            "unique_kb": round(unique_total / 1024, 1),
+        }
+        with self._lock:
+            run = next((r for r in reversed(self.runs) if r["root"] == label), self.runs[-1] if self.runs else None)
+            if run is not None:
+                run["retained"][label] = retained
+        return retained
+
+    def report(self):
+        current, _ = tracemalloc.get_traced_memory()
+        with self._lock:
+            runs = json.loads(json.dumps(self.runs))
+        return {"traced_current_kb": round(current / 1024, 1), "runs": runs}
+
+    def write_report(self, path):
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            logging.warning(f"Memory profile could not be written to '{path}': {e}")
+
+
+def format_report(report, top_sites=5):
+    lines = []
+    for run in report["runs"]:
+        lines.append(f"== {run['root']}")
+        lines.append(f"  {'stage':<44} {'ms':>9} {'delta KB':>10} {'peak+ KB':>10}")
+        stages = sorted(run["stages"], key=lambda s: s["order"])
+        i = 0
+        while i < len(stages):
+            stage, repeats = stages[i], 1
+            if "top_sites" not in stage: # Fold runs of identical sibling stages (e.g. one per module)
+                while (i + repeats < len(stages) and stages[i + repeats]["name"] == stage["name"]
+                       and stages[i + repeats]["depth"] == stage["depth"]):
+                    repeats += 1
+            group = stages[i:i + repeats]
+            name = stage["name"] + (f" x{repeats}" if repeats > 1 else "")
+            lines.append(f"  {('  ' * stage['depth'] + name)[:44]:<44} {sum(s['duration_ms'] for s in group):>9.1f} "
+                         f"{sum(s['delta_kb'] for s in group):>10.1f} {max(s['peak_over_start_kb'] for s in group):>10.1f}")
+            for site in stage.get("top_sites", [])[:top_sites]:
+                lines.append(f"  {'':<6}+{site['size_kb']:.1f} KB ({site['count']:+d}) {site['site']}")
+            i += repeats
+        for label, retained in run["retained"].items():
+            lines.append(f"  retained after {label}: {retained['unique_kb']:.1f} KB unique, {retained['sum_kb']:.1f} KB summed per attribute")
+            for name, size in list(retained["attributes_kb"].items())[:10]:
+                lines.append(f"      {name:<34} {size:>10.1f} KB")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Memory profile of analyze_html and integration for one page.")
+    parser.add_argument("page", nargs="?", help="HTML file to analyse.")
+    parser.add_argument("--generate", type=int, nargs=2, metavar=("BYTES", "MODULES"), help="Use a synthetic page instead.")
+    parser.add_argument("--instruction", default="")
+    parser.add_argument("--snapshot-depth", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report here.")
+    args = parser.parse_args()
+
+    if args.page or args.generate:
+        if args.generate:
+            from page_generator import generate_paper_page
+            html = generate_paper_page(*args.generate)[0]
+        else:
+            with open(args.page, "r", encoding="utf-8") as f:
+                html = f.read()
+        import main
+        logging.getLogger().setLevel(logging.WARNING)
+        api = main.Api()
+        if api.memory_profiler is None:
+            api.memory_profiler = MemoryProfiler(snapshot_depth=args.snapshot_depth)
+            api.memory_profiler.attach(api.tracer)
+        result = api.analyze_html(html, args.instruction)
+        modules = result.get("active_module_definitions", [])
+        api.integrate_modules_with_user_edits(json.dumps({modules[0]["id"]: {"html": "<p>edited</p>"}} if modules else {}))
+        report = api.memory_profiler.report()
+        print(f"Page: {len(html.encode('utf-8')) / 1024:.0f} KB, {len(modules)} modules")
+        print(format_report(report))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        from tracing import Tracer
+
+        class Holder:
+            def __init__(self):
+                self.raw = ""
+                self.copies = []
+
+        tracer = Tracer(enabled=False)
+        profiler = MemoryProfiler(snapshot_depth=1)
+        profiler.attach(tracer)
+        holder = Holder()
+        with tracer.span("analyze_html"):
+            with tracer.span("analyze.load"):
+                holder.raw = json.dumps("x" * 2_000_000) # Allocated inside json, outside this (filtered) file
+            with tracer.span("analyze.copy"):
+                holder.copies = [holder.raw[:-1] + "!", holder.raw]
+                with tracer.span("analyze.scratch"):
+                    scratch = bytearray(5_000_000)
+                    del scratch
+        profiler.record_retained(holder, "analyze_html")
+        report = profiler.report()
+        print(format_report(report))
+        stages = {s["name"]: s for s in report["runs"][0]["stages"]}
+        assert stages["analyze.load"]["delta_kb"] >= 1900
+        assert stages["analyze.scratch"]["peak_over_start_kb"] >= 4800 and stages["analyze.scratch"]["delta_kb"] < 100
+        assert stages["analyze.copy"]["peak_over_start_kb"] >= 4800 # Nested peaks propagate to the parent stage
+        assert stages["analyze.load"]["top_sites"][0]["site"].startswith(os.path.dirname(json.__file__))
+        retained = report["runs"][0]["retained"]["analyze_html"]
+        assert retained["attributes_kb"]["copies"] >= 3900 and retained["unique_kb"] < retained["sum_kb"]
+        print("\nMemory Profiler Tests Completed.")
@@ -0,0 +1,139 @@
+# minhash_index.py
+import array
+import hashlib
+import random
+import re
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_TOKEN_RE = re.compile(r"[A-Za-z_$][\w$-]*|\d+|[一-鿿]|[^\s\w]")
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def tokenise_module(content):
+    """
+    Code tokens of a module with digit runs masked, so 'anim1-box'/'playAnim1'
+    and 'anim2-box'/'playAnim2' tokenise identically. CJK characters are
+    single tokens; text changes then only perturb a few shingles.
+    """
+    return [_DIGITS_RE.sub("#", t) for t in _TOKEN_RE.findall(content)]
+
+
+def shingles(tokens, k=5):
+    if len(tokens) <= k:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+
+def _hash_shingle(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+class MinHasher:
+    """MinHash signatures with num_perm universal hash permutations (fixed seed, stable across runs)."""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.permutations = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def signature(self, content, k=5):
+        return self.signature_from_shingles(shingles(tokenise_module(content), k))
+
+    def signature_from_shingles(self, shingle_set):
+        hashes = [_hash_shingle(s) for s in shingle_set]
+        if not hashes:
+            return array.array("Q", [_MAX_HASH] * self.num_perm)
+        return array.array("Q", (
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self.permutations
+        ))
+
+
+def estimate_similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    matches = sum(1 for x, y in zip(signature_a, signature_b) if x == y)
+    return matches / len(signature_a)
+
+
+def signature_to_bytes(signature):
+    return signature.tobytes()
+
+
+def signature_from_bytes(data):
+    signature = array.array("Q")
+    signature.frombytes(data)
+    return signature
+
+
+class MinHashLSHIndex:
+    """
+    Locality-sensitive hashing over MinHash signatures: the signature is cut
+    into `bands` bands of `rows` values, and keys sharing any band bucket are
+    candidates. Queries touch only those buckets, so lookup cost does not grow
+    with the library size. The detection threshold is roughly (1/bands)^(1/rows).
+    """
+
+    def __init__(self, num_perm=128, bands=32):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets = [dict() for _ in range(bands)]
+        self._signatures = {}
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows:(band + 1) * self.rows])
+
+    def add(self, key, signature):
+        if key in self._signatures:
+            self.remove(key)
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band].get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def query(self, signature, threshold=0.7, limit=5):
+        """Returns [(key, estimated_similarity)] above threshold, most similar first."""
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+        scored = [(key, estimate_similarity(signature, self._signatures[key])) for key in candidates]
+        scored = [item for item in scored if item[1] >= threshold]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+if __name__ == '__main__':
+    hasher = MinHasher()
+    index = MinHashLSHIndex()
+    anim1 = """<div class="animation-container" id="anim-container-1"><h3>动画模块 1</h3>
+<div class="animation-box" id="anim1-box"><p>这是动画1的占位内容。</p></div>
+<button onclick="playAnim1()">播放动画1</button><p>关于动画1的简短描述。</p></div>"""
+    anim2 = anim1.replace("1", "2").replace("简短描述", "详细描述")
+    footer = "<footer><p>版权所有 &copy; 2025 MyCompany</p><a href='#'>联系我们</a></footer>"
+    index.add("anim1", hasher.signature(anim1))
+    index.add("footer", hasher.signature(footer))
+
+    results = index.query(hasher.signature(anim2))
+    print(results)
+    assert results and results[0][0] == "anim1" and results[0][1] > 0.7
+    assert not index.query(hasher.signature("<nav><ul><li>首页</li></ul></nav>"))
+    index.remove("anim1")
+    assert not index.query(hasher.signature(anim2))
+    print("\nMinHash Index Tests Completed.")
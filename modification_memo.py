@@ -0,0 +1,204 @@
+# modification_memo.py
+import logging
+import re
+import unicodedata
+
+from module_library import normalised_fingerprint
+
+_INSTRUCTION_NOISE_RE = re.compile(r"[\s，。、；：！？,.;:!?\"'“”‘’（）()【】\[\]]+")
+_IDENTIFIER_RES = (
+    re.compile(r"""\bid\s*=\s*["']([^"']+)["']""", re.IGNORECASE),
+    re.compile(r"""#([A-Za-z_][\w-]*)"""),
+    re.compile(r"""getElementById\(\s*["']([^"']+)["']"""),
+    re.compile(r"\bfunction\s+([A-Za-z_$][\w$]*)"),
+    re.compile(r"""\bon\w+\s*=\s*["']\s*([A-Za-z_$][\w$]*)\s*\("""),
+)
+_DIGITS_RE = re.compile(r"\d+")
+# Numbered mentions: 动画2 / anim 2, 第二个 / 第2节, 三号 / 两张 (bare CJK numerals are too common in ordinary words)
+_MENTION_NUMBER_RE = re.compile(r"第\s*([0-9]+|[零一二两三四五六七八九十百]+)|([零一二两三四五六七八九十百]+)\s*[个号张幅节章项部]|(\d+)")
+_CJK_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+
+def normalise_instruction(instruction):
+    """Case-, width- and punctuation-insensitive form of an operator instruction."""
+    text = unicodedata.normalize("NFKC", instruction or "").lower()
+    return _INSTRUCTION_NOISE_RE.sub("", text)
+
+
+def instruction_similarity(key_a, key_b):
+    """Jaccard similarity of character bigrams of two normalised instructions."""
+    if key_a == key_b:
+        return 1.0
+    bigrams_a = {key_a[i:i + 2] for i in range(len(key_a) - 1)} or {key_a}
+    bigrams_b = {key_b[i:i + 2] for i in range(len(key_b) - 1)} or {key_b}
+    return len(bigrams_a & bigrams_b) / len(bigrams_a | bigrams_b)
+
+
+def _cjk_number(text):
+    """Value of a CJK numeral up to 999 (十二 -> 12, 二十 -> 20, 一百零五 -> 105)."""
+    total, digit = 0, 0
+    for char in text:
+        if char == "百":
+            total, digit = total + (digit or 1) * 100, 0
+        elif char == "十":
+            total, digit = total + (digit or 1) * 10, 0
+        else:
+            digit = _CJK_DIGITS[char]
+    return total + digit
+
+
+def numbered_mentions(instruction):
+    """Sorted numbers an instruction refers to ("把动画2和第三个图表..." -> (2, 3)); () when it names none."""
+    text = unicodedata.normalize("NFKC", instruction or "")
+    numbers = []
+    for ordinal, counted, digits in _MENTION_NUMBER_RE.findall(text):
+        value = ordinal or counted or digits
+        numbers.append(int(value) if value.isdigit() else _cjk_number(value))
+    return tuple(sorted(numbers))
+
+
+def extract_identifiers(content):
+    """Element ids and JS function names of a module, in order of first appearance."""
+    found = []
+    for pattern in _IDENTIFIER_RES:
+        for match in pattern.finditer(content):
+            found.append((match.start(), match.group(1)))
+    seen, ordered = set(), []
+    for _, identifier in sorted(found):
+        if identifier not in seen:
+            seen.add(identifier)
+            ordered.append(identifier)
+    return ordered
+
+
+def build_retarget_map(source_content, target_content):
+    """
+    Maps identifiers of the module an edit was made for onto the module it is
+    being reused for. Identifiers are paired in order within groups that only
+    differ in digits (anim1-box -> anim2-box, playAnim1 -> playAnim2).
+    """
+    target_by_shape = {}
+    for identifier in extract_identifiers(target_content):
+        target_by_shape.setdefault(_DIGITS_RE.sub("#", identifier), []).append(identifier)
+    mapping = {}
+    for identifier in extract_identifiers(source_content):
+        candidates = target_by_shape.get(_DIGITS_RE.sub("#", identifier))
+        if candidates:
+            replacement = candidates.pop(0)
+            if replacement != identifier:
+                mapping[identifier] = replacement
+    return mapping
+
+
+def retarget_text(text, mapping):
+    if not text or not mapping:
+        return text
+    pattern = re.compile(r"(?<![\w$-])(" + "|".join(re.escape(k) for k in sorted(mapping, key=len, reverse=True)) + r")(?![\w$-])")
+    return pattern.sub(lambda m: mapping[m.group(1)], text)
+
+
+def retarget_modified_code(modified_code, mapping):
+    """Applies an identifier mapping to every string field of a modified_code dict (nested dicts included)."""
+    if isinstance(modified_code, dict):
+        return {k: retarget_modified_code(v, mapping) for k, v in modified_code.items()}
+    if isinstance(modified_code, str):
+        return retarget_text(modified_code, mapping)
+    return modified_code
+
+
+class ModificationMemo:
+    """
+    Memoises successful modifications keyed on (normalised instruction, module
+    fingerprint), stored in the module library. A lookup checks the given
+    modules for prior edits on the same or a near-duplicate module whose
+    instruction matches exactly or fuzzily and names the same numbers
+    (动画1 never stands in for 动画2), and re-targets ids/selectors of the
+    stored modified_code onto the current module.
+    """
+
+    def __init__(self, module_library, instruction_threshold=0.85, module_threshold=0.8):
+        self.library = module_library
+        self.instruction_threshold = instruction_threshold
+        self.module_threshold = module_threshold
+
+    def record(self, instruction, module, modified_code, modification_manual):
+        """Memoises a successful modification of module ({id, description, original_content})."""
+        content = module["original_content"]
+        if not self.library.lookup_fingerprints([normalised_fingerprint(content)]):
+            # The module must be in the library for near-duplicate lookups to find this edit
+            self.library.add_module(module["id"], module.get("description", ""), content)
+        self.library.record_edit(
+            content, instruction, modified_code, modification_manual,
+            instruction_key=normalise_instruction(instruction)
+        )
+
+    def lookup(self, instruction, module_definitions):
+        """
+        Returns the best memoised modification for instruction on one of
+        module_definitions ([{id, description, original_content}]), or None:
+        {module_id, modified_code, modification_manual, match, similarity, retargeted}.
+        """
+        instruction_key = normalise_instruction(instruction)
+        if not instruction_key:
+            return None
+        mentions = numbered_mentions(instruction)
+
+        best = None
+        for module in module_definitions:
+            content = module.get("original_content", "")
+            if not content.strip():
+                continue
+            for edit in self.library.prior_edits(content, threshold=self.module_threshold, limit=None):
+                key_similarity = instruction_similarity(instruction_key, edit["instruction_key"] or normalise_instruction(edit["instruction"]))
+                if key_similarity < self.instruction_threshold or numbered_mentions(edit["instruction"]) != mentions:
+                    continue
+                score = key_similarity * edit["similarity"]
+                if best is None or score > best[0]:
+                    best = (score, module, edit, key_similarity)
+
+        if best is None:
+            return None
+        score, module, edit, key_similarity = best
+        source_content = self.library.blobs.get(edit["source_blob_hash"]) if edit["source_blob_hash"] else None
+        mapping = build_retarget_map(source_content, module["original_content"]) if source_content else {}
+        exact = key_similarity == 1.0 and edit["similarity"] == 1.0 and not mapping
+        logging.info(f"Modification memo hit on module '{module['id']}' (score {score:.2f}, {len(mapping)} identifiers re-targeted).")
+        return {
+            "module_id": module["id"],
+            "modified_code": retarget_modified_code(edit["modified_code"], mapping),
+            "modification_manual": retarget_text(edit["modification_manual"], mapping),
+            "match": "exact" if exact else "near",
+            "similarity": round(score, 3),
+            "retargeted": mapping,
+        }
+
+
+if __name__ == '__main__':
+    import tempfile
+    from module_library import ModuleLibrary
+    logging.basicConfig(level=logging.INFO)
+
+    memo = ModificationMemo(ModuleLibrary(tempfile.mkdtemp()))
+    anim1 = ('<div class="animation-container" id="anim-container-1"><h3>动画模块 1</h3>'
+             '<div class="animation-box" id="anim1-box"><p>这是动画1的占位内容。</p></div>'
+             '<button onclick="playAnim1()">播放动画1</button></div>')
+    memo.record("把动画框的背景改成红色。", {"id": "animation_container_1", "original_content": anim1},
+                {"html": '<div class="animation-box" id="anim1-box" style="background:red"></div>',
+                 "css": "#anim1-box { background: red; }", "js": ""},
+                "修改 #anim1-box 的背景色")
+
+    anim2 = anim1.replace("1", "2")
+    hit = memo.lookup("把动画框的背景改成红色", [{"id": "animation_container_2", "original_content": anim2}])
+    print(hit)
+    assert hit["module_id"] == "animation_container_2" and hit["modified_code"]["css"] == "#anim2-box { background: red; }"
+    assert memo.lookup("删除页脚", [{"id": "animation_container_2", "original_content": anim2}]) is None
+
+    # Instructions that differ only in the number they name are different edits
+    memo.record("把动画1改成旋转立方体", {"id": "animation_container_1", "original_content": anim1},
+                {"html": '<div class="cube" id="anim1-box"></div>', "css": "", "js": ""}, "替换 #anim1-box")
+    modules = [{"id": "animation_container_1", "original_content": anim1}, {"id": "animation_container_2", "original_content": anim2}]
+    assert memo.lookup("把动画2改成旋转立方体", modules) is None
+    assert memo.lookup("把动画1改成旋转立方体", modules)["module_id"] == "animation_container_1"
+    assert numbered_mentions("把第二个动画和图表 3 换位置") == (2, 3) and numbered_mentions("统一一下字体") == ()
+    assert numbered_mentions("第十二节") == (12,) and numbered_mentions("两张图") == (2,)
+    print("\nModification Memo Tests Completed.")
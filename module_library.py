@@ -0,0 +1,532 @@
+# module_library.py
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from dom_utils import parse_element_spans
+from heuristic_segmenter import DEFAULT_SEGMENT_RULES, label_element, match_rule, unique_module_id
+from minhash_index import MinHasher, MinHashLSHIndex, signature_from_bytes, signature_to_bytes
+
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+_BETWEEN_TAGS_RE = re.compile(r">\s+<")
+_WHITESPACE_RE = re.compile(r"\s+")
+_ID_RE = re.compile(r"""\bid\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+_CLASS_RE = re.compile(r"""\bclass\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+_JS_CALL_RE = re.compile(r"\b([A-Za-z_$][\w$]*)\s*\(")
+_JS_DEF_RE = re.compile(r"\bfunction\s+([A-Za-z_$][\w$]*)\s*\(")
+_JS_KEYWORDS = {"if", "for", "while", "switch", "catch", "function", "return", "typeof", "new", "with"}
+_NUMBER_RE = re.compile(r"\d+")
+NEAR_DUPLICATE_MAX_CHARS = 50_000 # Larger elements are page regions, not template modules
+NEAR_DUPLICATE_MAX_PAGE_CHARS = 300_000 # A MinHash signature costs ~5 ms per 1000 chars; larger pages skip the pass
+
+
+def normalise_module_content(html):
+    """Whitespace- and comment-insensitive form of a module body, used for fingerprinting."""
+    html = _COMMENT_RE.sub("", html)
+    html = _BETWEEN_TAGS_RE.sub("><", html)
+    return _WHITESPACE_RE.sub(" ", html).strip()
+
+
+def exact_fingerprint(content):
+    return hashlib.sha256(content.strip().encode("utf-8")).hexdigest()
+
+
+def normalised_fingerprint(content):
+    return hashlib.sha256(normalise_module_content(content).encode("utf-8")).hexdigest()
+
+
+def _library_label_rule(entry):
+    """
+    Label templates from a library module, with its numbers as {n}, for a
+    near-duplicate no segment rule covers ('animation_container_1' -> 'animation_container_{n}').
+    """
+    def template(text):
+        return _NUMBER_RE.sub("{n}", text.replace("{", "{{").replace("}", "}}"))
+    return {"id": template(entry["module_id"]), "description": template(entry["description"])}
+
+
+def extract_dependencies(content):
+    """
+    Rough CSS/JS dependency summary of a module: element ids and classes it
+    carries (CSS selectors that style it) and JS functions it defines or calls.
+    """
+    classes = set()
+    for class_list in _CLASS_RE.findall(content):
+        classes.update(class_list.split())
+    called = {name for name in _JS_CALL_RE.findall(content) if name not in _JS_KEYWORDS}
+    return {
+        "css": sorted({f"#{i}" for i in _ID_RE.findall(content)} | {f".{c}" for c in classes}),
+        "js": sorted(called | set(_JS_DEF_RE.findall(content))),
+    }
+
+
+class BlobStore:
+    """Content-addressed, gzip-compressed files under blob_dir/<2-char prefix>/<sha256>.gz."""
+
+    def __init__(self, blob_dir):
+        self.blob_dir = blob_dir
+
+    def _path(self, blob_hash):
+        return os.path.join(self.blob_dir, blob_hash[:2], f"{blob_hash}.gz")
+
+    def put(self, content):
+        blob_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        path = self._path(blob_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(content.encode("utf-8")))
+            os.replace(tmp_path, path)
+        return blob_hash
+
+    def get(self, blob_hash):
+        try:
+            with open(self._path(blob_hash), "rb") as f:
+                return gzip.decompress(f.read()).decode("utf-8")
+        except (OSError, EOFError) as e:
+            logging.warning(f"Module library blob '{blob_hash}' unreadable: {e}")
+            return None
+
+
+class ModuleLibrary:
+    """
+    Persistent library of analysed modules: metadata in SQLite, bodies in a
+    content-addressed blob store. Each module is indexed by the exact and the
+    normalised fingerprint of its content so pages built from the same
+    templates can reuse definitions without another LLM call.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS modules (
+        fingerprint TEXT PRIMARY KEY,
+        exact_hash TEXT NOT NULL,
+        module_id TEXT NOT NULL,
+        description TEXT NOT NULL,
+        blob_hash TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        css_deps TEXT NOT NULL,
+        js_deps TEXT NOT NULL,
+        hit_count INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_modules_exact_hash ON modules(exact_hash);
+    CREATE TABLE IF NOT EXISTS minhash_signatures (
+        fingerprint TEXT PRIMARY KEY,
+        signature BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS module_edits (
+        edit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fingerprint TEXT NOT NULL,
+        instruction TEXT NOT NULL,
+        instruction_key TEXT NOT NULL DEFAULT '',
+        source_blob_hash TEXT NOT NULL DEFAULT '',
+        modified_code TEXT NOT NULL,
+        modification_manual TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_module_edits_fingerprint ON module_edits(fingerprint);
+    """
+
+    def __init__(self, library_dir="module_library"):
+        self.library_dir = library_dir
+        os.makedirs(library_dir, exist_ok=True)
+        self.blobs = BlobStore(os.path.join(library_dir, "blobs"))
+        # pywebview calls the API from worker threads
+        self._conn = sqlite3.connect(os.path.join(library_dir, "library.sqlite3"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(self.SCHEMA)
+            self._migrate()
+        self.hasher = MinHasher()
+        self._lsh_index = None # Built from stored signatures on first near-duplicate query
+        self._packs = [] # Read-only module packs (module_pack.ModulePack), most recently attached first
+
+    def _migrate(self):
+        # Libraries created before edit memoisation lack these module_edits columns
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(module_edits)")}
+        for column in ("instruction_key", "source_blob_hash"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE module_edits ADD COLUMN {column} TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    def _lsh(self):
+        if self._lsh_index is None:
+            index = MinHashLSHIndex(num_perm=self.hasher.num_perm)
+            with self._lock:
+                rows = self._conn.execute("SELECT fingerprint, signature FROM minhash_signatures").fetchall()
+            for row in rows:
+                index.add(row["fingerprint"], signature_from_bytes(row["signature"]))
+            self._lsh_index = index
+            logging.debug(f"Module library: loaded {len(index)} MinHash signatures into the LSH index.")
+        return self._lsh_index
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        for pack in self._packs:
+            pack.close()
+        self._packs = []
+
+    def attach_pack(self, path):
+        """
+        Serves a module pack for fingerprint lookups without importing it: the
+        pack is memory-mapped and only the records that match are decompressed.
+        Modules in SQLite take precedence; later attached packs win over earlier ones.
+        """
+        from module_pack import ModulePack # module_pack builds on this module's fingerprints
+        pack = ModulePack(path)
+        self._packs.insert(0, pack)
+        logging.info(f"Module library: attached pack {path} ({len(pack)} modules).")
+        return len(pack)
+
+    def export_pack(self, path):
+        """Writes every module stored in SQLite to a pack file. Returns the number of modules written."""
+        from module_pack import write_pack
+
+        def modules():
+            for entry in self.iter_entries():
+                content = self.get_content(entry)
+                if content is not None:
+                    yield {
+                        "id": entry["module_id"], "description": entry["description"], "original_content": content,
+                        "start_comment": f"LLM_MODULE_START: {entry['module_id']}",
+                        "end_comment": f"LLM_MODULE_END: {entry['module_id']}",
+                    }
+        return write_pack(path, modules())
+
+    def import_pack(self, path):
+        """Copies the modules of a pack that are not yet in SQLite into the library. Returns how many were added."""
+        from module_pack import ModulePack
+        added = 0
+        with ModulePack(path) as pack:
+            batch = []
+            for fingerprint, record in pack.iter_modules():
+                batch.append((fingerprint, record))
+                if len(batch) >= 500:
+                    added += self._import_records(batch)
+                    batch = []
+            added += self._import_records(batch)
+        logging.info(f"Module library: imported {added} new modules from pack {path}.")
+        return added
+
+    def _import_records(self, batch):
+        known = self.lookup_fingerprints([fp for fp, _ in batch], sqlite_only=True)
+        for fingerprint, record in batch:
+            if fingerprint not in known:
+                self.add_module(record.get("id", ""), record.get("description", ""), record.get("original_content", ""))
+        return sum(1 for fp, _ in batch if fp not in known)
+
+    def _pack_entry(self, fingerprint, record):
+        content = record.get("original_content", "")
+        deps = extract_dependencies(content)
+        return {
+            "fingerprint": fingerprint,
+            "exact_hash": exact_fingerprint(content),
+            "module_id": record.get("id", ""),
+            "description": record.get("description", ""),
+            "blob_hash": "",
+            "size": len(content),
+            "css_deps": deps["css"],
+            "js_deps": deps["js"],
+            "hit_count": 0,
+            "content": content, # Served by get_content() instead of a blob
+        }
+
+    def add_module(self, module_id, description, content):
+        """Records (or refreshes) one module. Returns its normalised fingerprint."""
+        fingerprint = normalised_fingerprint(content)
+        deps = extract_dependencies(content)
+        blob_hash = self.blobs.put(content.strip())
+        signature = self.hasher.signature(content)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO minhash_signatures (fingerprint, signature) VALUES (?, ?)",
+                (fingerprint, signature_to_bytes(signature))
+            )
+            self._conn.execute(
+                """INSERT INTO modules (fingerprint, exact_hash, module_id, description, blob_hash, size,
+                                        css_deps, js_deps, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(fingerprint) DO UPDATE SET
+                       exact_hash=excluded.exact_hash, module_id=excluded.module_id,
+                       description=excluded.description, blob_hash=excluded.blob_hash,
+                       size=excluded.size, css_deps=excluded.css_deps, js_deps=excluded.js_deps,
+                       updated_at=excluded.updated_at""",
+                (fingerprint, exact_fingerprint(content), module_id, description, blob_hash, len(content),
+                 json.dumps(deps["css"]), json.dumps(deps["js"]), now, now)
+            )
+        if self._lsh_index is not None:
+            self._lsh_index.add(fingerprint, signature)
+        return fingerprint
+
+    def add_modules(self, module_definitions):
+        """Records every {id, description, original_content} module of an analysis."""
+        added = 0
+        for module in module_definitions:
+            content = module.get("original_content", "")
+            if module.get("id") and content.strip():
+                self.add_module(module["id"], module.get("description", ""), content)
+                added += 1
+        logging.info(f"Module library: recorded {added} modules.")
+        return added
+
+    def _row_to_entry(self, row):
+        return {
+            "fingerprint": row["fingerprint"],
+            "exact_hash": row["exact_hash"],
+            "module_id": row["module_id"],
+            "description": row["description"],
+            "blob_hash": row["blob_hash"],
+            "size": row["size"],
+            "css_deps": json.loads(row["css_deps"]),
+            "js_deps": json.loads(row["js_deps"]),
+            "hit_count": row["hit_count"],
+        }
+
+    def lookup_fingerprints(self, fingerprints, column="fingerprint", sqlite_only=False):
+        """
+        Batched lookup by normalised ('fingerprint') or exact ('exact_hash') hash -> {hash: entry}.
+        Normalised fingerprints missing from SQLite are also looked up in attached packs.
+        """
+        if column not in ("fingerprint", "exact_hash"):
+            raise ValueError(f"Unsupported fingerprint column: {column}")
+        fingerprints = list(set(fingerprints))
+        found = {}
+        with self._lock:
+            for i in range(0, len(fingerprints), 500): # Stay below SQLite's bound-parameter limit
+                batch = fingerprints[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                for row in self._conn.execute(f"SELECT * FROM modules WHERE {column} IN ({placeholders})", batch):
+                    found[row[column]] = self._row_to_entry(row)
+        if column == "fingerprint" and not sqlite_only:
+            for pack in self._packs:
+                for fingerprint in fingerprints:
+                    if fingerprint not in found:
+                        record = pack.get(fingerprint)
+                        if record is not None:
+                            found[fingerprint] = self._pack_entry(fingerprint, record)
+        return found
+
+    def find_similar(self, content, threshold=0.8, limit=5):
+        """Near-duplicate search via MinHash/LSH. Returns [(entry, estimated_similarity)]."""
+        matches = self._lsh().query(self.hasher.signature(content), threshold=threshold, limit=limit)
+        if not matches:
+            return []
+        entries = self.lookup_fingerprints([fp for fp, _ in matches])
+        return [(entries[fp], similarity) for fp, similarity in matches if fp in entries]
+
+    def record_edit(self, module_content, instruction, modified_code, modification_manual, instruction_key=""):
+        """
+        Stores a successful LLM modification against the module it targeted. The
+        module body is kept as a blob so the edit can later be re-targeted onto
+        a similar module; instruction_key is the caller's normalised instruction.
+        """
+        source_blob_hash = self.blobs.put(module_content.strip())
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO module_edits (fingerprint, instruction, instruction_key, source_blob_hash,
+                                             modified_code, modification_manual, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (normalised_fingerprint(module_content), instruction, instruction_key, source_blob_hash,
+                 json.dumps(modified_code, ensure_ascii=False), modification_manual or "", time.time())
+            )
+
+    def prior_edits(self, module_content, threshold=0.8, limit=3):
+        """
+        Successful edits previously applied to this module or a near-duplicate of it,
+        newest first: [{instruction, instruction_key, source_blob_hash, modified_code,
+        modification_manual, similarity}]. A limit of None returns all of them.
+        """
+        similar = {normalised_fingerprint(module_content): 1.0}
+        for entry, similarity in self.find_similar(module_content, threshold=threshold):
+            similar.setdefault(entry["fingerprint"], similarity)
+        placeholders = ",".join("?" * len(similar))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT * FROM module_edits WHERE fingerprint IN ({placeholders})
+                    ORDER BY created_at DESC LIMIT ?""",
+                [*similar.keys(), -1 if limit is None else limit]
+            ).fetchall()
+        return [
+            {"instruction": row["instruction"], "instruction_key": row["instruction_key"],
+             "source_blob_hash": row["source_blob_hash"], "modified_code": json.loads(row["modified_code"]),
+             "modification_manual": row["modification_manual"], "similarity": similar[row["fingerprint"]]}
+            for row in rows
+        ]
+
+    def get_content(self, entry):
+        if "content" in entry: # Entry served from an attached pack
+            return entry["content"]
+        return self.blobs.get(entry["blob_hash"])
+
+    def record_hits(self, fingerprints):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE modules SET hit_count = hit_count + 1 WHERE fingerprint = ?",
+                [(f,) for f in fingerprints]
+            )
+
+    def iter_entries(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM modules ORDER BY created_at").fetchall()
+        for row in rows:
+            yield self._row_to_entry(row)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM modules").fetchone()[0]
+
+    def match_page(self, raw_html, min_candidate_chars=40, similarity_threshold=None,
+                   max_page_chars_for_similarity=NEAR_DUPLICATE_MAX_PAGE_CHARS):
+        """
+        Checks the exact and normalised fingerprints of every DOM subtree of
+        raw_html (both the whole element and its inner content) against the
+        library. If similarity_threshold is set, remaining module-sized
+        elements that carry an id or match a segment rule are then matched
+        against near-duplicates via MinHash/LSH (skipped on pages longer than
+        max_page_chars_for_similarity). A near-duplicate is labelled from its
+        own element, as the heuristic segmenter would, and keeps only the
+        library's fingerprint and similarity.
+        Returns (definitions, coverage): non-overlapping module definitions in
+        get_module_definitions() schema (largest matches win) and the fraction
+        of the <body> content they cover.
+        """
+        elements = parse_element_spans(raw_html)
+        body = next((e for e in elements if e["tag"] == "body"), None)
+        reference_length = (body["inner_end"] - body["inner_start"]) if body else len(raw_html)
+
+        candidates = []
+        for element in elements:
+            for start, end in ((element["start"], element["end"]), (element["inner_start"], element["inner_end"])):
+                text = raw_html[start:end]
+                if len(text.strip()) < min_candidate_chars:
+                    continue
+                # Match the stripped span so offsets agree with how original_content is stored
+                lead = len(text) - len(text.lstrip())
+                trail = len(text) - len(text.rstrip())
+                candidates.append((start + lead, end - trail, text.strip()))
+        if not candidates:
+            return [], 0.0
+
+        # A template block repeated on the page (cards, figures) has one fingerprint but several spans
+        exact, normalised = {}, {}
+        for s, e, text in candidates:
+            exact.setdefault(exact_fingerprint(text), []).append((s, e))
+            normalised.setdefault(normalised_fingerprint(text), []).append((s, e))
+        hits = {} # span -> entry
+        for fp, entry in self.lookup_fingerprints(exact.keys(), "exact_hash").items():
+            for span in exact[fp]:
+                hits[span] = entry
+        for fp, entry in self.lookup_fingerprints(normalised.keys()).items():
+            for span in normalised[fp]:
+                hits.setdefault(span, entry)
+
+        matches = [] # (start, end, entry, label or None, extra)
+
+        def overlaps_taken(start, end):
+            return any(start < m_end and m_start < end for m_start, m_end, *_ in matches)
+
+        for (start, end), entry in sorted(hits.items(), key=lambda item: item[0][1] - item[0][0], reverse=True):
+            if not overlaps_taken(start, end):
+                matches.append((start, end, entry, None, {}))
+
+        if similarity_threshold is not None and len(self._lsh()):
+            if len(raw_html) > max_page_chars_for_similarity:
+                logging.info(f"Module library: page of {len(raw_html):,} chars, near-duplicate pass skipped.")
+            else:
+                # Near-duplicate pass: template blocks that differ only in ids or text
+                for element in sorted(elements, key=lambda e: e["end"] - e["start"], reverse=True):
+                    start, end = element["start"], element["end"]
+                    if not min_candidate_chars <= end - start <= NEAR_DUPLICATE_MAX_CHARS:
+                        continue
+                    rule_index = match_rule(element)
+                    if (rule_index is None and "id" not in element["attrs"]) or overlaps_taken(start, end):
+                        continue
+                    similar = self.find_similar(raw_html[start:end], threshold=similarity_threshold, limit=1)
+                    if similar:
+                        entry, similarity = similar[0]
+                        rule = DEFAULT_SEGMENT_RULES[rule_index] if rule_index is not None else _library_label_rule(entry)
+                        label = label_element(raw_html, elements, element, rule)
+                        matches.append((start, end, entry, label, {"library_similarity": round(similarity, 3)}))
+
+        definitions, used_ids = [], {}
+        for start, end, entry, label, extra in sorted(matches, key=lambda m: m[0]):
+            module_id, description = label or (entry["module_id"], entry["description"])
+            module_id = unique_module_id(module_id, used_ids) # Same template module repeated on the page
+            definitions.append({
+                "id": module_id,
+                "description": description,
+                "start_char": start,
+                "end_char": end,
+                "start_comment": f"LLM_MODULE_START: {module_id}",
+                "end_comment": f"LLM_MODULE_END: {module_id}",
+                "library_fingerprint": entry["fingerprint"],
+                **extra
+            })
+        if definitions:
+            self.record_hits([d["library_fingerprint"] for d in definitions])
+        return definitions, sum(d["end_char"] - d["start_char"] for d in definitions) / max(1, reference_length)
+
+if __name__ == '__main__':
+    import tempfile
+    logging.basicConfig(level=logging.DEBUG)
+
+    library = ModuleLibrary(tempfile.mkdtemp())
+    anim = '<div class="animation-box" id="anim1-box">\n  <p>这是动画1的占位内容。</p>\n</div>'
+    library.add_modules([
+        {"id": "animation_box_1", "description": "动画1模块", "original_content": anim},
+        {"id": "page_footer", "description": "页脚", "original_content": "<footer><p>版权所有 &copy; 2025 MyCompany</p></footer>"},
+    ])
+    assert library.count() == 2
+
+    # Same template, different indentation: the normalised fingerprint still matches
+    page = ('<html><body><div class="main">'
+            '<div class="animation-box" id="anim1-box"><p>这是动画1的占位内容。</p></div>'
+            '</div>\n<footer><p>版权所有 &copy; 2025 MyCompany</p></footer></body></html>')
+    definitions, coverage = library.match_page(page)
+    print(json.dumps(definitions, indent=2, ensure_ascii=False))
+    assert [d["id"] for d in definitions] == ["animation_box_1", "page_footer"] and coverage > 0.8
+    assert page[definitions[1]["start_char"]:definitions[1]["end_char"]].startswith("<footer>")
+    # Every copy of a repeated block is matched, not just one per fingerprint
+    repeated = page.replace("</div>\n<footer>", '<div class="animation-box" id="anim1-box">\n<p>这是动画1的占位内容。</p></div></div>\n<footer>')
+    definitions, coverage = library.match_page(repeated)
+    assert [d["id"] for d in definitions] == ["animation_box_1", "animation_box_1_2", "page_footer"]
+    # A sibling animation box that differs only in ids and text is found via MinHash/LSH
+    container = ('<div class="animation-container" id="anim-container-1"><h3>动画模块 1</h3>'
+                 '<div class="animation-box" id="anim1-box"><p>这是动画1的占位内容。</p></div>'
+                 '<button onclick="playAnim1()">播放动画1</button><p>关于动画1的简短描述。</p></div>')
+    library.add_module("animation_container_1", "动画1容器，包含标题、动画框和播放按钮", container)
+    page2 = ('<html><body><div class="animation-container" id="anim-container-2"><h3>动画模块 2</h3>'
+             '<div class="animation-box" id="anim2-box"><p>这是动画2的占位内容。</p></div>'
+             '<button onclick="playAnim2()">播放动画2</button><p>关于动画2的简短描述。</p></div></body></html>')
+    definitions, coverage = library.match_page(page2, similarity_threshold=0.7)
+    print(json.dumps(definitions, indent=2, ensure_ascii=False))
+    # ... and labelled from its own element, not from the library module it resembles
+    assert definitions[0]["id"] == "animation_container_2" and "library_similarity" in definitions[0]
+    assert definitions[0]["library_fingerprint"] == normalised_fingerprint(container)
+    page8 = page2.replace("anim-container-2", "anim-container-8").replace("动画模块 2", "动画模块 8")
+    assert library.match_page(page8, similarity_threshold=0.7)[0][0]["description"] == "动画容器 8：动画模块 8"
+    library.record_edit(page2[definitions[0]["start_char"]:definitions[0]["end_char"]], "把动画2改成旋转立方体",
+                        {"html": "<div class='cube'></div>", "css": "", "js": ""}, "替换动画框")
+    assert library.prior_edits(page2[definitions[0]["start_char"]:definitions[0]["end_char"]])[0]["instruction"] == "把动画2改成旋转立方体"
+    print(extract_dependencies('<button onclick="playAnim1()">播放</button><div id="anim1-box" class="a b"></div>'))
+
+    # Export to a pack, then serve it from a fresh library by attaching (no import) and by importing
+    pack_path = os.path.join(library.library_dir, "export.pack")
+    assert library.export_pack(pack_path) == library.count()
+    fresh = ModuleLibrary(tempfile.mkdtemp())
+    fresh.attach_pack(pack_path)
+    definitions, coverage = fresh.match_page(page)
+    assert [d["id"] for d in definitions] == ["animation_box_1", "page_footer"] and fresh.count() == 0
+    assert fresh.import_pack(pack_path) == library.count() and fresh.import_pack(pack_path) == 0
+    print("\nModule Library Tests Completed.")
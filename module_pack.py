@@ -0,0 +1,218 @@
+# module_pack.py
+import heapq
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+
+from module_library import normalised_fingerprint
+
+# Layout (little-endian):
+#   header  | magic(8) version(u32) entry_count(u32) index_offset(u64) data_offset(u64) reserved(32)
+#   data    | zlib-compressed JSON module records, concatenated
+#   index   | entry_count x (fingerprint(32 raw bytes) offset(u64) length(u32) raw_length(u32)), sorted by fingerprint
+PACK_MAGIC = b"MODPACK\x00"
+PACK_VERSION = 1
+_HEADER = struct.Struct("<8sIIQQ32x")
+_INDEX_ENTRY = struct.Struct("<32sQII")
+# Module fields carried in a pack record (the shape main.Api keeps in llm_defined_modules)
+RECORD_FIELDS = ("id", "description", "original_content", "start_comment", "end_comment")
+
+
+class PackFormatError(ValueError):
+    pass
+
+
+def _encode_record(module):
+    record = {field: module.get(field, "") for field in RECORD_FIELDS}
+    raw = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, 6), len(raw)
+
+
+def _write_pack_file(path, records):
+    """
+    records: (fingerprint_bytes, compressed, raw_length) sorted by fingerprint with no
+    duplicates. Data is streamed, the index is written after it and the header last;
+    the file only appears at path once complete.
+    """
+    tmp_path = f"{path}.tmp"
+    index = []
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        offset = _HEADER.size
+        for fingerprint, compressed, raw_length in records:
+            f.write(compressed)
+            index.append(_INDEX_ENTRY.pack(fingerprint, offset, len(compressed), raw_length))
+            offset += len(compressed)
+        index_offset = offset
+        f.write(b"".join(index))
+        f.seek(0)
+        f.write(_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(index), index_offset, _HEADER.size))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(index)
+
+
+def write_pack(path, modules):
+    """
+    Writes module dicts ({id, description, original_content, ...}) to a pack,
+    keyed by the normalised fingerprint of original_content. Later duplicates win.
+    Returns the number of entries written.
+    """
+    by_fingerprint = {}
+    for module in modules:
+        content = module.get("original_content", "")
+        if not content.strip():
+            continue
+        by_fingerprint[bytes.fromhex(normalised_fingerprint(content))] = _encode_record(module)
+    return _write_pack_file(path, ((fp, *by_fingerprint[fp]) for fp in sorted(by_fingerprint)))
+
+
+def merge_packs(output_path, pack_paths):
+    """
+    Merges packs into one without decompressing records: a k-way merge of the
+    sorted index tables. When a fingerprint occurs in several packs, the pack
+    listed last wins, so an incremental pack can be merged over a base pack.
+    """
+    packs = [ModulePack(path) for path in pack_paths]
+    try:
+        def stream(rank, pack):
+            for fp, offset, length, raw_length in pack.iter_index():
+                yield fp, -rank, pack, offset, length, raw_length
+
+        streams = [stream(rank, pack) for rank, pack in enumerate(packs)]
+
+        def records():
+            previous = None
+            for fp, _, pack, offset, length, raw_length in heapq.merge(*streams, key=lambda item: (item[0], item[1])):
+                if fp == previous:
+                    continue
+                previous = fp
+                yield fp, pack.read_raw(offset, length), raw_length
+
+        return _write_pack_file(output_path, records())
+    finally:
+        for pack in packs:
+            pack.close()
+
+
+class ModulePack:
+    """
+    Read-only view of a pack file through mmap. Opening reads only the header;
+    get() binary-searches the index table in place and decompresses just the
+    requested record, so cold-start cost does not depend on the pack size.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e: # Empty file
+            self._file.close()
+            raise PackFormatError(f"{path}: not a module pack ({e})")
+        if len(self._mmap) < _HEADER.size:
+            self.close()
+            raise PackFormatError(f"{path}: truncated header")
+        magic, version, self.entry_count, self.index_offset, self.data_offset = _HEADER.unpack_from(self._mmap, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            self.close()
+            raise PackFormatError(f"{path}: bad magic/version {magic!r}/{version}")
+        if self.index_offset + self.entry_count * _INDEX_ENTRY.size > len(self._mmap):
+            self.close()
+            raise PackFormatError(f"{path}: index table exceeds file size")
+
+    def __len__(self):
+        return self.entry_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def _index_entry(self, i):
+        return _INDEX_ENTRY.unpack_from(self._mmap, self.index_offset + i * _INDEX_ENTRY.size)
+
+    def _find(self, fingerprint):
+        lo, hi = 0, self.entry_count
+        base, size = self.index_offset, _INDEX_ENTRY.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = self._mmap[base + mid * size:base + mid * size + 32]
+            if key < fingerprint:
+                lo = mid + 1
+            elif key > fingerprint:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def read_raw(self, offset, length):
+        return self._mmap[offset:offset + length]
+
+    def get(self, fingerprint_hex):
+        """The module record ({id, description, original_content, ...}) for a normalised fingerprint, or None."""
+        i = self._find(bytes.fromhex(fingerprint_hex))
+        if i is None:
+            return None
+        _, offset, length, _ = self._index_entry(i)
+        try:
+            return json.loads(zlib.decompress(self.read_raw(offset, length)))
+        except (zlib.error, ValueError) as e:
+            logging.warning(f"Module pack {self.path}: corrupt record for {fingerprint_hex}: {e}")
+            return None
+
+    def __contains__(self, fingerprint_hex):
+        return self._find(bytes.fromhex(fingerprint_hex)) is not None
+
+    def iter_index(self):
+        """(fingerprint_bytes, offset, length, raw_length) in fingerprint order."""
+        for i in range(self.entry_count):
+            yield self._index_entry(i)
+
+    def iter_modules(self):
+        for fingerprint, offset, length, _ in self.iter_index():
+            yield fingerprint.hex(), json.loads(zlib.decompress(self.read_raw(offset, length)))
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    logging.basicConfig(level=logging.DEBUG)
+
+    work_dir = tempfile.mkdtemp()
+    base_path, delta_path, merged_path = (os.path.join(work_dir, name) for name in ("base.pack", "delta.pack", "merged.pack"))
+    modules = [
+        {"id": f"animation_container_{i}", "description": f"动画{i}模块",
+         "original_content": f'<div class="animation-box" id="anim{i}-box"><p>动画{i}</p></div>',
+         "start_comment": f"LLM_MODULE_START: animation_container_{i}", "end_comment": f"LLM_MODULE_END: animation_container_{i}"}
+        for i in range(20000)
+    ]
+    assert write_pack(base_path, modules) == 20000
+    delta = [dict(modules[5], description="动画5模块 (更新)"),
+             {"id": "page_footer", "description": "页脚", "original_content": "<footer>版权所有</footer>"}]
+    write_pack(delta_path, delta)
+    assert merge_packs(merged_path, [base_path, delta_path]) == 20001
+
+    start = time.perf_counter()
+    with ModulePack(merged_path) as pack:
+        opened = time.perf_counter()
+        record = pack.get(normalised_fingerprint(modules[5]["original_content"]))
+        looked_up = time.perf_counter()
+        assert record["description"] == "动画5模块 (更新)" and record["start_comment"].endswith("animation_container_5")
+        assert pack.get(normalised_fingerprint("<footer>版权所有</footer>"))["id"] == "page_footer"
+        assert pack.get(normalised_fingerprint("<nav></nav>")) is None
+        assert sum(1 for _ in pack.iter_modules()) == len(pack) == 20001
+    print(f"open: {(opened - start) * 1000:.3f} ms, lookup: {(looked_up - opened) * 1000:.3f} ms, "
+          f"size: {os.path.getsize(merged_path) / 1024:.0f} KiB")
+    print("\nModule Pack Tests Completed.")
@@ -0,0 +1,166 @@
+# module_targeting.py
+import logging
+import re
+
+from search_index import ModuleSearchIndex, code_identifiers
+
+# Chinese keywords in instructions -> identifier stems commonly used for them in the markup
+DEFAULT_KEYWORD_ALIASES = {
+    "动画": ["anim", "animation"],
+    "页眉": ["header"],
+    "页脚": ["footer"],
+    "导航": ["nav", "navbar", "menu"],
+    "菜单": ["menu", "nav"],
+    "按钮": ["button", "btn"],
+    "图表": ["chart", "graph", "plot"],
+    "图片": ["img", "image", "figure"],
+    "表格": ["table"],
+    "标题": ["title", "heading"],
+    "侧边栏": ["sidebar", "aside"],
+    "表单": ["form"],
+    "视频": ["video"],
+    "公式": ["formula", "math", "equation"],
+    "背景": ["background", "body"],
+    "文本": ["text", "content"],
+    "段落": ["paragraph", "text"],
+    "摘要": ["abstract", "summary"],
+    "引言": ["intro", "introduction"],
+    "结论": ["conclusion"],
+}
+
+_MENTION_RE = re.compile(r"([一-鿿]+|[A-Za-z][A-Za-z_-]*?)[\s_-]*(\d+)")
+_NUMBER_RE = re.compile(r"\d+")
+_IDENTIFIER_TOKEN_RE = re.compile(r"[A-Za-z_$#.][\w$-]*")
+
+# Weights of the scoring features
+LEXICAL_WEIGHT = 1.0
+IDENTIFIER_WEIGHT = 2.0
+NUMBER_MATCH_WEIGHT = 1.5
+NUMBER_CONFLICT_PENALTY = 1.5
+
+
+def _mentions(text):
+    """Numbered mentions such as 动画1 / anim 2 / 图表3 -> [(stem, number)]."""
+    return [(stem.lower(), number) for stem, number in _MENTION_RE.findall(text or "")]
+
+
+def _module_identifiers(module):
+    """Module id plus the ids, classes, selectors and function names in its content."""
+    identifiers = {module["id"].lower()}
+    identifiers.update(i.lower() for i in code_identifiers(module.get("original_content", "")).split())
+    return identifiers
+
+
+class ModuleTargeter:
+    """
+    Ranks the modules of a page against an instruction without calling the
+    LLM. The score combines BM25 over ids/descriptions/code identifiers (with
+    Chinese keywords expanded to their usual identifier stems), explicit
+    mentions of ids/selectors/functions, and agreement of numbered mentions
+    (动画1 prefers anim1-box/playAnim1 and is penalised on anim2-box).
+    """
+
+    def __init__(self, module_definitions, keyword_aliases=None):
+        self.modules = [m for m in module_definitions if m.get("id")]
+        self.keyword_aliases = DEFAULT_KEYWORD_ALIASES if keyword_aliases is None else keyword_aliases
+        self.index = ModuleSearchIndex()
+        self._identifiers = {}
+        self._numbers = {}         # numbers in the module's id and description: which block it is
+        self._content_numbers = {} # numbers in its identifiers, e.g. a text-block-1 inside animation 2
+        for module in self.modules:
+            code = code_identifiers(module.get("original_content", ""))
+            self.index.add(module["id"], module["id"], module.get("description", ""), code)
+            identifiers = _module_identifiers(module)
+            self._identifiers[module["id"]] = identifiers
+            self._numbers[module["id"]] = set(_NUMBER_RE.findall(module["id"] + " " + module.get("description", "")))
+            self._content_numbers[module["id"]] = set(_NUMBER_RE.findall(" ".join(identifiers)))
+
+    def _expand_query(self, instruction):
+        expansions = [instruction]
+        for keyword, aliases in self.keyword_aliases.items():
+            if keyword in instruction:
+                expansions.extend(aliases)
+        for stem, number in _mentions(instruction):
+            for alias in self.keyword_aliases.get(stem, [stem]):
+                expansions.append(f"{alias}{number}")
+        return " ".join(expansions)
+
+    def rank(self, instruction, extra_text="", limit=None):
+        """
+        Returns [{id, score, confidence, reasons}] best first. extra_text (e.g.
+        HTML the LLM reported as the target) is matched like the instruction.
+        confidence is the top score's share of the top-two total (1.0 when only
+        one module scores at all).
+        """
+        query = self._expand_query(f"{instruction} {extra_text}".strip())
+        lexical = {key: score for key, score, _ in self.index.search(query, limit=len(self.modules) or 1)}
+        top_lexical = max(lexical.values(), default=0.0) or 1.0
+
+        query_tokens = {t.lstrip("#.").lower() for t in _IDENTIFIER_TOKEN_RE.findall(f"{instruction} {extra_text}")}
+        mention_numbers = {number for _, number in _mentions(instruction)}
+
+        ranked = []
+        for module in self.modules:
+            module_id = module["id"]
+            reasons = []
+            score = LEXICAL_WEIGHT * lexical.get(module_id, 0.0) / top_lexical
+            if module_id in lexical:
+                reasons.append(f"lexical {lexical[module_id] / top_lexical:.2f}")
+
+            named = query_tokens & self._identifiers[module_id]
+            if named:
+                score += IDENTIFIER_WEIGHT * len(named)
+                reasons.append("names " + ", ".join(sorted(named)))
+
+            own_numbers = self._numbers[module_id] or self._content_numbers[module_id]
+            if mention_numbers and own_numbers and score > 0:
+                if mention_numbers & own_numbers:
+                    score += NUMBER_MATCH_WEIGHT
+                    reasons.append("number " + ", ".join(sorted(mention_numbers & own_numbers)))
+                else:
+                    score -= NUMBER_CONFLICT_PENALTY
+                    reasons.append("number conflict")
+
+            if score > 0:
+                ranked.append({"id": module_id, "score": round(score, 3), "reasons": reasons})
+
+        ranked.sort(key=lambda item: item["score"], reverse=True)
+        for i, item in enumerate(ranked):
+            runner_up = ranked[1]["score"] if i == 0 and len(ranked) > 1 else (ranked[0]["score"] if i else 0.0)
+            item["confidence"] = round(item["score"] / (item["score"] + runner_up), 3)
+        return ranked[:limit] if limit else ranked
+
+    def pick_target(self, instruction, extra_text="", min_confidence=0.6):
+        """The single best module id if it wins clearly enough, else None."""
+        ranked = self.rank(instruction, extra_text)
+        if ranked and ranked[0]["confidence"] >= min_confidence:
+            logging.info(f"Local targeting picked '{ranked[0]['id']}' (confidence {ranked[0]['confidence']}, {'; '.join(ranked[0]['reasons'])}).")
+            return ranked[0]["id"]
+        logging.info(f"Local targeting found no clear target for instruction (candidates: {[r['id'] for r in ranked[:3]]}).")
+        return None
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    def animation(n):
+        return (f'<div class="animation-container" id="anim-container-{n}"><h3>动画模块 {n}</h3>'
+                f'<div class="animation-box" id="anim{n}-box"></div><button onclick="playAnim{n}()">播放动画{n}</button></div>')
+
+    modules = [
+        {"id": "page_header", "description": "页眉和标题", "original_content": "<header><h1>论文解读</h1></header>"},
+        {"id": "animation_container_1", "description": "动画模块 1", "original_content": animation(1)},
+        {"id": "animation_container_2", "description": "动画模块 2", "original_content": animation(2)},
+        {"id": "page_footer", "description": "页脚版权信息", "original_content": "<footer><p>版权所有</p></footer>"},
+    ]
+    targeter = ModuleTargeter(modules)
+    for instruction in ("把动画1改成旋转立方体", "动画 2 的播放速度加快", "修改 #anim2-box 的边框", "让 playAnim1 循环播放", "页脚改成深色"):
+        ranked = targeter.rank(instruction, limit=2)
+        print(instruction, "->", ranked)
+    assert targeter.pick_target("把动画1改成旋转立方体") == "animation_container_1"
+    assert targeter.pick_target("动画 2 的播放速度加快") == "animation_container_2"
+    assert targeter.pick_target("修改 #anim2-box 的边框") == "animation_container_2"
+    assert targeter.pick_target("让 playAnim1 循环播放") == "animation_container_1"
+    assert targeter.pick_target("页脚改成深色") == "page_footer"
+    assert targeter.pick_target("整体优化一下") is None
+    print("\nModule Targeting Tests Completed.")
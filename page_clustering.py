@@ -0,0 +1,209 @@
+# page_clustering.py
+import logging
+import re
+
+from dom_utils import parse_element_spans
+from minhash_index import MinHasher, MinHashLSHIndex
+
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def _element_label(element):
+    """tag plus id/first class with digits masked: generated pages differ mostly in numbering."""
+    label = element["tag"]
+    attrs = element["attrs"]
+    if attrs.get("id"):
+        label += "#" + _DIGITS_RE.sub("#", attrs["id"])
+    if attrs.get("class", "").split():
+        label += "." + _DIGITS_RE.sub("#", attrs["class"].split()[0])
+    return label
+
+
+def _label_paths(elements):
+    paths = []
+    for element in elements:
+        parent = element["parent"]
+        paths.append((paths[parent] + "/" if parent is not None else "") + _element_label(element))
+    return paths
+
+
+def structure_shingles(html, k=3):
+    """
+    Structural sketch of a page: every element's root-to-element label path,
+    plus k-grams of consecutive paths in document order (so the number and
+    order of repeated blocks also counts). Text content is ignored.
+    """
+    paths = _label_paths(parse_element_spans(html))
+    result = set(paths)
+    result.update(" | ".join(paths[i:i + k]) for i in range(len(paths) - k + 1))
+    return result
+
+
+def _structural_keys(elements):
+    """Per element: (child index path, occurrence key of its label path) used for alignment."""
+    index_paths, child_counts = [], {}
+    for element in elements:
+        parent = element["parent"]
+        ordinal = child_counts.get(parent, 0)
+        child_counts[parent] = ordinal + 1
+        index_paths.append((index_paths[parent] if parent is not None else ()) + (ordinal,))
+    label_paths = _label_paths(elements)
+    occurrences, seen = [], {}
+    for path in label_paths:
+        seen[path] = seen.get(path, 0) + 1
+        occurrences.append((path, seen[path]))
+    return index_paths, label_paths, occurrences
+
+
+def _top_elements(elements, start, end):
+    """Outermost elements lying within [start, end)."""
+    inside = [e for e in elements if start <= e["start"] and e["end"] <= end]
+    inside_ids = {e["index"] for e in inside}
+    return [e for e in inside if e["parent"] not in inside_ids]
+
+
+def align_definitions(source_html, source_definitions, target_html):
+    """
+    Maps module definitions made for source_html onto target_html, a page of
+    the same template. Each definition's outermost elements are located in the
+    target by child-index path (with matching label path), or else by being the
+    n-th occurrence of the same label path. Returns (aligned, failed_ids);
+    aligned keeps the get_module_definitions() schema with target offsets.
+    """
+    source_elements = parse_element_spans(source_html)
+    target_elements = parse_element_spans(target_html)
+    src_index, src_labels, src_occ = _structural_keys(source_elements)
+    tgt_index, tgt_labels, tgt_occ = _structural_keys(target_elements)
+    by_index = {path: i for i, path in enumerate(tgt_index)}
+    by_occurrence = {occ: i for i, occ in enumerate(tgt_occ)}
+
+    def locate(source_element):
+        i = source_element["index"]
+        j = by_index.get(src_index[i])
+        if j is not None and tgt_labels[j] == src_labels[i]:
+            return target_elements[j]
+        j = by_occurrence.get(src_occ[i])
+        return target_elements[j] if j is not None else None
+
+    aligned, failed, taken = [], [], []
+    for definition in source_definitions:
+        tops = _top_elements(source_elements, definition.get("start_char", 0), definition.get("end_char", 0))
+        mapped = [locate(e) for e in tops]
+        if not tops or any(m is None for m in mapped) or any(a["start"] >= b["start"] for a, b in zip(mapped, mapped[1:])):
+            failed.append(definition.get("id"))
+            continue
+        start, end = mapped[0]["start"], mapped[-1]["end"]
+        if any(start < t_end and t_start < end for t_start, t_end in taken):
+            failed.append(definition.get("id"))
+            continue
+        taken.append((start, end))
+        aligned.append({**definition, "start_char": start, "end_char": end})
+    aligned.sort(key=lambda d: d["start_char"])
+    return aligned, failed
+
+
+class PageClusterer:
+    """
+    Greedy leader clustering of pages by MinHash similarity of their
+    structure sketches. Each cluster is represented by its first page; a new
+    page joins the most similar representative above threshold (found via
+    LSH, so cost per page does not grow with the number of clusters).
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, bands=32):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm)
+        self.index = MinHashLSHIndex(num_perm=num_perm, bands=bands)
+        self.clusters = {} # representative page_id -> [member page_ids], representative first
+
+    def add(self, page_id, html):
+        """Assigns a page to a cluster. Returns (representative_id, similarity); similarity 1.0 for new clusters."""
+        signature = self.hasher.signature_from_shingles(structure_shingles(html))
+        matches = self.index.query(signature, threshold=self.threshold, limit=1)
+        if matches:
+            representative, similarity = matches[0]
+            self.clusters[representative].append(page_id)
+            return representative, similarity
+        self.index.add(page_id, signature)
+        self.clusters[page_id] = [page_id]
+        return page_id, 1.0
+
+
+def define_modules_for_pages(pages, define_fn, threshold=0.8):
+    """
+    Batch module definition with one define_fn call per template cluster.
+    pages: {page_id: html}. define_fn(html) returns a get_module_definitions()
+    response. Cluster members get the representative's definitions mapped by
+    align_definitions(); members where any definition fails to align are sent
+    to define_fn themselves. Returns ({page_id: result}, stats), where result
+    is {status, message, definitions, source, representative} and source is
+    "llm", "aligned" or "llm_fallback".
+    """
+    clusterer = PageClusterer(threshold=threshold)
+    representative_of = {page_id: clusterer.add(page_id, html)[0] for page_id, html in pages.items()}
+    results, llm_calls = {}, 0
+
+    for representative, members in clusterer.clusters.items():
+        response = define_fn(pages[representative])
+        llm_calls += 1
+        results[representative] = {**response, "definitions": response.get("definitions", []), "source": "llm", "representative": representative}
+        representative_ok = response.get("status") == "success" and response.get("definitions")
+        for member in members[1:]:
+            if representative_ok:
+                aligned, failed = align_definitions(pages[representative], response["definitions"], pages[member])
+                if not failed:
+                    results[member] = {"status": "success", "message": f"模块定义由同模板页面 {representative} 映射而来。",
+                                       "definitions": aligned, "source": "aligned", "representative": representative}
+                    continue
+                logging.info(f"Page '{member}': {len(failed)} definitions failed to align with '{representative}' ({failed}); calling LLM.")
+            fallback = define_fn(pages[member])
+            llm_calls += 1
+            results[member] = {**fallback, "definitions": fallback.get("definitions", []), "source": "llm_fallback", "representative": representative}
+
+    stats = {
+        "pages": len(pages),
+        "clusters": len(clusterer.clusters),
+        "llm_calls": llm_calls,
+        "aligned": sum(1 for r in results.values() if r["source"] == "aligned"),
+        "fallbacks": sum(1 for r in results.values() if r["source"] == "llm_fallback"),
+    }
+    logging.info(f"Batch definitions: {stats}")
+    return {page_id: results[page_id] for page_id in representative_of}, stats
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    def paper_page(title, animations, footer=True):
+        blocks = "".join(
+            f'\n<div class="animation-container" id="anim-container-{n}"><h3>动画 {n}</h3>'
+            f'<div class="animation-box" id="anim{n}-box"></div><button onclick="playAnim{n}()">播放</button></div>'
+            for n in range(1, animations + 1)
+        )
+        return (f'<html><head><title>{title}</title></head><body>\n<header><h1>{title}</h1></header>'
+                f'\n<div class="container">{blocks}\n</div>' + ("\n<footer><p>版权所有</p></footer>" if footer else "") + "\n</body></html>")
+
+    def fake_define(html):
+        # Stand-in for LLMHandler.get_module_definitions: header, each animation container, footer
+        definitions = []
+        for e in parse_element_spans(html):
+            if e["tag"] in ("header", "footer") or "animation-container" in e["attrs"].get("class", ""):
+                module_id = e["attrs"].get("id", e["tag"]).replace("-", "_")
+                definitions.append({"id": module_id, "description": module_id, "start_char": e["start"], "end_char": e["end"],
+                                    "start_comment": f"LLM_MODULE_START: {module_id}", "end_comment": f"LLM_MODULE_END: {module_id}"})
+        return {"status": "success", "message": "ok", "definitions": definitions}
+
+    pages = {f"paper_{i}.html": paper_page(f"论文 {i}", 8) for i in range(30)}
+    pages["short.html"] = paper_page("短论文", 6)           # same template, fewer blocks
+    pages["other.html"] = "<html><body><nav><ul><li>首页</li></ul></nav><main><table><tr><td>1</td></tr></table></main></body></html>"
+    results, stats = define_modules_for_pages(pages, fake_define)
+    print(stats)
+    assert stats["llm_calls"] <= 3 and stats["aligned"] >= 29
+    # paper_12's longer title shifts every offset; the aligned spans must still be exact
+    assert results["paper_12.html"]["source"] == "aligned"
+    assert results["paper_12.html"]["definitions"] == fake_define(pages["paper_12.html"])["definitions"]
+    for page_id in ("paper_12.html", "short.html"):
+        html = pages[page_id]
+        footer = next(d for d in results[page_id]["definitions"] if d["id"] == "footer")
+        assert html[footer["start_char"]:footer["end_char"]] == "<footer><p>版权所有</p></footer>"
+    print("\nPage Clustering Tests Completed.")
@@ -0,0 +1,138 @@
+# page_generator.py
+import base64
+import random
+
+_STYLE = """body { font-family: sans-serif; margin: 20px; background-color: #f0f0f0; }
+header, footer { padding: 1em; background-color: #e0e0e0; text-align: center; }
+.container { max-width: 960px; margin: 0 auto; }
+.animation-container { border: 1px solid #ccc; padding: 15px; margin-bottom: 20px; background-color: #fff; }
+.animation-box { min-height: 150px; background-color: #eef; display: flex; align-items: center; justify-content: center; }
+.formula { overflow-x: auto; margin: 1em 0; }
+figure svg { max-width: 100%; height: auto; }"""
+
+_SENTENCES = [
+    "本文提出了一种基于注意力机制的序列建模方法，显著降低了长距离依赖的学习难度。",
+    "实验表明，该方法在多个基准数据集上取得了优于循环神经网络的结果。",
+    "The attention weights are computed from queries and keys, then applied to the values.",
+    "多头注意力允许模型在不同的表示子空间中同时关注不同位置的信息。",
+    "Layer normalisation and residual connections stabilise training of deep stacks.",
+    "位置编码为模型提供了序列中各元素的相对或绝对位置信息。",
+]
+_FORMULAS = [
+    r"$$\mathrm{Attention}(Q, K, V) = \mathrm{softmax}\left(\frac{QK^T}{\sqrt{d_k}}\right) V$$",
+    r"\(PE_{(pos, 2i)} = \sin\left(pos / 10000^{2i/d_{model}}\right)\)",
+    r"$$\mathrm{MultiHead}(Q, K, V) = \mathrm{Concat}(\mathrm{head}_1, \ldots, \mathrm{head}_h) W^O$$",
+]
+
+
+def _paragraphs(rng, target_chars):
+    parts, length = [], 0
+    while length < target_chars:
+        sentences = "".join(rng.choice(_SENTENCES) for _ in range(rng.randint(2, 5)))
+        paragraph = f"<p>{sentences}</p>\n"
+        parts.append(paragraph)
+        length += len(paragraph)
+    return "".join(parts)
+
+
+def _svg(rng, n, points=12):
+    path = " ".join(f"L{rng.randint(0, 400)},{rng.randint(0, 200)}" for _ in range(points))
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 200" id="fig{n}-svg">'
+            f'<rect width="400" height="200" fill="#fafafa"/><path d="M0,100 {path}" stroke="#36c" fill="none"/>'
+            f'<text x="10" y="20" font-size="14">图 {n}</text></svg>')
+
+
+def _block(rng, kind, n, filler_chars):
+    """One top-level module of the given kind; returns (module_id, description, html)."""
+    if kind == "section":
+        formula = rng.choice(_FORMULAS)
+        return (f"section_{n}", f"第 {n} 节：正文与公式",
+                f'<section id="section-{n}">\n<h2>{n}. 方法解读</h2>\n{_paragraphs(rng, filler_chars)}'
+                f'<div class="formula">{formula}</div>\n</section>')
+    if kind == "animation":
+        return (f"animation_container_{n}", f"动画模块 {n}",
+                f'<div class="animation-container" id="anim-container-{n}">\n<h3>动画模块 {n}：注意力权重可视化</h3>\n'
+                f'<div class="animation-box" id="anim{n}-box"><p>点击播放动画</p></div>\n'
+                f'<button onclick="playAnim{n}()">播放动画{n}</button>\n{_paragraphs(rng, filler_chars)}</div>')
+    return (f"figure_{n}", f"图 {n}：结果曲线",
+            f'<figure id="figure-{n}">\n{_svg(rng, n)}\n<figcaption>图 {n}：训练损失随步数的变化</figcaption>\n'
+            f'{_paragraphs(rng, filler_chars)}</figure>')
+
+
+def _script(module_count, vendor_chars):
+    functions = "\n".join(
+        f"function playAnim{n}() {{\n  const box = document.getElementById('anim{n}-box');\n"
+        f"  box.style.transform = 'rotate(' + (Date.now() % 360) + 'deg)';\n  MathJax.typesetPromise(['#anim{n}-box']);\n}}"
+        for n in range(1, module_count + 1, 3) # Every third block is an animation
+    )
+    vendor = ""
+    if vendor_chars:
+        unit = "!function(e,t){\"object\"==typeof exports?module.exports=t():e.vendor=t()}(this,function(){var n=[];return n.map(function(r){return r*2})});"
+        vendor = f"\n<script>/* vendor.min.js */{unit * (vendor_chars // len(unit) + 1)}</script>"
+    return vendor + f"\n<script>\n{functions}\n</script>"
+
+
+def generate_paper_page(target_bytes=100_000, module_count=10, seed=0, embed_assets=True):
+    """
+    Synthetic paper-interpretation page: header, nav, module_count blocks cycling
+    section (paragraphs + MathJax) / animation container / figure (inline SVG),
+    footer, a script with one playAnimN() per animation and, with embed_assets,
+    a base64 image and a minified vendor script. Paragraph filler is spread over
+    the blocks to approach target_bytes (UTF-8); the page never goes below the
+    size its blocks need. Returns (html, definitions) where definitions are the
+    blocks as exact get_module_definitions() entries (header and footer included).
+    """
+    rng = random.Random(seed)
+    kinds = ("section", "animation", "figure")
+    vendor_chars = min(200_000, target_bytes // 10) if embed_assets else 0
+    image = ""
+    if embed_assets:
+        payload = base64.b64encode(bytes(rng.getrandbits(8) for _ in range(min(30_000, target_bytes // 20)))).decode("ascii")
+        image = f'<img id="cover" alt="封面" src="data:image/png;base64,{payload}">\n'
+    # Block text is mostly CJK (3 bytes per char in UTF-8) mixed with ASCII: ~2 bytes per char on average
+    fixed_bytes = 2000 + len(_STYLE) + vendor_chars + len(image) + module_count * 420
+    filler_chars = max(0, (target_bytes - fixed_bytes) // max(1, module_count) // 2)
+
+    parts, definitions, length = [], [], 0
+
+    def append(text):
+        nonlocal length
+        parts.append(text)
+        length += len(text)
+
+    def append_module(module_id, description, html):
+        definitions.append({"id": module_id, "description": description, "start_char": length, "end_char": length + len(html),
+                            "start_comment": f"LLM_MODULE_START: {module_id}", "end_comment": f"LLM_MODULE_END: {module_id}"})
+        append(html)
+
+    append(f'<!DOCTYPE html>\n<html lang="zh-CN">\n<head>\n<meta charset="UTF-8">\n<title>论文解读（合成页面）</title>\n'
+           f'<script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"></script>\n<style>\n{_STYLE}\n</style>\n</head>\n<body>\n')
+    append_module("page_header", "页眉和论文标题", f"<header>\n<h1>论文解读：Attention Is All You Need</h1>\n{image}</header>")
+    append('\n<nav><ul><li><a href="#section-1">方法</a></li><li><a href="#figure-3">结果</a></li></ul></nav>\n<div class="container">\n')
+    for n in range(1, module_count + 1):
+        append_module(*_block(rng, kinds[(n - 1) % 3], n, filler_chars))
+        append("\n")
+    append("</div>\n")
+    append_module("page_footer", "页脚版权信息", "<footer><p>版权所有 &copy; 2025 论文解读</p></footer>")
+    append(_script(module_count, vendor_chars) + "\n</body>\n</html>\n")
+    return "".join(parts), definitions
+
+
+if __name__ == '__main__':
+    import time
+    from dom_utils import parse_element_spans
+
+    html, definitions = generate_paper_page(20_000, 6, seed=1)
+    assert html[definitions[0]["start_char"]:definitions[0]["end_char"]].startswith("<header>")
+    assert html[definitions[-1]["start_char"]:definitions[-1]["end_char"]].endswith("</footer>")
+    assert [d["id"] for d in definitions[1:4]] == ["section_1", "animation_container_2", "figure_3"]
+    spans = {(e["start"], e["end"]) for e in parse_element_spans(html)}
+    assert all((d["start_char"], d["end_char"]) in spans for d in definitions) # Every module is exactly one element
+    assert generate_paper_page(20_000, 6, seed=1)[0] == html # Deterministic for a seed
+    for target, modules in ((10_000, 1), (1_000_000, 100), (10_000_000, 5000)):
+        start = time.perf_counter()
+        html, definitions = generate_paper_page(target, modules)
+        size = len(html.encode("utf-8"))
+        print(f"target {target:>10,} B, {modules:>4} modules -> {size:>10,} B in {(time.perf_counter() - start) * 1000:.0f} ms")
+        assert len(definitions) == modules + 2 and 0.5 * target <= size <= 2 * target
+    print("\nPage Generator Tests Completed.")
@@ -0,0 +1,167 @@
+# prompt_compaction.py
+import hashlib
+import re
+from bisect import bisect_right
+
+# Base64 data of data: URIs (the "data:<mime>;base64," prefix stays in the prompt)
+_DATA_URI_RE = re.compile(r"data:[\w/+.-]+(?:;[\w=.-]+)*;base64,([A-Za-z0-9+/=\s]+)")
+# Path data of SVG <path d="..."> / <polyline points="..."> attributes
+_SVG_PATH_RE = re.compile(r"""\s(?:d|points)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+_SCRIPT_RE = re.compile(r"<script\b([^>]*)>(.*?)</script\s*>", re.DOTALL | re.IGNORECASE)
+_MATHJAX_CONFIG_RE = re.compile(r"(?:window\.)?MathJax\s*=\s*\{|MathJax\.Hub\.Config\s*\(")
+_PLACEHOLDER_RE = re.compile(r"__(?:B64|SVGPATH|SCRIPT|MATHJAX)_[0-9a-f]{8}__")
+MINIFIED_LINE_CHARS = 500 # A script with a line this long is treated as minified (vendor) code
+
+PROMPT_NOTE = ("注意：下方代码中形如 __B64_1a2b3c4d__、__SVGPATH_…__、__SCRIPT_…__、__MATHJAX_…__ 的占位符代表已省略的长内容"
+               "（base64 数据、SVG 路径、压缩脚本、MathJax 配置）。它们与模块划分无关；如需输出包含它们的代码，请原样保留占位符，不要改写或展开。\n\n")
+
+
+class PromptCompaction:
+    """
+    A page with bulky opaque payloads replaced by short placeholders, and the
+    map back to the original: positions in the compacted text translate to
+    original positions, placeholders in LLM output expand to their payloads.
+    """
+
+    def __init__(self, original, compacted, replacements):
+        self.original = original
+        self.compacted = compacted
+        self.replacements = replacements # [(compact_start, compact_end, original_start, original_end, placeholder)], sorted
+        self._compact_starts = [r[0] for r in replacements]
+        self.payloads = {r[4]: original[r[2]:r[3]] for r in replacements}
+
+    @property
+    def ratio(self):
+        return len(self.original) / max(1, len(self.compacted))
+
+    def to_original(self, position, side="start"):
+        """An offset in the compacted text as an offset in the original; inside a placeholder it snaps to the payload's start or end."""
+        i = bisect_right(self._compact_starts, position) - 1
+        if i < 0:
+            return position
+        compact_start, compact_end, original_start, original_end, _ = self.replacements[i]
+        if position >= compact_end:
+            return position - compact_end + original_end
+        if position == compact_start:
+            return original_start
+        return original_end if side == "end" else original_start
+
+    def restore_definitions(self, definitions):
+        """Module definitions with start_char/end_char translated to the original page (other fields untouched)."""
+        restored = []
+        for definition in definitions:
+            definition = dict(definition) if isinstance(definition, dict) else definition
+            if isinstance(definition, dict):
+                for key, side in (("start_char", "start"), ("end_char", "end")):
+                    try:
+                        definition[key] = self.to_original(int(definition[key]), side)
+                    except (KeyError, TypeError, ValueError):
+                        pass
+            restored.append(definition)
+        return restored
+
+    def expand(self, text):
+        """Placeholders in text replaced by their original payloads; unknown placeholders are left as they are."""
+        if not isinstance(text, str) or "__" not in text:
+            return text
+        return _PLACEHOLDER_RE.sub(lambda m: self.payloads.get(m.group(0), m.group(0)), text)
+
+    def expand_code(self, modified_code):
+        """expand() over every string value of a modified_code dict ({html, css, js})."""
+        if not isinstance(modified_code, dict):
+            return modified_code
+        return {key: self.expand(value) for key, value in modified_code.items()}
+
+
+def _placeholder(kind, payload):
+    return f"__{kind}_{hashlib.sha1(payload.encode('utf-8')).hexdigest()[:8]}__"
+
+
+def _find_payloads(html, min_chars):
+    """(start, end, kind) of every replaceable payload; overlapping finds keep the earliest."""
+    found = []
+    for match in _SCRIPT_RE.finditer(html):
+        attrs, body = match.group(1), match.group(2)
+        if len(body.strip()) < min_chars:
+            continue
+        if "mathjax-config" in attrs.lower() or _MATHJAX_CONFIG_RE.search(body):
+            found.append((match.start(2), match.end(2), "MATHJAX"))
+        elif max(len(line) for line in body.splitlines()) >= MINIFIED_LINE_CHARS:
+            found.append((match.start(2), match.end(2), "SCRIPT"))
+    for match in _DATA_URI_RE.finditer(html):
+        if match.end(1) - match.start(1) >= min_chars:
+            found.append((match.start(1), match.end(1), "B64"))
+    for match in _SVG_PATH_RE.finditer(html):
+        group = 1 if match.group(1) is not None else 2
+        if match.end(group) - match.start(group) >= min_chars:
+            found.append((match.start(group), match.end(group), "SVGPATH"))
+    found.sort()
+    kept, last_end = [], -1
+    for start, end, kind in found:
+        if start >= last_end:
+            kept.append((start, end, kind))
+            last_end = end
+    return kept
+
+
+def compact_html(html, min_chars=256):
+    """
+    Replaces base64 data, SVG path data, minified scripts and MathJax
+    configuration blocks of at least min_chars with stable placeholders
+    (the same payload always gets the same placeholder). Returns a PromptCompaction.
+    """
+    parts, replacements, cursor, compact_length = [], [], 0, 0
+    for start, end, kind in _find_payloads(html, min_chars):
+        placeholder = _placeholder(kind, html[start:end])
+        parts.append(html[cursor:start])
+        compact_length += start - cursor
+        replacements.append((compact_length, compact_length + len(placeholder), start, end, placeholder))
+        parts.append(placeholder)
+        compact_length += len(placeholder)
+        cursor = end
+    parts.append(html[cursor:])
+    return PromptCompaction(html, "".join(parts), replacements)
+
+
+if __name__ == '__main__':
+    from page_generator import generate_paper_page
+
+    base, base_definitions = generate_paper_page(200_000, 12, seed=3)
+    long_path = "L1,2 C3,4 5,6 7,8 " * 30
+    mathjax_config = ("<script>window.MathJax = { tex: { inlineMath: [['$', '$']] }, "
+                      + "options: { skipHtmlTags: ['script', 'noscript', 'style', 'textarea', 'pre'] }, " * 4 + "};</script>\n")
+    html = base.replace("</head>", mathjax_config + "</head>", 1).replace("M0,100 ", "M0,100 " + long_path, 1) # figure_3's SVG
+    definitions = []
+    for d in base_definitions:
+        module = base[d["start_char"]:d["end_char"]]
+        if d["id"] == "figure_3":
+            module = module.replace("M0,100 ", "M0,100 " + long_path, 1)
+        start = html.index(module)
+        definitions.append({**d, "start_char": start, "end_char": start + len(module)})
+    assert all(html[d["start_char"]:d["end_char"]].startswith("<") for d in definitions)
+
+    compaction = compact_html(html)
+    kinds = sorted({r[4].split("_")[2] for r in compaction.replacements})
+    print(f"{len(html):,} -> {len(compaction.compacted):,} chars (x{compaction.ratio:.1f}), placeholders: {kinds}")
+    assert kinds == ["B64", "MATHJAX", "SCRIPT", "SVGPATH"]
+    assert "playAnim1()" in compaction.compacted # The page's own (readable) script is kept
+
+    # Spans found in the compacted page map back to the same modules in the original
+    compact_definitions = []
+    for d in definitions:
+        module = html[d["start_char"]:d["end_char"]]
+        compact_module = compact_html(module).compacted
+        start = compaction.compacted.index(compact_module)
+        compact_definitions.append({**d, "start_char": start, "end_char": start + len(compact_module)})
+    assert compaction.restore_definitions(compact_definitions) == definitions
+
+    # A span ending inside a placeholder snaps to the end of its payload
+    b64 = next(r for r in compaction.replacements if "B64" in r[4])
+    assert compaction.to_original(b64[0] + 3, "end") == b64[3] and compaction.to_original(b64[0] + 3) == b64[2]
+
+    # Placeholders in modified code expand back to the payloads
+    header = compaction.compacted[compact_definitions[0]["start_char"]:compact_definitions[0]["end_char"]]
+    modified = {"html": header.replace("<h1>", '<h1 class="new">'), "css": "", "js": ""}
+    assert compaction.expand_code(modified)["html"] == html[definitions[0]["start_char"]:definitions[0]["end_char"]].replace("<h1>", '<h1 class="new">')
+    assert compact_html(html).compacted == compaction.compacted # Stable placeholders
+    print("\nPrompt Compaction Tests Completed.")
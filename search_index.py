@@ -0,0 +1,204 @@
+# search_index.py
+import heapq
+import math
+import re
+import threading
+
+_CJK_RUN_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_CAMEL_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+_CODE_IDENT_RES = (
+    re.compile(r"""\b(?:id|class)\s*=\s*["']([^"']+)["']""", re.IGNORECASE),
+    re.compile(r"\bfunction\s+([A-Za-z_$][\w$]*)"),
+    re.compile(r"""\bon\w+\s*=\s*["']\s*([A-Za-z_$][\w$]*)"""),
+    re.compile(r"[.#]([A-Za-z_][\w-]*)\s*[{,:]"),
+)
+
+# Field weights act as multipliers on term frequency (a simple BM25F)
+FIELD_WEIGHTS = {"id": 3.0, "description": 2.0, "code": 1.0}
+
+
+def tokenise(text):
+    """
+    Mixed Chinese/code tokeniser. CJK runs become character unigrams plus
+    bigrams (动画1 -> 动, 画, 动画, 1). Latin words are lower-cased and also
+    split on camelCase, '-', '_' and digit boundaries (playAnim1 -> playanim1,
+    play, anim, 1).
+    """
+    if not text:
+        return []
+    tokens = []
+    for run in _CJK_RUN_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    for word in re.findall(r"[A-Za-z0-9_\-$]+", text):
+        parts = [p for chunk in _WORD_RE.findall(word) for p in _CAMEL_RE.findall(chunk)]
+        whole = word.strip("-_$").lower()
+        if whole:
+            tokens.append(whole)
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts)
+    return tokens
+
+
+def code_identifiers(content):
+    """Ids, classes, JS function names and CSS selectors of a module body, space-joined."""
+    found = []
+    for pattern in _CODE_IDENT_RES:
+        for match in pattern.findall(content or ""):
+            found.extend(match.split())
+    return " ".join(found)
+
+
+class ModuleSearchIndex:
+    """
+    Incremental in-memory BM25 inverted index over modules. Each document has
+    'id', 'description' and 'code' fields and belongs to a scope (e.g. the
+    current page or the module library). Statistics are kept per scope, so a
+    large library neither drowns page documents nor changes their scores.
+    Posting lists map term -> {scope: {doc: weighted tf}}; a query only touches
+    the postings of its own terms in the scopes it asks for, and terms that
+    occur in more than max_df_ratio of a scope's documents are skipped there as
+    uninformative. Long posting lists are scanned in impact order and cut at
+    max_postings_per_term, which keeps query latency flat as the library grows.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, max_df_ratio=0.5, max_postings_per_term=1000):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.max_postings_per_term = max_postings_per_term
+        self._impact_lists = {} # (scope, term) -> [(key, tf)] by descending tf, truncated; rebuilt lazily
+        self._postings = {}   # term -> {scope: {doc_key: weighted tf}}
+        self._doc_terms = {}  # doc_key -> {term: weighted tf}
+        self._doc_len = {}    # doc_key -> weighted length
+        self._doc_meta = {}   # doc_key -> caller metadata
+        self._doc_scope = {}  # doc_key -> scope
+        self._scope_docs = {} # scope -> number of documents
+        self._scope_len = {}  # scope -> total weighted length
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def __contains__(self, key):
+        return key in self._doc_terms
+
+    def add(self, key, module_id="", description="", code="", meta=None, scope=""):
+        """Adds or replaces one document. code should already be reduced to identifiers."""
+        terms = {}
+        for field, text in (("id", module_id), ("description", description), ("code", code)):
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenise(text):
+                terms[token] = terms.get(token, 0.0) + weight
+        with self._lock:
+            self._remove_locked(key)
+            self._doc_terms[key] = terms
+            self._doc_meta[key] = meta or {}
+            self._doc_scope[key] = scope
+            length = sum(terms.values())
+            self._doc_len[key] = length
+            self._scope_docs[scope] = self._scope_docs.get(scope, 0) + 1
+            self._scope_len[scope] = self._scope_len.get(scope, 0.0) + length
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {}).setdefault(scope, {})[key] = tf
+                self._impact_lists.pop((scope, term), None)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key):
+        terms = self._doc_terms.pop(key, None)
+        if terms is None:
+            return
+        self._doc_meta.pop(key, None)
+        scope = self._doc_scope.pop(key)
+        self._scope_docs[scope] -= 1
+        self._scope_len[scope] -= self._doc_len.pop(key, 0.0)
+        for term in terms:
+            scoped = self._postings.get(term, {})
+            posting = scoped.get(scope)
+            if posting is not None:
+                posting.pop(key, None)
+                self._impact_lists.pop((scope, term), None)
+                if not posting:
+                    del scoped[scope]
+                    if not scoped:
+                        del self._postings[term]
+
+    def _impact_list(self, scope, term, posting):
+        entries = self._impact_lists.get((scope, term))
+        if entries is None:
+            # Highest tf first, shorter documents breaking ties (both raise the BM25 contribution)
+            entries = heapq.nsmallest(self.max_postings_per_term, posting.items(),
+                                      key=lambda item: (-item[1], self._doc_len[item[0]]))
+            self._impact_lists[(scope, term)] = entries
+        return entries
+
+    def search(self, query, limit=20, scopes=None):
+        """Returns [(doc_key, score, meta)] best first, over the given scopes (default: all)."""
+        query_terms = set(tokenise(query))
+        with self._lock:
+            if not self._doc_terms or not query_terms:
+                return []
+            k1, b, doc_len = self.k1, self.b, self._doc_len
+            scores = {}
+            for scope in (self._scope_docs if scopes is None else scopes):
+                n_docs = self._scope_docs.get(scope, 0)
+                if not n_docs:
+                    continue
+                avg_len = self._scope_len[scope] / n_docs
+                for term in query_terms:
+                    posting = self._postings.get(term, {}).get(scope)
+                    if not posting:
+                        continue
+                    df = len(posting)
+                    if n_docs > 20 and df > self.max_df_ratio * n_docs:
+                        continue
+                    idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                    entries = posting.items() if df <= self.max_postings_per_term else self._impact_list(scope, term, posting)
+                    for key, tf in entries:
+                        norm = k1 * (1 - b + b * doc_len[key] / avg_len)
+                        scores[key] = scores.get(key, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [(key, score, self._doc_meta[key]) for key, score in best]
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    print(tokenise("动画1的播放按钮 playAnim1 anim1-box"))
+    index = ModuleSearchIndex()
+    index.add("page:animation_box_1", "animation_box_1", "动画1模块，包含播放按钮",
+              code_identifiers('<div class="animation-box" id="anim1-box"></div><button onclick="playAnim1()">'))
+    index.add("page:page_footer", "page_footer", "页脚版权信息", code_identifiers("<footer id='footer'></footer>"))
+    results = index.search("修改动画1的颜色")
+    print(results)
+    assert results[0][0] == "page:animation_box_1"
+    assert index.search("anim1")[0][0] == "page:animation_box_1"
+    index.remove("page:animation_box_1")
+    assert not index.search("playAnim1")
+
+    # Latency check at library scale
+    rng = random.Random(0)
+    words = ["动画", "页脚", "图表", "公式", "导航", "标题", "按钮", "表格", "说明", "引言", "结论", "方法"]
+    for i in range(100_000):
+        index.add(f"lib:{i}", f"module_{i}", "".join(rng.sample(words, 3)) + f"模块{i}",
+                  f"section-{i} fig{i % 500} playAnim{i % 50}", scope="library")
+    queries = ("图表说明", "fig42", "playAnim7 按钮", "module_99999")
+    for query in queries: # first pass builds the impact lists of long postings
+        index.search(query, limit=10)
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query, limit=10)
+    print(f"avg query latency over 100k modules: {(time.perf_counter() - start) / len(queries) * 1000:.2f} ms")
+    assert index.search("module_99999")[0][0] == "lib:99999"
+
+    # Page documents keep their own statistics: common library terms do not hide them in a page-scope query
+    index.add("page:animation_container_1", "animation_container_1", "动画容器 1", "anim-container-1 playAnim1", scope="page")
+    index.add("page:page_footer", "page_footer", "页脚", "footer", scope="page")
+    assert [key for key, _, _ in index.search("动画", scopes=["page"])] == ["page:animation_container_1"]
+    assert index.search("animation container", scopes=["page"])[0][0] == "page:animation_container_1"
+    print("\nSearch Index Tests Completed.")
@@ -0,0 +1,132 @@
+# session_store.py
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_SUFFIX = ".json.gz"
+
+
+def new_session_id(raw_html):
+    """Session IDs sort chronologically and carry a short content hash of the input page."""
+    content_hash = hashlib.sha256(raw_html.encode("utf-8")).hexdigest()[:10]
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{content_hash}"
+
+
+class SessionStore:
+    """
+    Persists analysis state (definitions, skeleton, module contents, LLM
+    modification results and user edits) as gzip-compressed JSON snapshots.
+    Every write goes to a temporary file that is atomically renamed over the
+    previous snapshot, so a crash mid-write never leaves a corrupt session.
+    """
+
+    def __init__(self, session_dir="sessions", compress_level=6):
+        self.session_dir = session_dir
+        self.compress_level = compress_level
+
+    def _path(self, session_id):
+        return os.path.join(self.session_dir, f"{session_id}{SNAPSHOT_SUFFIX}")
+
+    def save(self, session_id, stage, state):
+        """Atomically writes the snapshot for session_id. Returns the file path or None on failure."""
+        snapshot = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "session_id": session_id,
+            "stage": stage,
+            "saved_at": time.time(),
+            "state": state,
+        }
+        path = self._path(session_id)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.session_dir, exist_ok=True)
+            data = json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(data, compresslevel=self.compress_level))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            logging.debug(f"Session snapshot '{session_id}' saved at stage '{stage}' ({len(data)} bytes uncompressed).")
+            return path
+        except (OSError, TypeError, ValueError) as e:
+            logging.error(f"Failed to save session snapshot '{session_id}': {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+
+    def load(self, session_id):
+        """Loads a snapshot. Returns the snapshot dict, or None if missing/corrupt."""
+        path = self._path(session_id)
+        try:
+            with open(path, "rb") as f:
+                snapshot = json.loads(gzip.decompress(f.read()).decode("utf-8"))
+        except FileNotFoundError:
+            logging.warning(f"Session snapshot '{session_id}' not found.")
+            return None
+        except (OSError, EOFError, json.JSONDecodeError, UnicodeDecodeError) as e:
+            logging.error(f"Session snapshot '{session_id}' is unreadable: {e}")
+            return None
+        if snapshot.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            logging.warning(f"Session snapshot '{session_id}' has unsupported format version {snapshot.get('format_version')}.")
+            return None
+        return snapshot
+
+    def list_sessions(self):
+        """Returns [{session_id, saved_at, size_bytes}] newest first."""
+        if not os.path.isdir(self.session_dir):
+            return []
+        sessions = []
+        for name in os.listdir(self.session_dir):
+            if not name.endswith(SNAPSHOT_SUFFIX):
+                continue
+            path = os.path.join(self.session_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            sessions.append({
+                "session_id": name[:-len(SNAPSHOT_SUFFIX)],
+                "saved_at": stat.st_mtime,
+                "size_bytes": stat.st_size,
+            })
+        sessions.sort(key=lambda s: s["saved_at"], reverse=True)
+        return sessions
+
+    def latest_session_id(self):
+        sessions = self.list_sessions()
+        return sessions[0]["session_id"] if sessions else None
+
+    def delete(self, session_id):
+        try:
+            os.remove(self._path(session_id))
+            return True
+        except OSError:
+            return False
+
+
+if __name__ == '__main__':
+    import tempfile
+    logging.basicConfig(level=logging.DEBUG)
+
+    store = SessionStore(tempfile.mkdtemp())
+    sid = new_session_id("<html><body>test</body></html>")
+    state = {
+        "raw_original_html_content": "<html><body>test</body></html>",
+        "html_skeleton": "<html><body><!-- MODULE_PLACEHOLDER: body --></body></html>",
+        "llm_defined_modules": [{"id": "body", "description": "正文", "original_content": "test"}],
+        "llm_modification_results": {},
+        "user_edited_modules": {"body": {"html": "edited"}},
+    }
+    assert store.save(sid, "definitions", state)
+    loaded = store.load(sid)
+    assert loaded["state"] == state and loaded["stage"] == "definitions"
+    assert store.latest_session_id() == sid
+    assert store.load("missing") is None
+    print(store.list_sessions())
+    print("\nSession Store Tests Completed.")
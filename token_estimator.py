@@ -0,0 +1,119 @@
+# token_estimator.py
+import math
+import re
+
+# Pieces a BPE tokenizer rarely merges across: CJK characters, letter runs, digit runs, whitespace, punctuation
+_PIECE_RE = re.compile(r"([　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯])|([A-Za-z]+)|(\d+)|(\s+)|([^\sA-Za-z\d　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯]+)")
+SAMPLE_CHARS = 65_536 # Texts longer than SAMPLE_SLICES * SAMPLE_CHARS are estimated from evenly spaced slices
+SAMPLE_SLICES = 16
+
+# Approximate list prices (USD per million tokens), limits and speeds; api_config "model_profiles" overrides or extends them
+MODEL_PROFILES = {
+    "google/gemini-2.5-flash-preview": {"context_window": 1_048_576, "max_output_tokens": 65_536, "input_price": 0.15,
+                                        "output_price": 0.60, "first_token_ms": 600, "prompt_tokens_per_s": 20_000, "output_tokens_per_s": 150},
+    "google/gemini-2.5-pro-preview": {"context_window": 1_048_576, "max_output_tokens": 65_536, "input_price": 1.25,
+                                      "output_price": 10.0, "first_token_ms": 1500, "prompt_tokens_per_s": 10_000, "output_tokens_per_s": 80},
+    "openai/gpt-4o-mini": {"context_window": 128_000, "max_output_tokens": 16_384, "input_price": 0.15,
+                           "output_price": 0.60, "first_token_ms": 500, "prompt_tokens_per_s": 10_000, "output_tokens_per_s": 80},
+    "openai/gpt-4o": {"context_window": 128_000, "max_output_tokens": 16_384, "input_price": 2.50,
+                      "output_price": 10.0, "first_token_ms": 600, "prompt_tokens_per_s": 8_000, "output_tokens_per_s": 80},
+    "anthropic/claude-3.5-sonnet": {"context_window": 200_000, "max_output_tokens": 8_192, "input_price": 3.0,
+                                    "output_price": 15.0, "first_token_ms": 1000, "prompt_tokens_per_s": 8_000, "output_tokens_per_s": 60},
+}
+DEFAULT_PROFILE = {"context_window": 128_000, "max_output_tokens": 8_192, "input_price": 1.0,
+                   "output_price": 4.0, "first_token_ms": 1000, "prompt_tokens_per_s": 8_000, "output_tokens_per_s": 60}
+
+
+def _count_tokens(text):
+    tokens = 0
+    for cjk, word, digits, space, other in _PIECE_RE.findall(text):
+        if cjk:
+            tokens += 1
+        elif word:
+            tokens += 1 if len(word) <= 10 else math.ceil(len(word) / 4) # Long runs are identifiers or base64
+        elif digits:
+            tokens += math.ceil(len(digits) / 3)
+        elif space:
+            tokens += 1 if "\n" in space or len(space) > 1 else 0 # A single space merges into the next word
+        else:
+            tokens += math.ceil(len(other) / 2)
+    return tokens
+
+
+def estimate_tokens(text):
+    """
+    Local token estimate for a BPE tokenizer (no vocabulary or network needed):
+    one token per CJK character, one per short word, digits in threes,
+    punctuation in pairs. Good enough for budgeting, not for billing. Long
+    texts are estimated from evenly spaced samples.
+    """
+    if not text:
+        return 0
+    if len(text) <= SAMPLE_CHARS * SAMPLE_SLICES:
+        return _count_tokens(text)
+    step = len(text) // SAMPLE_SLICES
+    sampled = sum(_count_tokens(text[i * step:i * step + SAMPLE_CHARS]) for i in range(SAMPLE_SLICES))
+    return round(sampled * len(text) / (SAMPLE_CHARS * SAMPLE_SLICES))
+
+
+def model_profile(model, overrides=None):
+    """Limits, prices and speeds of a model: the bundled table, then api_config "model_profiles" on top."""
+    profile = dict(DEFAULT_PROFILE)
+    profile.update(MODEL_PROFILES.get(model, {}))
+    profile.update((overrides or {}).get(model, {}))
+    return profile
+
+
+def estimate_request(prompt_tokens, expected_output_tokens, profile):
+    """Estimated cost (USD) and latency (ms) of one call."""
+    return {
+        "prompt_tokens": prompt_tokens,
+        "expected_output_tokens": expected_output_tokens,
+        "cost_usd": round((prompt_tokens * profile["input_price"] + expected_output_tokens * profile["output_price"]) / 1e6, 6),
+        "latency_ms": round(profile["first_token_ms"] + 1000 * prompt_tokens / profile["prompt_tokens_per_s"]
+                            + 1000 * expected_output_tokens / profile["output_tokens_per_s"]),
+    }
+
+
+def fit_max_tokens(prompt_tokens, expected_output_tokens, profile, floor=0, headroom=1.3):
+    """
+    max_tokens for a call: the expected output with headroom (never below floor),
+    capped by the model's output limit and what is left of its context window.
+    Returns 0 when the prompt alone does not fit.
+    """
+    room = min(profile["max_output_tokens"], profile["context_window"] - prompt_tokens)
+    if room <= 0:
+        return 0
+    return min(room, max(floor, math.ceil(expected_output_tokens * headroom)))
+
+
+if __name__ == '__main__':
+    import time
+    from page_generator import generate_paper_page
+
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("注意力机制") == 5
+    assert estimate_tokens("the attention weights") == 3
+    assert estimate_tokens("2025") == 2
+    html = generate_paper_page(200_000, 20, seed=2)[0]
+    ratio = len(html) / estimate_tokens(html)
+    print(f"{len(html):,} chars -> {estimate_tokens(html):,} tokens ({ratio:.2f} chars/token)")
+    assert 1.5 < ratio < 4
+
+    big = html * 60
+    start = time.perf_counter()
+    sampled = estimate_tokens(big)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{len(big):,} chars estimated in {elapsed:.0f} ms")
+    assert abs(sampled - 60 * estimate_tokens(html)) / sampled < 0.05
+
+    profile = model_profile("openai/gpt-4o-mini", {"openai/gpt-4o-mini": {"input_price": 0.3}})
+    assert profile["input_price"] == 0.3 and profile["context_window"] == 128_000
+    assert model_profile("unknown/model")["max_output_tokens"] == DEFAULT_PROFILE["max_output_tokens"]
+    assert fit_max_tokens(1000, 2000, profile, floor=8192) == 8192
+    assert fit_max_tokens(1000, 20_000, profile) == 16_384 # Capped by the output limit
+    assert fit_max_tokens(120_000, 20_000, profile) == 8_000 # Capped by the context window
+    assert fit_max_tokens(130_000, 100, profile) == 0
+    estimate = estimate_request(10_000, 1_000, model_profile("openai/gpt-4o-mini"))
+    assert estimate["cost_usd"] == round((10_000 * 0.15 + 1_000 * 0.6) / 1e6, 6) and estimate["latency_ms"] == 500 + 1000 + 12500
+    print("\nToken Estimator Tests Completed.")
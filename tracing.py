@@ -0,0 +1,357 @@
+# tracing.py
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+import functools
+import urllib.request
+from contextlib import contextmanager
+
+
+class Span:
+    """A single timed stage of the pipeline (e.g. LLM wait, marker insertion)."""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self._start_perf = time.perf_counter()
+        self.duration_ms = None
+        self.status = "ok"
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._start_perf) * 1000.0
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self):
+        """Converts the span to the OTLP/JSON span shape understood by OpenTelemetry collectors."""
+        end_ns = self.start_ns + int((self.duration_ms or 0.0) * 1_000_000)
+        otlp_attributes = []
+        for key, value in self.attributes.items():
+            if isinstance(value, bool):
+                otlp_value = {"boolValue": value}
+            elif isinstance(value, int):
+                otlp_value = {"intValue": str(value)}
+            elif isinstance(value, float):
+                otlp_value = {"doubleValue": value}
+            else:
+                otlp_value = {"stringValue": str(value)}
+            otlp_attributes.append({"key": key, "value": otlp_value})
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": otlp_attributes,
+            "status": {"code": 1 if self.status == "ok" else 2},
+        }
+
+
+class Tracer:
+    """
+    Lightweight span recorder. Spans nest per thread; finished spans are appended
+    to a JSONL trace file and optionally POSTed to an OTLP/HTTP-compatible collector.
+    Collector exports are queued and sent in batches from a daemon thread, so a slow
+    or unreachable collector never blocks the pipeline; spans are dropped when the
+    queue is full.
+    """
+
+    def __init__(self, enabled=False, trace_file=None, collector_url=None, service_name="code-assembler",
+                 export_queue_size=2048, export_batch_size=128, export_interval=1.0):
+        self.enabled = enabled
+        self.trace_file = trace_file
+        self.collector_url = collector_url
+        self.service_name = service_name
+        self.observers = [] # Objects with span_started(span, depth) / span_finished(span, depth), e.g. MemoryProfiler
+        self.export_batch_size = export_batch_size
+        self.export_interval = export_interval
+        self.dropped_spans = 0
+        self._local = threading.local()
+        self._file_lock = threading.Lock()
+        self._export_queue = queue.Queue(maxsize=export_queue_size)
+        self._exporter_lock = threading.Lock()
+        self._exporter_thread = None
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current_span(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        if not self.enabled and not self.observers:
+            yield _NOOP_SPAN
+            return
+
+        parent = self.current_span()
+        trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        span = Span(name, trace_id, parent.span_id if parent else None, attributes)
+        stack = self._stack()
+        depth = len(stack)
+        for observer in self.observers:
+            observer.span_started(span, depth)
+        stack.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.status = "error"
+            span.set_attribute("error", str(e))
+            raise
+        finally:
+            span.finish()
+            stack.pop()
+            for observer in self.observers:
+                observer.span_finished(span, depth)
+            if self.enabled:
+                self._export(span)
+
+    def _export(self, span):
+        if self.trace_file:
+            line = json.dumps(span.to_dict(), ensure_ascii=False)
+            try:
+                with self._file_lock:
+                    with open(self.trace_file, "a", encoding="utf-8") as f:
+                        f.write(line + "\n")
+            except OSError as e:
+                logging.warning(f"Failed to write span '{span.name}' to trace file '{self.trace_file}': {e}")
+        if self.collector_url:
+            self._enqueue_for_collector(span)
+
+    def _enqueue_for_collector(self, span):
+        self._ensure_exporter()
+        try:
+            self._export_queue.put_nowait(span)
+        except queue.Full:
+            self.dropped_spans += 1
+            if self.dropped_spans == 1 or self.dropped_spans % 1000 == 0:
+                logging.warning(f"Trace export queue full; {self.dropped_spans} span(s) dropped so far.")
+
+    def _ensure_exporter(self):
+        if self._exporter_thread is not None:
+            return
+        with self._exporter_lock:
+            if self._exporter_thread is None:
+                self._exporter_thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                self._exporter_thread.start()
+                atexit.register(self.flush)
+
+    def _export_loop(self):
+        while True:
+            try:
+                batch = [self._export_queue.get(timeout=self.export_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.export_batch_size:
+                try:
+                    batch.append(self._export_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._post_to_collector(batch)
+            finally:
+                for _ in batch:
+                    self._export_queue.task_done()
+
+    def flush(self, timeout=5.0):
+        """Waits up to timeout seconds for queued spans to reach the collector; returns True when drained."""
+        deadline = time.monotonic() + timeout
+        while self._export_queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _post_to_collector(self, spans):
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [s.to_otlp() for s in spans]}],
+            }]
+        }
+        request = urllib.request.Request(
+            self.collector_url,
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=2) as response:
+                response.read()
+        except Exception as e:
+            logging.debug(f"Trace collector at '{self.collector_url}' unreachable: {e}")
+
+
+class _NoopSpan:
+    """Returned when tracing is disabled so call sites need no conditionals."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_tracer = Tracer(enabled=False)
+
+
+def configure_tracer(api_config):
+    """(Re)configures the process-wide tracer from the API config and returns it."""
+    global _tracer
+    _tracer = Tracer(
+        enabled=bool(api_config.get("trace_enabled", False)),
+        trace_file=api_config.get("trace_file") or None,
+        collector_url=api_config.get("trace_collector_url") or None,
+    )
+    if _tracer.enabled:
+        logging.info(f"Tracing enabled. File: {_tracer.trace_file}, collector: {_tracer.collector_url}")
+    return _tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def traced(span_name):
+    """
+    Decorator for html_utils-style functions: records the size of the first
+    (HTML) argument and of a string return value.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(span_name) as span:
+                if args and isinstance(args[0], str):
+                    span.set_attribute("input_bytes", len(args[0].encode("utf-8")))
+                result = func(*args, **kwargs)
+                if isinstance(result, str):
+                    span.set_attribute("output_bytes", len(result.encode("utf-8")))
+                return result
+        return wrapper
+    return decorator
+
+
+def run_collector_standin(host="127.0.0.1", port=4318, output_file="collected_traces.jsonl"):
+    """
+    Minimal local stand-in for an OpenTelemetry collector: accepts OTLP/JSON on
+    POST /v1/traces and appends every received span to a JSONL file.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class CollectorHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_response(404)
+                self.end_headers()
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                spans = [
+                    span
+                    for resource_span in payload.get("resourceSpans", [])
+                    for scope_span in resource_span.get("scopeSpans", [])
+                    for span in scope_span.get("spans", [])
+                ]
+                with open(output_file, "a", encoding="utf-8") as f:
+                    for span in spans:
+                        f.write(json.dumps(span, ensure_ascii=False) + "\n")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"{}")
+            except (json.JSONDecodeError, AttributeError) as e:
+                self.send_response(400)
+                self.end_headers()
+                self.wfile.write(str(e).encode("utf-8"))
+
+        def log_message(self, format, *args):
+            logging.debug("collector: " + format % args)
+
+    server = ThreadingHTTPServer((host, port), CollectorHandler)
+    logging.info(f"Trace collector stand-in listening on http://{host}:{port}/v1/traces, writing to {output_file}")
+    return server
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Tracing utilities.")
+    parser.add_argument("--collector", action="store_true", help="Run the local OTLP collector stand-in.")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", default="collected_traces.jsonl")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.collector:
+        run_collector_standin(port=args.port, output_file=args.output).serve_forever()
+    else:
+        # Example usage: nested spans written to a temporary trace file
+        trace_path = os.path.join(tempfile.mkdtemp(), "trace.jsonl")
+        tracer = configure_tracer({"trace_enabled": True, "trace_file": trace_path})
+        with tracer.span("analyze_html", html_bytes=123) as root:
+            with tracer.span("llm.get_module_definitions") as child:
+                child.set_attributes(prompt_tokens=10, completion_tokens=5, cache="miss")
+            root.set_attribute("modules", 2)
+        with open(trace_path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        print(json.dumps(records, indent=2))
+        assert [r["name"] for r in records] == ["llm.get_module_definitions", "analyze_html"]
+        assert records[0]["parent_id"] == records[1]["span_id"]
+
+        # Collector export: batched from the background thread, never on the calling thread
+        collected_path = os.path.join(tempfile.mkdtemp(), "collected.jsonl")
+        server = run_collector_standin(port=0, output_file=collected_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        tracer = Tracer(enabled=True, collector_url=f"http://127.0.0.1:{server.server_address[1]}/v1/traces")
+        posted_from = []
+        post = tracer._post_to_collector
+        tracer._post_to_collector = lambda spans: (posted_from.append((threading.current_thread().name, len(spans))), post(spans))
+        for i in range(300):
+            with tracer.span("stage", index=i):
+                pass
+        assert tracer.flush(timeout=10)
+        with open(collected_path, encoding="utf-8") as f:
+            assert sum(1 for _ in f) == 300
+        assert all(name == "trace-exporter" for name, _ in posted_from) and len(posted_from) < 300
+        server.shutdown()
+
+        # A full queue drops spans instead of blocking
+        unreachable = Tracer(enabled=True, collector_url="http://127.0.0.1:9/v1/traces", export_queue_size=4)
+        unreachable._exporter_thread = threading.current_thread() # keep the queue from draining
+        for i in range(10):
+            with unreachable.span("stage"):
+                pass
+        assert unreachable.dropped_spans == 6
+        print("\nTracing Tests Completed.")
@@ -0,0 +1,152 @@
+# version_store.py
+import difflib
+import hashlib
+import logging
+import time
+
+
+def blob_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class VersionStore:
+    """
+    Edit history for one analysed page. Module bodies are stored once as
+    content-addressed blobs; each revision is only a manifest of
+    module_id -> blob hash, so near-identical page versions share storage.
+
+    History is linear: undo/redo move a pointer (O(1)); committing after an
+    undo discards the redo branch, like a text editor.
+    """
+
+    def __init__(self):
+        self._blobs = {}      # hash -> content
+        self._revisions = []  # [{revision, manifest, message, created_at}]
+        self._head = -1       # index into _revisions of the current revision
+
+    def put_blob(self, content):
+        h = blob_hash(content)
+        if h not in self._blobs:
+            self._blobs[h] = content
+        return h
+
+    def get_blob(self, h):
+        return self._blobs.get(h)
+
+    def commit(self, manifest_changes, message="", replace=False):
+        """
+        Creates a new revision from the current one with manifest_changes
+        ({module_id: content}) applied. With replace=True, manifest_changes is
+        the complete module set and modules missing from it are dropped.
+        Returns the new revision number, or the current one if nothing changed.
+        """
+        manifest = {} if replace else dict(self.current_manifest())
+        for module_id, content in manifest_changes.items():
+            manifest[module_id] = self.put_blob(content)
+
+        if self._head >= 0 and manifest == self._revisions[self._head]["manifest"]:
+            return self._head
+
+        del self._revisions[self._head + 1:] # Drop the redo branch
+        self._revisions.append({
+            "revision": len(self._revisions),
+            "manifest": manifest,
+            "message": message,
+            "created_at": time.time(),
+        })
+        self._head = len(self._revisions) - 1
+        logging.debug(f"Version store: committed revision {self._head} ({message}); {len(self._blobs)} unique blobs.")
+        return self._head
+
+    @property
+    def head(self):
+        return self._head
+
+    def current_manifest(self):
+        return self._revisions[self._head]["manifest"] if self._head >= 0 else {}
+
+    def can_undo(self):
+        return self._head > 0
+
+    def can_redo(self):
+        return self._head < len(self._revisions) - 1
+
+    def undo(self):
+        if self.can_undo():
+            self._head -= 1
+        return self._head
+
+    def redo(self):
+        if self.can_redo():
+            self._head += 1
+        return self._head
+
+    def checkout(self, revision=None):
+        """Returns {module_id: content} for a revision (defaults to the current one)."""
+        revision = self._head if revision is None else revision
+        manifest = self._revisions[revision]["manifest"]
+        return {module_id: self._blobs[h] for module_id, h in manifest.items()}
+
+    def changed_modules(self, revision_a, revision_b):
+        """Module IDs whose blob differs between two revisions (manifest comparison only)."""
+        manifest_a = self._revisions[revision_a]["manifest"]
+        manifest_b = self._revisions[revision_b]["manifest"]
+        return sorted(
+            module_id for module_id in manifest_a.keys() | manifest_b.keys()
+            if manifest_a.get(module_id) != manifest_b.get(module_id)
+        )
+
+    def diff(self, revision_a, revision_b, context_lines=3):
+        """Returns [{module_id, diff}] with a unified diff for every module changed between two revisions."""
+        manifest_a = self._revisions[revision_a]["manifest"]
+        manifest_b = self._revisions[revision_b]["manifest"]
+        result = []
+        for module_id in self.changed_modules(revision_a, revision_b):
+            old = self._blobs.get(manifest_a.get(module_id), "")
+            new = self._blobs.get(manifest_b.get(module_id), "")
+            unified = difflib.unified_diff(
+                old.splitlines(keepends=True), new.splitlines(keepends=True),
+                fromfile=f"r{revision_a}/{module_id}", tofile=f"r{revision_b}/{module_id}", n=context_lines
+            )
+            result.append({"module_id": module_id, "diff": "".join(unified)})
+        return result
+
+    def list_revisions(self):
+        return [
+            {"revision": r["revision"], "message": r["message"], "created_at": r["created_at"],
+             "is_head": r["revision"] == self._head}
+            for r in self._revisions
+        ]
+
+    def stats(self):
+        return {
+            "revisions": len(self._revisions),
+            "unique_blobs": len(self._blobs),
+            "blob_bytes": sum(len(c.encode("utf-8")) for c in self._blobs.values()),
+        }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    store = VersionStore()
+    base = store.commit({"header": "<h1>Title</h1>", "anim1": "<div id='anim1-box'></div>"}, "原始分析结果")
+    r1 = store.commit({"anim1": "<div id='anim1-box' class='cube'></div>"}, "编辑 anim1")
+    r2 = store.commit({"header": "<h1>New Title</h1>"}, "编辑 header")
+    assert store.stats()["unique_blobs"] == 4
+    assert store.changed_modules(base, r2) == ["anim1", "header"]
+    print(store.diff(r1, r2)[0]["diff"])
+
+    assert store.undo() == r1 and store.checkout()["header"] == "<h1>Title</h1>"
+    assert store.redo() == r2
+    store.undo()
+    r3 = store.commit({"anim1": "<div id='anim1-box'></div>"}, "还原 anim1") # Reuses the base blob
+    assert not store.can_redo() and store.stats()["unique_blobs"] == 4
+    assert store.changed_modules(base, r3) == []
+
+    # A full manifest reverts edits it no longer contains instead of keeping them
+    r4 = store.commit({"header": "<h1>New Title</h1>", "anim1": "<div id='anim1-box'></div>", "anim2": "<div></div>"}, "编辑")
+    r5 = store.commit({"header": "<h1>Title</h1>", "anim1": "<div id='anim1-box'></div>"}, "还原", replace=True)
+    assert r5 == r4 + 1 and store.changed_modules(base, r5) == []
+    assert "anim2" not in store.current_manifest() and store.checkout()["header"] == "<h1>Title</h1>"
+    print(store.list_revisions())
+    print("\nVersion Store Tests Completed.")